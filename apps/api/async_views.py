@@ -0,0 +1,182 @@
+"""Async (ASGI) versions of the search and autocomplete endpoints.
+
+Same request and response shapes as the DRF views in ``apps.api.views``;
+enabled with API_ASYNC_VIEWS. Provider and AI calls are awaited, so one
+ASGI worker can hold many searches in flight. Database work (baselines,
+persistence, throttling) still runs through sync_to_async. Streamed
+searches run the blocking sync pipeline, so they get their own bounded
+thread pool rather than the thread-sensitive executor everything else
+shares.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from apps.api.renderers import STREAM_RENDERERS, FastJSONRenderer
+from apps.api.serializers import DealsSearchRequestSerializer, deals_payload
+from apps.api.views import (
+    SEARCH_CACHE_HEADER,
+    _encode_events,
+    _logged_params,
+    _pipeline_kwargs,
+    _resolve_dates,
+    _search_cache_key,
+    _search_events,
+    _search_params,
+    _streaming_response,
+)
+from apps.deals.writebehind import submit_deals, submit_search_request
+from apps.providers.amadeus_client import AmadeusApiError, AmadeusAuthError
+from apps.search.airports import alookup_airports
+from apps.search.async_service import asearch_deals
+from apps.search.cache import acached_search
+
+# Provider calls, fan-out waits and AI batches of streamed searches block for
+# seconds; on the shared thread-sensitive executor they would queue every
+# throttle check, cache read and other stream behind them
+_pipeline_executor = ThreadPoolExecutor(
+    max_workers=int(getattr(settings, 'API_ASYNC_PIPELINE_THREADS', 32)), thread_name_prefix='async-pipeline',
+)
+
+
+def _in_pipeline(func):
+    """``func`` as a coroutine function run on the pipeline pool."""
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # Pool threads outlive requests, so request_finished never closes their connections
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False, executor=_pipeline_executor)
+
+
+def _json_response(payload, status_code=status.HTTP_200_OK, headers=None):
+    # Same renderer as the sync deal views, so bodies match byte for byte
+    return HttpResponse(
+        FastJSONRenderer().render(payload), status=status_code, content_type='application/json', headers=headers,
+    )
+
+
+def _throttle_wait(request, view):
+    """Run the DRF default throttles; returns seconds to wait, or None when allowed."""
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    waits = []
+    for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not throttle.allow_request(drf_request, view):
+            waits.append(throttle.wait() or 0)
+    return max(waits) if waits else None
+
+
+async def _throttled(request, view):
+    wait = await sync_to_async(_throttle_wait)(request, view)
+    if wait is None:
+        return None
+    return _json_response(
+        {'detail': f'Request was throttled. Expected available in {int(wait)} seconds.'},
+        status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={'Retry-After': str(int(wait))},
+    )
+
+
+def _stream_renderer(request):
+    # The DRF view's content negotiation, reduced to the two streaming formats
+    requested = request.GET.get(api_settings.URL_FORMAT_OVERRIDE or 'format')
+    accept = request.headers.get('Accept', '')
+    for renderer_class in STREAM_RENDERERS:
+        if requested == renderer_class.format or renderer_class.media_type in accept:
+            return renderer_class()
+    return None
+
+
+async def _aiter_chunks(chunks):
+    # Pull a sync generator from the pipeline pool; the pipeline behind it
+    # (AI calls, cache and DB writes) is blocking code
+    done = object()
+    pull = _in_pipeline(next)
+    while True:
+        chunk = await pull(chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncDealsSearchView(View):
+    http_method_names = ['post', 'options']
+
+    async def post(self, request):
+        throttled = await _throttled(request, self)
+        if throttled is not None:
+            return throttled
+        try:
+            body = json.loads(request.body or b'{}')
+        except ValueError:
+            return _json_response({'detail': 'JSON parse error'}, status.HTTP_400_BAD_REQUEST)
+        serializer = DealsSearchRequestSerializer(data=body)
+        if not serializer.is_valid():
+            return _json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        dep, ret = _resolve_dates(data)
+        search_params = _search_params(data, dep, ret)
+        limit = data.get("limit", 50)
+        renderer = _stream_renderer(request)
+        if renderer is not None:
+            return await self._stream(request, renderer, data, search_params)
+
+        async def run_pipeline():
+            meta = {}
+            deals = await asearch_deals(**_pipeline_kwargs(data, search_params), meta=meta)
+            await sync_to_async(submit_deals)(deals, search_params=search_params, limit=limit)
+            return deals_payload(deals, meta)
+
+        try:
+            payload, cache_state = await acached_search(_search_cache_key(data, search_params), run_pipeline)
+            await sync_to_async(submit_search_request)(
+                params=_logged_params(data, search_params, cache_state),
+                user_agent=request.META.get('HTTP_USER_AGENT'),
+                ip_hash=request.META.get('REMOTE_ADDR'),
+            )
+        except (AmadeusAuthError, AmadeusApiError) as e:
+            return _json_response({"detail": str(e)}, status.HTTP_502_BAD_GATEWAY)
+
+        return _json_response(payload, headers={SEARCH_CACHE_HEADER: cache_state})
+
+    async def _stream(self, request, renderer, data, search_params):
+        # Streams run the sync pipeline on the pipeline pool, chunk by chunk
+        try:
+            events, cache_state = await _in_pipeline(_search_events)(data, search_params)
+            await sync_to_async(submit_search_request)(
+                params=_logged_params(data, search_params, cache_state),
+                user_agent=request.META.get('HTTP_USER_AGENT'),
+                ip_hash=request.META.get('REMOTE_ADDR'),
+            )
+        except (AmadeusAuthError, AmadeusApiError) as e:
+            return HttpResponse(
+                renderer.render_event('error', {"detail": str(e)}),
+                status=status.HTTP_502_BAD_GATEWAY, content_type=renderer.media_type,
+            )
+        return _streaming_response(renderer, _aiter_chunks(_encode_events(renderer, events)), cache_state)
+
+
+class AsyncAirportsAutocompleteView(View):
+    http_method_names = ['get', 'options']
+
+    async def get(self, request):
+        throttled = await _throttled(request, self)
+        if throttled is not None:
+            return throttled
+        q = request.GET.get('query') or ''
+        if not q or len(q) < 2:
+            return _json_response({'airports': []})
+        return _json_response({'airports': await alookup_airports(q, limit=10)})
@@ -0,0 +1,87 @@
+import json
+import re
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+# orjson spells floats outside [1e-4, 1e16) differently from json.dumps
+# ("1e16" / "1e+16", "0.00001" / "1e-05"); bodies that may hold one are
+# rendered again the stock way. Strings that happen to match only cost that.
+_EXPONENT = re.compile(rb'e-?\d')
+
+
+def _may_respell_floats(body):
+    if b'0.0000' in body:
+        return True
+    # Searching for the 'e' first is far quicker than a pattern led by \d
+    return any(body[m.start() - 1:m.start()].isdigit() for m in _EXPONENT.finditer(body))
+
+
+def _dumps(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON: one ``{"event": ..., "data": ...}`` object per line.
+
+    Streaming search responses are written event by event with
+    ``render_event``; anything rendered through the normal DRF path (e.g. a
+    400 from validation) becomes a single ``error`` event.
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render_event(self, event, data):
+        return (_dumps({'event': event, 'data': data}) + '\n').encode('utf-8')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return self.render_event('error', data)
+
+
+class EventStreamRenderer(NDJSONRenderer):
+    """Server-sent events (``text/event-stream``), same events as NDJSONRenderer."""
+
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render_event(self, event, data):
+        return f"event: {event}\ndata: {_dumps(data)}\n\n".encode('utf-8')
+
+
+STREAM_RENDERERS = (NDJSONRenderer, EventStreamRenderer)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer's exact bytes, encoded with orjson when it is installed.
+
+    Whatever orjson would write differently goes through JSONRenderer:
+    indented output (browsable API, ``; indent=``), non-string keys, ints
+    wider than 64 bits, values only DRF's encoder knows, and floats outside
+    [1e-4, 1e16). The one gap is NaN/Infinity, which orjson writes as
+    ``null`` where JSONRenderer raises.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.strict or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            body = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except TypeError:  # orjson.JSONEncodeError is a TypeError
+            return super().render(data, accepted_media_type, renderer_context)
+        if _may_respell_floats(body):
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes these two so the output is also valid JavaScript
+        return body.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -1,3 +1,6 @@
+from datetime import date, datetime, timedelta, timezone
+
+from django.conf import settings
 from rest_framework import serializers
 
 
@@ -13,6 +16,59 @@ class DealsSearchRequestSerializer(serializers.Serializer):
     limit = serializers.IntegerField(min_value=1, max_value=100, required=False, default=50)
 
 
+class CalendarSearchRequestSerializer(serializers.Serializer):
+    """A flexible-date search: ``dateRange`` spans departure dates, not departure and return.
+
+    Round trips take ``tripLengths`` (days); they default to the 5-day trip
+    a plain search assumes. ``end`` defaults to a week after ``start``.
+    """
+
+    DEFAULT_DAYS = 7
+    DEFAULT_TRIP_LENGTH = 5
+
+    oneWay = serializers.BooleanField()
+    origin = serializers.CharField(min_length=3, max_length=3)
+    destination = serializers.CharField(min_length=3, max_length=3)
+    dateRange = serializers.DictField(child=serializers.CharField(allow_blank=True))
+    tripLengths = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=30), required=False, allow_empty=False, max_length=7,
+    )
+    stops = serializers.ChoiceField(choices=["direct", "max1", "any"], default="any")
+    travelers = serializers.IntegerField(min_value=1, max_value=9)
+    cabin = serializers.ChoiceField(choices=["ECONOMY", "PREMIUM_ECONOMY", "BUSINESS", "FIRST"], required=False, allow_null=True)
+
+    def _date(self, value, name):
+        try:
+            return date.fromisoformat(value.strip())
+        except ValueError:
+            raise serializers.ValidationError({'dateRange': f"{name} must be a YYYY-MM-DD date."})
+
+    def validate(self, attrs):
+        date_range = attrs['dateRange']
+        if not (date_range.get('start') or '').strip():
+            raise serializers.ValidationError({'dateRange': "start is required."})
+        start = self._date(date_range['start'], 'start')
+        end = (
+            self._date(date_range['end'], 'end') if (date_range.get('end') or '').strip()
+            else start + timedelta(days=self.DEFAULT_DAYS - 1)
+        )
+        if start < datetime.now(timezone.utc).date():
+            raise serializers.ValidationError({'dateRange': "start is in the past."})
+        if end < start:
+            raise serializers.ValidationError({'dateRange': "end is before start."})
+        if attrs['oneWay']:
+            trip_lengths = None
+        else:
+            trip_lengths = sorted(set(attrs.get('tripLengths') or [self.DEFAULT_TRIP_LENGTH]))
+        cells = ((end - start).days + 1) * len(trip_lengths or [None])
+        max_cells = int(getattr(settings, 'CALENDAR_MAX_CELLS', 62))
+        if cells > max_cells:
+            raise serializers.ValidationError(
+                {'dateRange': f"{cells} date/trip-length combinations requested; at most {max_cells} are allowed."}
+            )
+        return {**attrs, 'start': start, 'end': end, 'tripLengths': trip_lengths}
+
+
 class DealSerializer(serializers.Serializer):
     provider = serializers.CharField()
     one_way_bool = serializers.BooleanField()
@@ -32,7 +88,98 @@ class DealSerializer(serializers.Serializer):
     # Insights
     price_baseline = serializers.FloatField(allow_null=True, required=False)
     price_pct_drop = serializers.FloatField(allow_null=True, required=False)
+    price_percentile = serializers.FloatField(allow_null=True, required=False)
     score_int_0_100 = serializers.IntegerField(allow_null=True)
     score_factors_json = serializers.ListField(child=serializers.CharField(), allow_null=True)
     badges_json = serializers.ListField(child=serializers.CharField(), allow_null=True)
 
+
+
+# ---------- fast path ----------
+# A serializer flattened into a plan of (name, converter, allow_null, required).
+# Rows go through one loop over the plan instead of DRF's per-field get_attribute /
+# to_representation calls, with the same output for the field types used here.
+_MISSING = object()
+
+
+def _boolean(field):
+    def convert(value):
+        return value if value is True or value is False else field.to_representation(value)
+    return convert
+
+
+def _char_list(value):
+    return [None if item is None else str(item) for item in value]
+
+
+def _converter(field):
+    if isinstance(field, serializers.BooleanField):
+        return _boolean(field)
+    if isinstance(field, serializers.CharField):
+        return str
+    if isinstance(field, serializers.IntegerField):
+        return int
+    if isinstance(field, serializers.FloatField):
+        return float
+    if isinstance(field, serializers.ListField) and isinstance(field.child, serializers.CharField):
+        return _char_list
+    # Anything else keeps DRF's own conversion
+    return field.to_representation
+
+
+def compile_projection(serializer_class, converters=None):
+    """Compile ``serializer_class`` into ``project(row) -> dict`` for output only.
+
+    ``row`` is anything with ``get(name, default)``, such as a ``.values()``
+    dict or a DealRecord. ``converters`` replaces the conversion for named
+    fields, e.g. ``datetime.isoformat`` for rows read from the database.
+    Missing keys are handled as DRF handles them: None for nullable fields,
+    left out for optional ones, KeyError otherwise.
+    """
+    converters = converters or {}
+    plan = []
+    for name, field in serializer_class().fields.items():
+        if field.write_only:
+            continue
+        if field.source != name or field.default is not serializers.empty:
+            raise ValueError(f"{serializer_class.__name__}.{name}: only plain fields can be compiled")
+        plan.append((name, converters.get(name) or _converter(field), field.allow_null, field.required))
+    plan = tuple(plan)
+
+    def project(row):
+        out = {}
+        for name, convert, allow_null, required in plan:
+            value = row.get(name, _MISSING)
+            if value is _MISSING:
+                if allow_null:
+                    value = None
+                elif not required:
+                    continue
+                else:
+                    raise KeyError(name)
+            out[name] = None if value is None else convert(value)
+        return out
+
+    return project
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+# Pipeline deals (DealRecord or dict) -> API shape
+project_deal = compile_projection(DealSerializer)
+
+# Stored FlightDeal ``.values()`` rows -> API shape
+project_deal_row = compile_projection(
+    DealSerializer, converters={'departure_datetime': _isoformat, 'return_datetime': _isoformat},
+)
+
+
+def deals_payload(deals, meta):
+    """The search response body: projected deals, plus ``meta`` when there is any."""
+    # DealRecords become plain dicts only here, at the serializer boundary
+    payload = {"deals": [project_deal(d) for d in deals]}
+    if meta:
+        payload["meta"] = meta
+    return payload
@@ -0,0 +1,163 @@
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from apps.api.renderers import FastJSONRenderer
+from apps.api.serializers import DealSerializer, deals_payload, project_deal, project_deal_row
+from apps.api.views import TOP_DEAL_COLUMNS
+from apps.deals.models import FlightDeal
+from apps.providers.normalizer import normalize_flight_offer_records
+from apps.providers.records import DealRecord
+from apps.providers.sample_payloads import synthetic_flight_offers
+
+
+def _scored_deals(n, seed=0, round_trip=True):
+    deals = normalize_flight_offer_records(synthetic_flight_offers(n, seed=seed, round_trip=round_trip), 1, 'ECONOMY')
+    for i, d in enumerate(deals):
+        d.price_baseline = round(d.price_total * 1.2, 2)
+        d.price_pct_drop = round((d.price_baseline - d.price_total) / d.price_baseline, 4)
+        d.price_percentile = None if i % 3 else 0.25
+        d.score_int_0_100 = 40 + i % 60
+        d.score_factors_json = ['Direct flight', 'Good price vs baseline'][:i % 3]
+        d.badges_json = ['🔥 Amazing deal'] if i % 4 == 0 else []
+    return deals
+
+
+class FastJSONRendererParityTests(SimpleTestCase):
+    """FastJSONRenderer must write JSONRenderer's exact bytes, whichever encoder it ends up using."""
+
+    def assertSameBody(self, data, accepted_media_type=None):
+        expected = JSONRenderer().render(data, accepted_media_type)
+        self.assertEqual(FastJSONRenderer().render(data, accepted_media_type), expected)
+
+    def test_search_payload(self):
+        for round_trip in (True, False):
+            with self.subTest(round_trip=round_trip):
+                meta = {'ranking': {'mode': 'two_stage', 'candidates': 80, 'scored': 50, 'skipped': 30}}
+                self.assertSameBody(deals_payload(_scored_deals(80, round_trip=round_trip), meta))
+
+    def test_floats(self):
+        for value in (0.1, 1.5, 123456.789, 1e-4, 9.9e-5, 1e-5, 1e15, 1e16, 1.5e17, -2.5e-7, 0.0, -0.0):
+            with self.subTest(value=value):
+                self.assertSameBody({'price_total': value, 'nested': [value, {'v': value}]})
+
+    def test_ints(self):
+        for value in (0, -1, 2 ** 53, 2 ** 63 - 1, 2 ** 64, -(2 ** 70)):
+            with self.subTest(value=value):
+                self.assertSameBody({'n': value})
+
+    def test_strings(self):
+        for value in ('plain', 'Zürich ✈ 東京', '🔥 Amazing deal', 'line\u2028sep\u2029para', 'quote " and \\', 'ctl\x01\n'):
+            with self.subTest(value=value):
+                self.assertSameBody({'s': value, 'e': 'e-5 1e16'})
+
+    def test_values_only_drf_encodes(self):
+        self.assertSameBody({
+            'when': datetime(2030, 3, 1, 7, 30, tzinfo=timezone.utc),
+            'day': date(2030, 3, 1),
+            'price': Decimal('199.90'),
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'gap': timedelta(minutes=95),
+            'codes': ('BA', 'AA'),
+        })
+
+    def test_keys_and_empty_values(self):
+        for data in ({1: 'a', 2: 'b'}, {True: 1}, {}, [], '', 0, False, {'none': None, 'list': [None]}):
+            with self.subTest(data=data):
+                self.assertSameBody(data)
+
+    def test_none(self):
+        self.assertEqual(FastJSONRenderer().render(None), JSONRenderer().render(None))
+
+    def test_indent(self):
+        data = deals_payload(_scored_deals(3), None)
+        self.assertSameBody(data, 'application/json; indent=2')
+        self.assertSameBody(data, 'application/json; indent=0')
+
+
+class ProjectDealParityTests(SimpleTestCase):
+    """The compiled projection must produce DealSerializer's output for every deal shape it is fed."""
+
+    def test_scored_records(self):
+        for d in _scored_deals(60) + _scored_deals(20, seed=1, round_trip=False):
+            self.assertEqual(project_deal(d), DealSerializer(d).data)
+            self.assertEqual(project_deal(d.to_dict()), DealSerializer(d.to_dict()).data)
+
+    def test_unscored_records(self):
+        # Straight from the normalizer: no baseline, percentile or score fields set yet
+        for d in normalize_flight_offer_records(synthetic_flight_offers(20, seed=2), 3, None):
+            self.assertNotIn('price_baseline', d)
+            self.assertEqual(project_deal(d), DealSerializer(d).data)
+            self.assertEqual(project_deal(d.to_dict()), DealSerializer(d.to_dict()).data)
+
+    def test_loose_values(self):
+        # Values the pipeline doesn't produce today but DRF would still coerce
+        row = {
+            **_scored_deals(1)[0].to_dict(),
+            'one_way_bool': 1, 'num_stops': '2', 'price_total': 250, 'airline_codes': ('BA', 7),
+            'deep_link': None, 'score_int_0_100': 88.0, 'badges_json': None,
+        }
+        self.assertEqual(project_deal(row), DealSerializer(row).data)
+        self.assertEqual(project_deal(DealRecord(**row)), DealSerializer(DealRecord(**row)).data)
+
+    def test_missing_required_field(self):
+        row = _scored_deals(1)[0].to_dict()
+        del row['provider']
+        with self.assertRaises(KeyError):
+            project_deal(row)
+
+
+class ProjectDealRowParityTests(TestCase):
+    """Stored FlightDeal rows: project_deal_row vs the hand-built dict TopDealsView used to serialize."""
+
+    def test_rows(self):
+        created = datetime(2030, 1, 1, tzinfo=timezone.utc)
+        FlightDeal.objects.bulk_create([
+            FlightDeal(
+                provider='amadeus', search_hash='parity', origin_iata=d.origin_iata,
+                destination_iata=d.destination_iata, one_way_bool=d.one_way_bool,
+                departure_datetime=created + timedelta(days=30, minutes=i),
+                return_datetime=None if d.one_way_bool else created + timedelta(days=37, minutes=i),
+                num_stops=d.num_stops, duration_minutes=d.duration_minutes, layover_minutes_max=d.layover_minutes_max,
+                airline_codes=d.airline_codes, cabin_class=d.cabin_class, price_total=d.price_total,
+                currency=d.currency, num_travelers=d.num_travelers, deep_link=d.deep_link,
+                score_int_0_100=None if i % 5 == 0 else d.score_int_0_100,
+                score_factors_json=d.score_factors_json, badges_json=None if i % 7 == 0 else d.badges_json,
+            )
+            for i, d in enumerate(_scored_deals(20) + _scored_deals(10, seed=3, round_trip=False))
+        ])
+        rows = list(FlightDeal.objects.order_by('id').values(*TOP_DEAL_COLUMNS))
+        self.assertEqual(len(rows), 30)
+        for row in rows:
+            legacy = {
+                **row,
+                'departure_datetime': row['departure_datetime'].isoformat() if row['departure_datetime'] else None,
+                'return_datetime': row['return_datetime'].isoformat() if row['return_datetime'] else None,
+            }
+            self.assertEqual(project_deal_row(row), DealSerializer(legacy).data)
+
+
+class MetricsAccessTests(TestCase):
+    """/api/metrics exposes internal state: staff only unless METRICS_PUBLIC is on."""
+
+    def test_anonymous_is_refused(self):
+        self.assertIn(self.client.get('/api/metrics').status_code, (401, 403))
+
+    def test_non_staff_is_refused(self):
+        self.client.force_login(User.objects.create_user('traveler', password='x'))
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+
+    def test_staff_is_served(self):
+        self.client.force_login(User.objects.create_user('ops', password='x', is_staff=True))
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('write_behind', response.json())
+
+    @override_settings(METRICS_PUBLIC=True)
+    def test_public_flag(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 200)
@@ -1,11 +1,28 @@
+from django.conf import settings
 from django.urls import path
-from apps.api.views import DealsSearchView, TopDealsView, HealthView, AirportsAutocompleteView
+from apps.api.views import (
+    AirportsAutocompleteView,
+    CalendarSearchView,
+    DealsSearchView,
+    HealthView,
+    MetricsView,
+    TopDealsView,
+)
+
+if getattr(settings, 'API_ASYNC_VIEWS', False):
+    from apps.api.async_views import AsyncAirportsAutocompleteView, AsyncDealsSearchView
+
+    deals_search_view = AsyncDealsSearchView.as_view()
+    airports_autocomplete_view = AsyncAirportsAutocompleteView.as_view()
+else:
+    deals_search_view = DealsSearchView.as_view()
+    airports_autocomplete_view = AirportsAutocompleteView.as_view()
 
 urlpatterns = [
-    path('deals/search', DealsSearchView.as_view(), name='deals-search'),
+    path('deals/search', deals_search_view, name='deals-search'),
     path('deals/top', TopDealsView.as_view(), name='deals-top'),
+    path('deals/calendar', CalendarSearchView.as_view(), name='deals-calendar'),
     path('health', HealthView.as_view(), name='health'),
-    path('metadata/airports', AirportsAutocompleteView.as_view(), name='airports-autocomplete'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('metadata/airports', airports_autocomplete_view, name='airports-autocomplete'),
 ]
-
-
@@ -1,78 +1,234 @@
+import logging
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
 
-from apps.api.serializers import DealsSearchRequestSerializer, DealSerializer
+from apps.api.renderers import STREAM_RENDERERS, FastJSONRenderer
+from apps.api.serializers import (
+    CalendarSearchRequestSerializer,
+    DealsSearchRequestSerializer,
+    deals_payload,
+    project_deal,
+    project_deal_row,
+)
+from apps.deals.models import FlightDeal
+from apps.providers.records import DEAL_FIELDS, DealRecord
+from apps.search.airports import lookup_airports
+from apps.search.cache import (
+    CACHE_MISS,
+    CACHE_STALE,
+    cached_search,
+    lookup_result,
+    refresh_in_background,
+    result_cache_key,
+    store_result,
+)
+from apps.search.calendar import calendar_search
+from apps.search.inspiration import inspiration_cache_stats
 from apps.search.service import search_deals
+from apps.search.streaming import stream_search
+from apps.search.singleflight import search_flight
 from apps.providers.amadeus_client import AmadeusApiError, AmadeusAuthError
-from apps.deals.repository import record_search_request, persist_deals, fetch_top_deals
-from apps.providers.amadeus_client import AmadeusClient
+from apps.providers.ratelimit import scheduler_stats
+from apps.deals.leaderboard import top_deals_page
+from apps.deals.repository import _compute_search_hash
+from apps.deals.writebehind import submit_deals, submit_search_request, write_behind_stats
+from apps.scoring.breaker import ai_breaker
+from apps.scoring.cache import score_cache
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_HEADER = 'X-Search-Cache'
+# The configured renderers, with DRF's JSON renderer swapped for the
+# byte-identical orjson-backed one on the deal endpoints
+DEAL_RENDERERS = [
+    FastJSONRenderer if renderer is JSONRenderer else renderer for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+]
+
+
+def _resolve_dates(data):
+    """Departure/return dates of a validated search, defaulting to tomorrow and a 5-day trip."""
+    from datetime import datetime, timedelta
+
+    date_range = data.get("dateRange") or {}
+    dep = (date_range.get("start") or "").strip()
+    ret = (date_range.get("end") or "").strip() if not data["oneWay"] else None
+    if not dep:
+        dep = (datetime.utcnow() + timedelta(days=1)).date().isoformat()
+    if not data["oneWay"] and not ret:
+        try:
+            dep_dt = datetime.fromisoformat(dep)
+        except Exception:
+            dep_dt = (datetime.utcnow() + timedelta(days=1))
+        ret = (dep_dt + timedelta(days=5)).date().isoformat()
+    return dep, ret
+
+
+def _search_params(data, dep, ret):
+    return {
+        'origin': data["origin"].upper(),
+        'destination': (data.get("destination") or '').upper(),
+        'departure_date': dep,
+        'return_date': ret,
+        'travelers': data["travelers"],
+        'cabin': data.get("cabin"),
+        'stops': data.get("stops", "any"),
+    }
+
+
+def _pipeline_kwargs(data, search_params):
+    # search_deals / asearch_deals keyword arguments
+    return {
+        'one_way': data["oneWay"],
+        'origin': search_params['origin'],
+        'destination': search_params['destination'] or None,
+        'departure_date': search_params['departure_date'],
+        'return_date': search_params['return_date'],
+        'travelers': data["travelers"],
+        'cabin': data.get("cabin"),
+        'stops': data.get("stops", "any"),
+        'duration_range': data.get("durationRange"),
+        'limit': data.get("limit", 50),
+    }
+
+
+def _search_cache_key(data, search_params):
+    return result_cache_key(
+        _compute_search_hash(search_params), limit=data.get("limit", 50), duration_range=data.get("durationRange")
+    )
+
+
+def _logged_params(data, search_params, cache_state):
+    # What SearchRequest keeps: enough to rebuild the result cache key (see apps.search.prewarm)
+    return {
+        'one_way': data["oneWay"],
+        **search_params,
+        'limit': data.get("limit", 50),
+        'duration_range': data.get("durationRange"),
+        'cache_state': cache_state,
+    }
+
+
+def _run_search(data, search_params):
+    meta = {}
+    deals = search_deals(**_pipeline_kwargs(data, search_params), meta=meta)
+    submit_deals(deals, search_params=search_params, limit=data.get("limit", 50))
+    return deals_payload(deals, meta)
+
+
+# ---------- streaming (NDJSON / SSE) ----------
+def _replay_events(payload):
+    # A cached payload as the same event stream; no score updates follow
+    deals = payload.get("deals") or []
+    for i, deal in enumerate(deals):
+        yield 'deal', {'index': i, 'deal': deal}
+    yield 'summary', {
+        'order': list(range(len(deals))),
+        'count': len(deals),
+        'ai_scored': 0,
+        'elapsed_ms': 0,
+        'meta': payload.get("meta") or {},
+    }
+
+
+def _search_events(data, search_params):
+    """(events, cache state) for a streamed search.
+
+    Cached results are replayed; otherwise the pipeline streams and its
+    final result is persisted and cached like a normal search. Provider
+    errors raise here, before the response starts.
+    """
+    key = _search_cache_key(data, search_params)
+    use_cache = getattr(settings, 'SEARCH_CACHE_ENABLED', True)
+    if use_cache:
+        payload, cache_state = lookup_result(key)
+        if cache_state == CACHE_STALE:
+            refresh_in_background(key, lambda: _run_search(data, search_params))
+        if payload is not None:
+            return _replay_events(payload), cache_state
+
+    def on_complete(deals, meta):
+        submit_deals(deals, search_params=search_params, limit=data.get("limit", 50))
+        if use_cache:
+            store_result(key, deals_payload(deals, meta))
+
+    return stream_search(on_complete=on_complete, **_pipeline_kwargs(data, search_params)), CACHE_MISS
+
+
+def _encode_events(renderer, events):
+    try:
+        for event, data in events:
+            if event == 'deal' and isinstance(data['deal'], DealRecord):
+                data = {'index': data['index'], 'deal': project_deal(data['deal'])}
+            yield renderer.render_event(event, data)
+    except Exception:
+        # The status line is long gone; tell the client in-band
+        logger.exception("Streamed search failed")
+        yield renderer.render_event('error', {'detail': 'Search failed before completing.'})
+
+
+def _streaming_response(renderer, chunks, cache_state):
+    response = StreamingHttpResponse(chunks, content_type=renderer.media_type)
+    response[SEARCH_CACHE_HEADER] = cache_state
+    response['Cache-Control'] = 'no-cache'
+    # Nginx buffers proxied responses unless told otherwise
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 class DealsSearchView(APIView):
+    """Deal search. ``Accept: application/x-ndjson`` / ``text/event-stream``
+    (or ``?format=ndjson`` / ``?format=sse``) streams the results as events;
+    see apps.search.streaming.
+    """
+
+    renderer_classes = [*DEAL_RENDERERS, *STREAM_RENDERERS]
+
     def post(self, request):
         serializer = DealsSearchRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
-        from datetime import datetime, timedelta
-
-        date_range = data.get("dateRange") or {}
-        dep = (date_range.get("start") or "").strip()
-        ret = (date_range.get("end") or "").strip() if not data["oneWay"] else None
-        if not dep:
-            dep = (datetime.utcnow() + timedelta(days=1)).date().isoformat()
-        if not data["oneWay"] and not ret:
-            try:
-                dep_dt = datetime.fromisoformat(dep)
-            except Exception:
-                dep_dt = (datetime.utcnow() + timedelta(days=1))
-            ret = (dep_dt + timedelta(days=5)).date().isoformat()
+        dep, ret = _resolve_dates(data)
+        search_params = _search_params(data, dep, ret)
+        streaming = isinstance(request.accepted_renderer, STREAM_RENDERERS)
 
         try:
-            deals = search_deals(
-                one_way=data["oneWay"],
-                origin=data["origin"].upper(),
-            destination=(data.get("destination") or None)
-                and (data.get("destination") or '').upper(),
-                departure_date=dep,
-                return_date=ret,
-                travelers=data["travelers"],
-                cabin=data.get("cabin"),
-                stops=data.get("stops", "any"),
-                duration_range=data.get("durationRange"),
-                limit=data.get("limit", 50),
-            )
-            # Persist async in future; synchronous for MVP
-            record_search_request(
-                params={
-                    'one_way': data["oneWay"],
-                    'origin': data["origin"].upper(),
-                    'destination': data["destination"].upper(),
-                    'departure_date': dep,
-                    'return_date': ret,
-                    'travelers': data["travelers"],
-                    'cabin': data.get("cabin"),
-                    'stops': data.get("stops", "any"),
-                },
+            if streaming:
+                events, cache_state = _search_events(data, search_params)
+            else:
+                payload, cache_state = cached_search(
+                    _search_cache_key(data, search_params), lambda: _run_search(data, search_params)
+                )
+            submit_search_request(
+                params=_logged_params(data, search_params, cache_state),
                 user_agent=request.META.get('HTTP_USER_AGENT'),
                 ip_hash=request.META.get('REMOTE_ADDR'),
             )
-            persist_deals(deals, search_params={
-                'origin': data["origin"].upper(),
-                'destination': data["destination"].upper(),
-                'departure_date': dep,
-                'return_date': ret,
-                'travelers': data["travelers"],
-                'cabin': data.get("cabin"),
-                'stops': data.get("stops", "any"),
-            }, limit=data.get("limit", 50))
         except (AmadeusAuthError, AmadeusApiError) as e:
             return Response({"detail": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
 
-        return Response({"deals": DealSerializer(deals, many=True).data}, status=status.HTTP_200_OK)
+        if streaming:
+            return _streaming_response(
+                request.accepted_renderer, _encode_events(request.accepted_renderer, events), cache_state,
+            )
+        return Response(payload, status=status.HTTP_200_OK, headers={SEARCH_CACHE_HEADER: cache_state})
+
+
+# Keyset pages cost the same at any depth, but a page is still rendered in full
+TOP_DEALS_MAX_LIMIT = 200
+# API fields stored on FlightDeal, read as plain rows
+TOP_DEAL_COLUMNS = tuple(f.name for f in FlightDeal._meta.concrete_fields if f.name in DEAL_FIELDS)
 
 
 class TopDealsView(APIView):
+    renderer_classes = DEAL_RENDERERS
+
     def get(self, request):
         origin = request.query_params.get('origin')
         destination = request.query_params.get('destination')
@@ -80,31 +236,42 @@ class TopDealsView(APIView):
             limit = int(request.query_params.get('limit', '50'))
         except Exception:
             limit = 50
-        items = fetch_top_deals(origin=origin, destination=destination, limit=limit)
-        # Convert model instances to API shape via DealSerializer
-        payload = []
-        for it in items:
-            payload.append({
-                'provider': it.provider,
-                'one_way_bool': it.one_way_bool,
-                'origin_iata': it.origin_iata,
-                'destination_iata': it.destination_iata,
-                'departure_datetime': it.departure_datetime.isoformat() if it.departure_datetime else None,
-                'return_datetime': it.return_datetime.isoformat() if it.return_datetime else None,
-                'num_stops': it.num_stops,
-                'duration_minutes': it.duration_minutes,
-                'layover_minutes_max': it.layover_minutes_max,
-                'airline_codes': it.airline_codes,
-                'cabin_class': it.cabin_class,
-                'price_total': it.price_total,
-                'currency': it.currency,
-                'num_travelers': it.num_travelers,
-                'deep_link': it.deep_link,
-                'score_int_0_100': it.score_int_0_100,
-                'score_factors_json': it.score_factors_json,
-                'badges_json': it.badges_json,
-            })
-        return Response({'deals': DealSerializer(payload, many=True).data}, status=status.HTTP_200_OK)
+        limit = max(1, min(limit, TOP_DEALS_MAX_LIMIT))
+        try:
+            rows, next_cursor = top_deals_page(
+                origin=origin, destination=destination, limit=limit, cursor=request.query_params.get('cursor'),
+                fields=TOP_DEAL_COLUMNS,
+            )
+        except ValueError:
+            return Response({'detail': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {'deals': [project_deal_row(r) for r in rows], 'next_cursor': next_cursor}, status=status.HTTP_200_OK,
+        )
+
+
+class CalendarSearchView(APIView):
+    """Cheapest fare and best (heuristic) score per departure day; see apps.search.calendar."""
+
+    renderer_classes = DEAL_RENDERERS
+
+    def post(self, request):
+        serializer = CalendarSearchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            payload = calendar_search(
+                origin=data["origin"].upper(),
+                destination=data["destination"].upper(),
+                start=data["start"],
+                end=data["end"],
+                trip_lengths=data["tripLengths"],
+                travelers=data["travelers"],
+                cabin=data.get("cabin"),
+                stops=data.get("stops", "any"),
+            )
+        except (AmadeusAuthError, AmadeusApiError) as e:
+            return Response({"detail": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        return Response(payload, status=status.HTTP_200_OK)
 
 
 class HealthView(APIView):
@@ -115,21 +282,31 @@ class HealthView(APIView):
         return Response({'status': 'ok'}, status=status.HTTP_200_OK)
 
 
+class MetricsPermission(IsAdminUser):
+    """Staff only, unless METRICS_PUBLIC opens the endpoint to everyone."""
+
+    def has_permission(self, request, view):
+        return getattr(settings, 'METRICS_PUBLIC', False) or super().has_permission(request, view)
+
+
+class MetricsView(APIView):
+    # Internal state (caches, queues, rate limiter, breaker), so not for anonymous callers
+    permission_classes = [MetricsPermission]
+
+    def get(self, request):
+        return Response({
+            'ai_score_cache': score_cache.stats(),
+            'search_singleflight': search_flight.stats(),
+            'inspiration_cache': inspiration_cache_stats(),
+            'write_behind': write_behind_stats(),
+            'amadeus_scheduler': scheduler_stats(),
+            'ai_breaker': ai_breaker.stats(),
+        }, status=status.HTTP_200_OK)
+
+
 class AirportsAutocompleteView(APIView):
     def get(self, request):
         q = request.query_params.get('query') or ''
         if not q or len(q) < 2:
             return Response({'airports': []}, status=status.HTTP_200_OK)
-        client = AmadeusClient()
-        res = client.search_locations(keyword=q, subType='AIRPORT', limit=10)
-        airports = []
-        for item in res.get('data', []):
-            code = item.get('iataCode')
-            name = item.get('name')
-            city = (item.get('address') or {}).get('cityName')
-            country = (item.get('address') or {}).get('countryName')
-            if code and name:
-                airports.append({'iata': code, 'name': name, 'city': city, 'country': country})
-        return Response({'airports': airports}, status=status.HTTP_200_OK)
-
-
+        return Response({'airports': lookup_airports(q, limit=10)}, status=status.HTTP_200_OK)
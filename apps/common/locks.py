@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import time
+import zlib
+from pathlib import Path
+from typing import Optional, Union
+
+try:  # POSIX
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class FileLock:
+    """Exclusive advisory lock on a file, usable across worker processes.
+
+    Not re-entrant, and not meant to be shared between threads: take a
+    threading.Lock first when threads of one process contend as well.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._fh = None
+
+    def acquire(self, timeout: Optional[float] = None, poll_interval: float = 0.05) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fh = open(self.path, 'a+b')
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:  # pragma: no cover - Windows
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+                self._fh = fh
+                return True
+            except OSError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    fh.close()
+                    return False
+                time.sleep(poll_interval)
+
+    def release(self) -> None:
+        fh, self._fh = self._fh, None
+        if fh is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            else:  # pragma: no cover - Windows
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            fh.close()
+
+    @property
+    def locked(self) -> bool:
+        return self._fh is not None
+
+    def __enter__(self) -> 'FileLock':
+        if not self.acquire():
+            raise LockTimeout(str(self.path))
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def striped_lock_path(directory: Union[str, Path], key: str, stripes: int = 1024) -> Path:
+    """Map ``key`` onto one of a fixed set of lock files so the directory stays bounded."""
+    return Path(directory) / f"{zlib.crc32(key.encode('utf-8')) % stripes:04d}.lock"
@@ -0,0 +1,316 @@
+"""Top-deals leaderboards and keyset pagination for /api/deals/top.
+
+Every scored deal is listed on four boards: global (``''``), its origin
+(``'JFK'``), its destination (``'>LHR'``) and its route (``'JFK-LHR'``).
+Boards are ordered by score, then newest, then deal id, keep at most
+LEADERBOARD_SIZE entries and drop departures that have passed. A board
+always holds the top of its deals, so when entries leave it the next best
+deals are read back from FlightDeal to refill it.
+
+Pages are addressed by an opaque cursor holding the last row's ordering
+key, so page 20 is one index range scan just like page 1. Pages past the
+end of a board continue from FlightDeal through its top-deals indexes.
+
+Unlike the old unindexed listing, deals without a score and deals whose
+departure has passed are not listed at all.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.deals.models import FlightDeal, LeaderboardEntry
+
+GLOBAL_BOARD = ''
+
+# (score, created_at, deal id) of the last row on the previous page
+Cursor = Tuple[int, datetime, int]
+
+_ENTRY_ORDER = ('-score_int_0_100', '-deal_created_at', '-deal_id')
+_DEAL_ORDER = ('-score_int_0_100', '-created_at', '-id')
+
+
+def board_for(origin: Optional[str] = None, destination: Optional[str] = None) -> str:
+    if origin and destination:
+        return f'{origin}-{destination}'
+    if origin:
+        return origin
+    if destination:
+        return f'>{destination}'
+    return GLOBAL_BOARD
+
+
+def _board_filter(board: str) -> Tuple[Optional[str], Optional[str]]:
+    """(origin, destination) of a board key; the inverse of board_for."""
+    if board.startswith('>'):
+        return None, board[1:]
+    if '-' in board:
+        origin, destination = board.split('-', 1)
+        return origin, destination
+    return board or None, None
+
+
+def _boards(deal: Any) -> List[str]:
+    return [
+        GLOBAL_BOARD,
+        board_for(origin=deal.origin_iata),
+        board_for(destination=deal.destination_iata),
+        board_for(deal.origin_iata, deal.destination_iata),
+    ]
+
+
+def encode_cursor(key: Cursor) -> str:
+    score, created_at, deal_id = key
+    raw = json.dumps([score, created_at.isoformat(), deal_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        score, created_at, deal_id = json.loads(raw)
+        created = datetime.fromisoformat(created_at)
+        if not isinstance(score, int) or not isinstance(deal_id, int) or timezone.is_naive(created):
+            raise ValueError('bad cursor fields')
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f'Invalid cursor: {cursor!r}') from exc
+    return score, created, deal_id
+
+
+def _after(key: Cursor, score: str, created: str, pk: str) -> Q:
+    """Rows that sort after ``key`` in (score, created, pk) descending order."""
+    s, c, i = key
+    return (
+        Q(**{f'{score}__lt': s})
+        | Q(**{score: s, f'{created}__lt': c})
+        | Q(**{score: s, created: c, f'{pk}__lt': i})
+    )
+
+
+def _live(now: datetime) -> Q:
+    return Q(departure_datetime__isnull=True) | Q(departure_datetime__gte=now)
+
+
+def _deal_query(origin: Optional[str], destination: Optional[str], key: Optional[Cursor], now: datetime):
+    """Live scored FlightDeals of a board in board order, after ``key`` when given."""
+    qs = FlightDeal.objects.filter(_live(now), score_int_0_100__isnull=False)
+    if origin:
+        qs = qs.filter(origin_iata=origin)
+    if destination:
+        qs = qs.filter(destination_iata=destination)
+    if key is not None:
+        qs = qs.filter(_after(key, 'score_int_0_100', 'created_at', 'id'))
+    return qs.order_by(*_DEAL_ORDER)
+
+
+def _entry(board: str, deal: FlightDeal) -> LeaderboardEntry:
+    return LeaderboardEntry(
+        board=board,
+        deal_id=deal.pk,
+        score_int_0_100=deal.score_int_0_100,
+        deal_created_at=deal.created_at,
+        departure_datetime=deal.departure_datetime,
+    )
+
+
+_ENTRY_COLUMNS = ('id', 'origin_iata', 'destination_iata', 'score_int_0_100', 'created_at', 'departure_datetime')
+
+
+def _backfill(boards: Iterable[str], size: int, now: datetime) -> int:
+    """Refill boards holding fewer than ``size`` entries with the next best deals; returns entries written.
+
+    Everything ranked above a board's last entry is already on it, so the
+    missing deals are the ones that sort after that entry.
+    """
+    entries: List[LeaderboardEntry] = []
+    for board in boards:
+        on_board = LeaderboardEntry.objects.filter(board=board)
+        missing = size - on_board.count()
+        if missing <= 0:
+            continue
+        last = (
+            on_board.order_by('score_int_0_100', 'deal_created_at', 'deal_id')
+            .values_list('score_int_0_100', 'deal_created_at', 'deal_id').first()
+        )
+        origin, destination = _board_filter(board)
+        deals = _deal_query(origin, destination, last, now).only(*_ENTRY_COLUMNS)[:missing]
+        entries.extend(_entry(board, deal) for deal in deals)
+    LeaderboardEntry.objects.bulk_create(
+        entries, batch_size=int(getattr(settings, 'PERSIST_BATCH_SIZE', 500)), ignore_conflicts=True,
+    )
+    return len(entries)
+
+
+def _trim(boards: Iterable[str], size: int) -> int:
+    """Drop entries ranked below ``size`` on each board; returns rows deleted."""
+    deleted = 0
+    for board in boards:
+        cutoff = (
+            LeaderboardEntry.objects.filter(board=board)
+            .order_by(*_ENTRY_ORDER)
+            .values_list('score_int_0_100', 'deal_created_at', 'deal_id')[size - 1:size]
+        )
+        for key in cutoff:
+            deleted += LeaderboardEntry.objects.filter(
+                _after(key, 'score_int_0_100', 'deal_created_at', 'deal_id'), board=board,
+            ).delete()[0]
+    return deleted
+
+
+def _expire(now: datetime) -> Tuple[int, Set[str]]:
+    # Drop departed entries; returns (rows deleted, boards they were on)
+    expired = LeaderboardEntry.objects.filter(departure_datetime__lt=now)
+    boards = set(expired.values_list('board', flat=True).distinct())
+    if not boards:
+        return 0, boards
+    return expired.delete()[0], boards
+
+
+@transaction.atomic
+def prune_leaderboards(now: Optional[datetime] = None) -> int:
+    """Remove entries whose departure has passed and refill the boards they left short; returns rows deleted."""
+    now = now or timezone.now()
+    deleted, boards = _expire(now)
+    _backfill(boards, int(getattr(settings, 'LEADERBOARD_SIZE', 500)), now)
+    return deleted
+
+
+@transaction.atomic
+def update_leaderboards(deal_ids: Iterable[int]) -> int:
+    """Place freshly persisted deals on their boards and trim the boards they touched.
+
+    Reads the deals back so ``created_at`` is the stored value (upserts keep
+    the original). Deals that have lost their score or already departed
+    leave the boards, and so do deals whose score went down, before the
+    boards are refilled from FlightDeal; the new entries then go in and
+    the boards are trimmed. Each board therefore stays the top of its deals.
+    Returns the number of entries written.
+    """
+    ids = {pk for pk in deal_ids if pk is not None}
+    if not ids:
+        return 0
+    now = timezone.now()
+    size = int(getattr(settings, 'LEADERBOARD_SIZE', 500))
+    entries: List[LeaderboardEntry] = []
+    touched: Set[str] = set()
+    leaving: Set[int] = set()
+    scores: Dict[int, int] = {}
+    for deal in FlightDeal.objects.filter(pk__in=ids).only(*_ENTRY_COLUMNS):
+        if deal.score_int_0_100 is None or (deal.departure_datetime and deal.departure_datetime < now):
+            leaving.add(deal.pk)
+            continue
+        scores[deal.pk] = deal.score_int_0_100
+        for board in _boards(deal):
+            touched.add(board)
+            entries.append(_entry(board, deal))
+    # A demoted deal may now rank below deals its board had no room for
+    leaving.update(
+        pk for pk, score in LeaderboardEntry.objects.filter(deal_id__in=scores).values_list('deal_id', 'score_int_0_100')
+        if score > scores[pk]
+    )
+    short: Set[str] = set()
+    if leaving:
+        gone = LeaderboardEntry.objects.filter(deal_id__in=leaving)
+        short.update(gone.values_list('board', flat=True).distinct())
+        gone.delete()
+    short |= _expire(now)[1]
+    _backfill(short, size, now)
+    LeaderboardEntry.objects.bulk_create(
+        entries,
+        batch_size=int(getattr(settings, 'PERSIST_BATCH_SIZE', 500)),
+        update_conflicts=True,
+        unique_fields=['board', 'deal'],
+        update_fields=['score_int_0_100', 'deal_created_at', 'departure_datetime'],
+    )
+    _trim(touched, size)
+    return len(entries)
+
+
+@transaction.atomic
+def rebuild_leaderboards(batch_size: int = 2000) -> int:
+    """Recreate every board from the FlightDeal table; returns the number of entries kept."""
+    LeaderboardEntry.objects.all().delete()
+    ids = (
+        FlightDeal.objects.filter(_live(timezone.now()), score_int_0_100__isnull=False)
+        .order_by(*_DEAL_ORDER).values_list('id', flat=True)
+    )
+    batch: List[int] = []
+    for pk in ids.iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            update_leaderboards(batch)
+            batch = []
+    update_leaderboards(batch)
+    return LeaderboardEntry.objects.count()
+
+
+def top_deals_page(
+    *,
+    origin: Optional[str] = None,
+    destination: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+) -> Tuple[List[Any], Optional[str]]:
+    """One page of top deals and the cursor of the next page (None on the last page).
+
+    Returns FlightDeal instances, or with ``fields`` plain dicts of those
+    FlightDeal columns read straight from the query (no model instances).
+    Reads the leaderboard when LEADERBOARD_ENABLED, continuing in FlightDeal
+    past the end of the board; otherwise FlightDeal directly through its
+    top-deals indexes. Either way deals without a score
+    or with a past departure are left out. Raises ValueError for a bad cursor.
+    """
+    key = decode_cursor(cursor) if cursor else None
+    now = timezone.now()
+    if getattr(settings, 'LEADERBOARD_ENABLED', True):
+        deals, keys = _board_page(board_for(origin, destination), key, now, limit + 1, fields)
+        if len(deals) <= limit:
+            # Past the end of the board: deals it had no room for, or has not picked up yet, follow in FlightDeal
+            more, more_keys = _flight_deal_page(
+                origin, destination, keys[-1] if keys else key, now, limit + 1 - len(deals), fields,
+            )
+            deals += more
+            keys += more_keys
+    else:
+        deals, keys = _flight_deal_page(origin, destination, key, now, limit + 1, fields)
+
+    if len(deals) <= limit:
+        return deals, None
+    return deals[:limit], encode_cursor(keys[limit - 1])
+
+
+def _board_page(
+    board: str, key: Optional[Cursor], now: datetime, count: int, fields: Optional[Sequence[str]],
+) -> Tuple[List[Any], List[Cursor]]:
+    qs = LeaderboardEntry.objects.filter(_live(now), board=board)
+    if key is not None:
+        qs = qs.filter(_after(key, 'score_int_0_100', 'deal_created_at', 'deal_id'))
+    qs = qs.order_by(*_ENTRY_ORDER)[:count]
+    if fields is None:
+        entries = list(qs.select_related('deal'))
+        return [e.deal for e in entries], [(e.score_int_0_100, e.deal_created_at, e.deal_id) for e in entries]
+    rows = list(qs.values_list(
+        'score_int_0_100', 'deal_created_at', 'deal_id', *(f'deal__{name}' for name in fields),
+    ))
+    return [dict(zip(fields, row[3:])) for row in rows], [row[:3] for row in rows]
+
+
+def _flight_deal_page(
+    origin: Optional[str], destination: Optional[str], key: Optional[Cursor], now: datetime, count: int,
+    fields: Optional[Sequence[str]],
+) -> Tuple[List[Any], List[Cursor]]:
+    qs = _deal_query(origin, destination, key, now)[:count]
+    if fields is None:
+        deals = list(qs)
+        return deals, [(d.score_int_0_100, d.created_at, d.pk) for d in deals]
+    rows = list(qs.values_list('score_int_0_100', 'created_at', 'id', *fields))
+    return [dict(zip(fields, row[3:])) for row in rows], [row[:3] for row in rows]
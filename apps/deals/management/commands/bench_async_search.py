@@ -0,0 +1,161 @@
+import asyncio
+import json
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from statistics import median
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from apps.search.async_service import asearch_deals
+from apps.search.service import search_deals
+
+
+def _offer(origin, destination, day, price):
+    return {
+        'itineraries': [{
+            'duration': 'PT3H10M',
+            'segments': [{
+                'carrierCode': 'XX',
+                'departure': {'iataCode': origin, 'at': f'{day}T08:00:00'},
+                'arrival': {'iataCode': destination, 'at': f'{day}T11:10:00'},
+            }],
+        }],
+        'price': {'total': f'{price:.2f}', 'currency': 'USD'},
+    }
+
+
+class _StubProvider(BaseHTTPRequestHandler):
+    """Amadeus + AI stand-in answering every call after a fixed delay."""
+
+    latency = 0.1
+    offers_per_search = 20
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, payload):
+        time.sleep(self.latency)
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path.endswith('/oauth2/token'):
+            self._reply({'access_token': 'bench', 'expires_in': 1799})
+            return
+        # chat completions: grade every deal of the batch
+        prompt = json.loads(body or b'{}').get('messages', [{}, {}])[-1].get('content', '')
+        size = max(1, prompt.count('"index"'))
+        results = [{'index': i, 'score': 70, 'reasons': ['Stub grade'], 'badges': []} for i in range(size)]
+        self._reply({'choices': [{'message': {'content': json.dumps({'results': results})}}]})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        origin = query.get('originLocationCode') or query.get('origin') or 'AAA'
+        if url.path.endswith('/flight-destinations'):
+            self._reply({'data': [{'destination': f'D{i:02d}'} for i in range(10)]})
+            return
+        destination = query.get('destinationLocationCode', 'BBB')
+        day = query.get('departureDate', '2030-01-01')
+        self._reply({'data': [_offer(origin, destination, day, 100 + i) for i in range(self.offers_per_search)]})
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # listen() backlog; the default of 5 would stall hundreds of concurrent connects
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        pass  # clients hanging up on dropped "Anywhere" fetches are expected
+
+
+def _serve_stub(latency, ready):
+    # Runs in its own process so the stub never competes with the client for the GIL
+    _StubProvider.latency = latency
+    server = _StubServer(('127.0.0.1', 0), _StubProvider)
+    ready.put(server.server_port)
+    server.serve_forever()
+
+
+def _summary(label, latencies, elapsed):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    return (
+        f"{label:<6} {len(latencies)} searches in {elapsed:.2f}s  "
+        f"{len(latencies) / elapsed:8.1f} searches/s  p50 {median(latencies) * 1000:.0f}ms  p95 {p95 * 1000:.0f}ms"
+    )
+
+
+class Command(BaseCommand):
+    help = "Compare search throughput of the sync (thread pool) and asyncio pipelines against a local stub provider."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--searches', type=int, default=200, help="Searches per pipeline.")
+        parser.add_argument('--concurrency', type=int, default=200, help="Searches in flight at once.")
+        parser.add_argument('--threads', type=int, default=16, help="Sync worker threads (a typical WSGI worker pool).")
+        parser.add_argument('--latency', type=float, default=0.5, help="Stub provider latency per call, seconds.")
+        parser.add_argument('--anywhere', action='store_true', help="Run 'Anywhere' searches (inspiration + fan-out).")
+
+    def handle(self, *args, **options):
+        ready = multiprocessing.Queue()
+        server = multiprocessing.Process(target=_serve_stub, args=(options['latency'], ready), daemon=True)
+        server.start()
+        stub = f"http://127.0.0.1:{ready.get(timeout=30)}"
+
+        searches = [
+            dict(
+                one_way=True, origin='AAA', destination=None if options['anywhere'] else f'B{i % 50:02d}',
+                departure_date=f'2030-01-{i % 28 + 1:02d}', return_date=None, travelers=1, cabin=None,
+                stops='any', duration_range=None, limit=20,
+            )
+            for i in range(options['searches'])
+        ]
+        overrides = dict(
+            AMADEUS_BASE_URL=stub, AMADEUS_TOKEN_STORE='memory', AI_BASE_URL=stub, AI_SCORE_CACHE_ENABLED=False,
+            # The stub has no quota to protect
+            AMADEUS_RATE_LIMIT_ENABLED=False,
+        )
+        try:
+            with override_settings(**overrides):
+                self.stdout.write(self._run_sync(searches, options['threads']))
+                self.stdout.write(self._run_async(searches, options['concurrency']))
+        finally:
+            server.terminate()
+            server.join()
+
+    def _run_sync(self, searches, threads):
+        def one(kwargs):
+            started = time.perf_counter()
+            search_deals(**kwargs)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = list(pool.map(one, searches))
+        return _summary('sync', latencies, time.perf_counter() - started)
+
+    def _run_async(self, searches, concurrency):
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one(kwargs):
+                async with semaphore:
+                    started = time.perf_counter()
+                    await asearch_deals(**kwargs)
+                    return time.perf_counter() - started
+
+            started = time.perf_counter()
+            latencies = await asyncio.gather(*(one(kw) for kw in searches))
+            return _summary('async', latencies, time.perf_counter() - started)
+
+        return asyncio.run(main())
@@ -0,0 +1,146 @@
+import gc
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from statistics import median
+
+from django.core.management.base import BaseCommand
+
+from apps.api.serializers import DealSerializer
+from apps.pricing.baseline import pct_drop_from_baseline
+from apps.providers.normalizer import normalize_flight_offer_records, normalize_flight_offers
+from apps.providers.sample_payloads import synthetic_flight_offers
+from apps.search.service import _filter_by_duration_range, _filter_by_stops, _rank
+
+_DURATION_RANGE = {'min': 3, 'max': 14}
+_BASELINE = 900.0
+
+
+# ---------- the pre-record dict pipeline, kept here for comparison ----------
+def _dict_filter_stops(deals, limit):
+    return [d for d in deals if int(d.get('num_stops') or 0) <= limit]
+
+
+def _dict_filter_duration(deals, duration_range):
+    filtered = []
+    for d in deals:
+        dep, ret = d.get('departure_datetime'), d.get('return_datetime')
+        if not dep or not ret:
+            filtered.append(d)
+            continue
+        try:
+            dep_dt = datetime.fromisoformat(str(dep).replace('Z', '+00:00'))
+            ret_dt = datetime.fromisoformat(str(ret).replace('Z', '+00:00'))
+            trip_days = (ret_dt.date() - dep_dt.date()).days
+        except Exception:
+            filtered.append(d)
+            continue
+        if duration_range['min'] <= trip_days <= duration_range['max']:
+            filtered.append(d)
+    return filtered
+
+
+def _dict_enrich(deals):
+    for d in deals:
+        d['price_baseline'] = _BASELINE
+        d['price_pct_drop'] = pct_drop_from_baseline(float(d.get('price_total') or 0.0), _BASELINE)
+        d['score_int_0_100'] = int(d.get('price_pct_drop') * 100) if d.get('price_pct_drop') else 50
+
+
+def _dict_rank(deals, limit):
+    deals.sort(key=lambda x: (
+        -float(x.get('price_pct_drop') or 0.0),
+        float(x.get('price_total') or 0.0),
+        -int(x.get('score_int_0_100') or 0),
+    ))
+    return deals[:limit]
+
+
+def _record_enrich(deals):
+    for d in deals:
+        d.price_baseline = _BASELINE
+        d.price_pct_drop = pct_drop_from_baseline(d.price_total or 0.0, _BASELINE)
+        d.score_int_0_100 = int(d.price_pct_drop * 100) if d.price_pct_drop else 50
+
+
+def _dict_pipeline(raw, limit, clock):
+    deals = clock('normalize', lambda: normalize_flight_offers(raw, num_travelers=1, cabin_class='ECONOMY'))
+    deals = clock('filter', lambda: _dict_filter_duration(_dict_filter_stops(deals, 2), _DURATION_RANGE))
+    clock('enrich', lambda: _dict_enrich(deals))
+    deals = clock('rank', lambda: _dict_rank(deals, limit))
+    return clock('serialize', lambda: DealSerializer(deals, many=True).data)
+
+
+def _record_pipeline(raw, limit, clock):
+    deals = clock('normalize', lambda: normalize_flight_offer_records(raw, num_travelers=1, cabin_class='ECONOMY'))
+    deals = clock('filter', lambda: _filter_by_duration_range(_filter_by_stops(deals, 'max1', False), _DURATION_RANGE))
+    clock('enrich', lambda: _record_enrich(deals))
+    deals = clock('rank', lambda: _rank(deals, limit))
+    return clock('serialize', lambda: DealSerializer([d.to_dict() for d in deals], many=True).data)
+
+
+def _built(normalize, enrich, raw):
+    deals = normalize(raw, 1, 'ECONOMY')
+    enrich(deals)
+    return deals
+
+
+def _retained_bytes(build):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (after - before) / max(1, len(kept))
+
+
+class Command(BaseCommand):
+    help = "Compare memory per deal and search-pipeline stage times for dict deals vs slotted DealRecords."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offers', type=int, default=250, help="Offers in the synthetic provider payload.")
+        parser.add_argument('--repeat', type=int, default=30, help="Pipeline runs per representation.")
+        parser.add_argument('--limit', type=int, default=50, help="Deals kept after ranking (serialized).")
+
+    def handle(self, *args, **options):
+        raw = synthetic_flight_offers(options['offers'])
+
+        dicts = normalize_flight_offers(raw, 1, 'ECONOMY')
+        records = normalize_flight_offer_records(raw, 1, 'ECONOMY')
+        _dict_enrich(dicts)
+        _record_enrich(records)
+        self.stdout.write(
+            f"container per deal: dict {sys.getsizeof(dicts[0])} B, DealRecord {sys.getsizeof(records[0])} B"
+        )
+        dict_bytes = _retained_bytes(lambda: _built(normalize_flight_offers, _dict_enrich, raw))
+        record_bytes = _retained_bytes(lambda: _built(normalize_flight_offer_records, _record_enrich, raw))
+        self.stdout.write(
+            f"retained per deal: dict {dict_bytes:.0f} B, DealRecord {record_bytes:.0f} B "
+            f"(the record also holds two parsed datetimes)"
+        )
+
+        dict_ms = self._time(_dict_pipeline, raw, options)
+        record_ms = self._time(_record_pipeline, raw, options)
+        self.stdout.write(f"{options['offers']} offers, median of {options['repeat']} runs (ms):")
+        self.stdout.write(f"  {'stage':<10} {'dict':>8} {'record':>8}")
+        for stage in list(dict_ms) + ['total']:
+            a = sum(dict_ms.values()) if stage == 'total' else dict_ms[stage]
+            b = sum(record_ms.values()) if stage == 'total' else record_ms[stage]
+            self.stdout.write(f"  {stage:<10} {a:8.2f} {b:8.2f}")
+
+    def _time(self, pipeline, raw, options):
+        samples = {}
+
+        def clock(stage, fn):
+            started = time.perf_counter()
+            result = fn()
+            samples.setdefault(stage, []).append((time.perf_counter() - started) * 1000)
+            return result
+
+        for _ in range(options['repeat']):
+            pipeline(raw, options['limit'], clock)
+        return {stage: median(values) for stage, values in samples.items()}
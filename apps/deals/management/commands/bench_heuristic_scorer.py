@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from apps.deals.models import AirlineQuality
+from apps.providers.normalizer import normalize_flight_offer_records
+from apps.providers.sample_payloads import synthetic_flight_offers
+from apps.scoring.heuristic import compute_heuristic_scores, np
+from apps.scoring.service import compute_heuristic_score
+
+# Rated below 0.4 for the run so the "Bad airline" rule fires
+_LOW_RATED = {'NK': 0.2, 'F9': 0.3}
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _timed(fn, repeat):
+    # Best of ``repeat`` runs; the single-CPU boxes this runs on are noisy
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+class Command(BaseCommand):
+    help = "Compare the per-deal heuristic scorer with the batch (NumPy) one, checking the output is identical."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[250, 10000], help="Result-set sizes to score.")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per scorer (best is kept).")
+
+    def handle(self, *args, **options):
+        if np is None:
+            self.stdout.write(self.style.WARNING("numpy is not installed; only the pure-Python batch path runs."))
+        try:
+            # Temporary AirlineQuality rows, rolled back afterwards
+            with transaction.atomic():
+                for code, rating in _LOW_RATED.items():
+                    AirlineQuality.objects.update_or_create(carrier_code=code, defaults={'score_float_0_1': rating})
+                for size in options['sizes']:
+                    self._run(size, options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, size, repeat):
+        deals = normalize_flight_offer_records(synthetic_flight_offers(size, seed=size), 1, 'ECONOMY')
+        expected, per_deal_ms = _timed(lambda: [compute_heuristic_score(d) for d in deals], repeat)
+        with override_settings(HEURISTIC_VECTORIZED=False):
+            rows, rows_ms = _timed(lambda: compute_heuristic_scores(deals), repeat)
+        line = f"{size:>6} deals: per-deal {per_deal_ms:9.1f}ms  batch (python) {rows_ms:8.1f}ms"
+        results = [rows]
+        if np is not None:
+            vectorized, vectorized_ms = _timed(lambda: compute_heuristic_scores(deals), repeat)
+            results.append(vectorized)
+            line += f"  batch (numpy) {vectorized_ms:8.1f}ms"
+        for result in results:
+            if result != expected:
+                mismatch = next(i for i, (a, b) in enumerate(zip(expected, result)) if a != b)
+                raise CommandError(f"deal {mismatch}: expected {expected[mismatch]}, got {result[mismatch]}")
+        self.stdout.write(line + "  (identical output)")
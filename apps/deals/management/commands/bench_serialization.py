@@ -0,0 +1,145 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from apps.api.renderers import FastJSONRenderer, orjson
+from apps.api.serializers import DealSerializer, project_deal, project_deal_row
+from apps.api.views import TOP_DEAL_COLUMNS
+from apps.deals.leaderboard import top_deals_page, update_leaderboards
+from apps.deals.models import FlightDeal
+from apps.providers.normalizer import normalize_flight_offer_records
+from apps.providers.sample_payloads import synthetic_flight_offers
+
+_BADGES = ['🔥 Amazing deal', '🌅 Morning departure', '⏱️ Long layover', '🛌 Weekend-friendly']
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _timed(fn, repeat):
+    # Best of ``repeat`` runs; the single-CPU boxes this runs on are noisy
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def _scored_deals(size):
+    rng = random.Random(size)
+    deals = normalize_flight_offer_records(synthetic_flight_offers(size, seed=size), 1, 'ECONOMY')
+    for d in deals:
+        d.price_baseline = round(d.price_total * rng.uniform(0.9, 1.4), 2)
+        d.price_pct_drop = max(0.0, round((d.price_baseline - d.price_total) / d.price_baseline, 4))
+        d.score_int_0_100 = rng.randint(20, 98)
+        d.score_factors_json = ['Direct flight', 'Good price vs baseline'][:rng.randint(0, 2)]
+        d.badges_json = rng.sample(_BADGES, rng.randint(0, 2))
+    return deals
+
+
+def _legacy_top_row(it):
+    # The hand-built dict TopDealsView fed to DealSerializer before the fast path
+    return {
+        'provider': it.provider,
+        'one_way_bool': it.one_way_bool,
+        'origin_iata': it.origin_iata,
+        'destination_iata': it.destination_iata,
+        'departure_datetime': it.departure_datetime.isoformat() if it.departure_datetime else None,
+        'return_datetime': it.return_datetime.isoformat() if it.return_datetime else None,
+        'num_stops': it.num_stops,
+        'duration_minutes': it.duration_minutes,
+        'layover_minutes_max': it.layover_minutes_max,
+        'airline_codes': it.airline_codes,
+        'cabin_class': it.cabin_class,
+        'price_total': it.price_total,
+        'currency': it.currency,
+        'num_travelers': it.num_travelers,
+        'deep_link': it.deep_link,
+        'score_int_0_100': it.score_int_0_100,
+        'score_factors_json': it.score_factors_json,
+        'badges_json': it.badges_json,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DealSerializer + JSONRenderer with the compiled projection + FastJSONRenderer "
+        "for search and top-deals responses, checking the bytes are identical."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000], help="Deals per response.")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per path (best is kept).")
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed; FastJSONRenderer uses the stock encoder."))
+        for size in options['sizes']:
+            self._search(size, options['repeat'])
+        try:
+            # Temporary FlightDeal and leaderboard rows, rolled back afterwards
+            with transaction.atomic(), override_settings(LEADERBOARD_SIZE=max(options['sizes'])):
+                for size in options['sizes']:
+                    self._top(size, options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _report(self, label, size, drf, fast, repeat):
+        (drf_payload, drf_ser_ms), (fast_payload, fast_ser_ms) = drf, fast
+        drf_body, drf_ms = _timed(lambda: JSONRenderer().render(drf_payload), repeat)
+        fast_body, fast_ms = _timed(lambda: FastJSONRenderer().render(fast_payload), repeat)
+        if drf_body != fast_body:
+            at = next(
+                (i for i, (a, b) in enumerate(zip(drf_body, fast_body)) if a != b), min(len(drf_body), len(fast_body)),
+            )
+            raise CommandError(f"{label} x{size}: bodies differ at byte {at}: {drf_body[at - 40:at + 40]!r}")
+        self.stdout.write(
+            f"{label:>6} {size:>5} deals: serialize {drf_ser_ms:7.2f}ms -> {fast_ser_ms:6.2f}ms  "
+            f"render {drf_ms:6.2f}ms -> {fast_ms:5.2f}ms  "
+            f"total {drf_ser_ms + drf_ms:7.2f}ms -> {fast_ser_ms + fast_ms:6.2f}ms  ({len(fast_body)} identical bytes)"
+        )
+
+    def _search(self, size, repeat):
+        deals = _scored_deals(size)
+        meta = {'ranking': {'mode': 'two_stage', 'candidates': size, 'scored': min(size, 50), 'skipped': 0}}
+        drf = _timed(
+            lambda: {'deals': list(DealSerializer([d.to_dict() for d in deals], many=True).data), 'meta': meta}, repeat,
+        )
+        fast = _timed(lambda: {'deals': [project_deal(d) for d in deals], 'meta': meta}, repeat)
+        self._report('search', size, drf, fast, repeat)
+
+    def _top(self, size, repeat):
+        FlightDeal.objects.all().delete()
+        created = datetime.now(timezone.utc)
+        rows = []
+        for i, d in enumerate(_scored_deals(size)):
+            rows.append(FlightDeal(
+                provider='amadeus', search_hash=f'bench-{size}', origin_iata=d.origin_iata,
+                destination_iata=d.destination_iata, one_way_bool=d.one_way_bool,
+                departure_datetime=created + timedelta(days=30, minutes=i),
+                return_datetime=None if d.one_way_bool else created + timedelta(days=37, minutes=i),
+                num_stops=d.num_stops, duration_minutes=d.duration_minutes, layover_minutes_max=d.layover_minutes_max,
+                airline_codes=d.airline_codes, cabin_class=d.cabin_class, price_total=d.price_total,
+                currency=d.currency, num_travelers=d.num_travelers, deep_link=d.deep_link,
+                score_int_0_100=d.score_int_0_100, score_factors_json=d.score_factors_json, badges_json=d.badges_json,
+            ))
+        update_leaderboards(obj.pk for obj in FlightDeal.objects.bulk_create(rows))
+        # Query included on both sides: model instances vs plain rows
+        drf = _timed(lambda: {
+            'deals': DealSerializer([_legacy_top_row(it) for it in top_deals_page(limit=size)[0]], many=True).data,
+            'next_cursor': None,
+        }, repeat)
+        fast = _timed(lambda: {
+            'deals': [project_deal_row(r) for r in top_deals_page(limit=size, fields=TOP_DEAL_COLUMNS)[0]],
+            'next_cursor': None,
+        }, repeat)
+        self._report('top', size, drf, fast, repeat)
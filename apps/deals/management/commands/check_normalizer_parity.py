@@ -0,0 +1,88 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.providers import normalizer
+from apps.providers.sample_payloads import synthetic_flight_offers
+
+PAYLOAD_DIR = Path(normalizer.__file__).resolve().parent / 'payloads'
+
+
+def _comparable(deal):
+    deal = dict(deal)
+    # The reference merges round-trip carriers through a set, so only membership is defined
+    deal['airline_codes'] = sorted(deal.get('airline_codes') or [])
+    return deal
+
+
+def _diff(expected, actual):
+    problems = []
+    if len(expected) != len(actual):
+        problems.append(f"{len(expected)} deals expected, got {len(actual)}")
+    for i, (want, got) in enumerate(zip(expected, actual)):
+        want, got = _comparable(want), _comparable(got.to_dict())
+        for field in sorted(set(want) | set(got)):
+            if want.get(field) != got.get(field):
+                problems.append(f"deal {i} {field}: expected {want.get(field)!r}, got {got.get(field)!r}")
+    return problems
+
+
+def _best_ms(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that the single-pass record normalizer matches normalize_flight_offers on recorded payloads "
+        "(apps/providers/payloads) and synthetic ones, and time both."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="Extra flight-offers JSON files or directories to check.")
+        parser.add_argument('--synthetic', type=int, default=5, help="Synthetic payloads (different seeds) to add.")
+        parser.add_argument('--offers', type=int, default=250, help="Offers per synthetic payload.")
+        parser.add_argument('--repeat', type=int, default=20, help="Timing runs per payload (best is kept).")
+
+    def handle(self, *args, **options):
+        payloads = []
+        for path in [PAYLOAD_DIR, *map(Path, options['paths'])]:
+            files = sorted(path.glob('*.json')) if path.is_dir() else [path]
+            for f in files:
+                with open(f, encoding='utf-8') as fh:
+                    payloads.append((f.name, json.load(fh)))
+        for seed in range(options['synthetic']):
+            payloads.append((
+                f"synthetic seed={seed}",
+                synthetic_flight_offers(options['offers'], seed=seed, round_trip=seed % 2 == 0, dictionaries=seed % 3 != 2),
+            ))
+
+        failed = 0
+        for name, raw in payloads:
+            for travelers, cabin in ((1, None), (3, 'BUSINESS')):
+                expected = normalizer.normalize_flight_offers(raw, num_travelers=travelers, cabin_class=cabin)
+                actual = normalizer.normalize_flight_offer_records(raw, num_travelers=travelers, cabin_class=cabin)
+                problems = _diff(expected, actual)
+                if problems:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f"MISMATCH {name}"))
+                    for p in problems[:20]:
+                        self.stdout.write(f"  {p}")
+                    break
+            else:
+                reference = _best_ms(lambda: normalizer.normalize_flight_offers(raw, 1, None), options['repeat'])
+                fast = _best_ms(lambda: normalizer.normalize_flight_offer_records(raw, 1, None), options['repeat'])
+                self.stdout.write(
+                    f"ok {name}: {len(expected)} deals, reference {reference:.2f}ms, single-pass {fast:.2f}ms"
+                )
+
+        if failed:
+            raise CommandError(f"{failed} of {len(payloads)} payloads differ")
+        self.stdout.write(self.style.SUCCESS(f"All {len(payloads)} payloads match."))
@@ -0,0 +1,78 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.deals.repository import upsert_airports
+from apps.search.airports import bump_airport_index_version
+
+# OurAirports type -> popularity weight; other types are skipped
+_OURAIRPORTS_POPULARITY = {'large_airport': 100, 'medium_airport': 40, 'small_airport': 10}
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _ourairports_row(row):
+    weight = _OURAIRPORTS_POPULARITY.get(row.get('type'))
+    if weight is None:
+        return None
+    if row.get('scheduled_service') == 'yes':
+        weight += 20
+    return {
+        'iata': row.get('iata_code'),
+        'name': row.get('name'),
+        'city': row.get('municipality'),
+        'country': row.get('iso_country'),
+        'lat': _float(row.get('latitude_deg')),
+        'lon': _float(row.get('longitude_deg')),
+        'popularity': weight,
+    }
+
+
+def _plain_row(row):
+    return {
+        'iata': row.get('iata'),
+        'name': row.get('name'),
+        'city': row.get('city'),
+        'country': row.get('country'),
+        'lat': _float(row.get('lat')),
+        'lon': _float(row.get('lon')),
+        'popularity': int(_float(row.get('popularity')) or 0),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-load airports from a CSV file into Airport. Accepts the OurAirports airports.csv "
+        "(popularity derived from airport type and scheduled service) or a CSV with columns "
+        "iata,name,city,country[,lat,lon,popularity]."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help="Path to the CSV file.")
+        parser.add_argument('--keep-existing', action='store_true', help="Do not overwrite airports already stored.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per INSERT statement.")
+
+    def handle(self, *args, **options):
+        try:
+            fh = open(options['csv_path'], newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(str(e))
+        with fh:
+            reader = csv.DictReader(fh)
+            columns = set(reader.fieldnames or [])
+            if 'iata_code' in columns:
+                convert = _ourairports_row
+            elif {'iata', 'name'} <= columns:
+                convert = _plain_row
+            else:
+                raise CommandError("Unrecognised CSV header; expected OurAirports columns or iata,name,city,country")
+            rows = [r for r in (convert(row) for row in reader) if r and r['iata'] and r['name']]
+
+        loaded = upsert_airports(rows, overwrite=not options['keep_existing'], batch_size=options['batch_size'])
+        bump_airport_index_version()
+        self.stdout.write(self.style.SUCCESS(f"Loaded {loaded} airports; autocomplete indexes will rebuild."))
@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.api.serializers import deals_payload
+from apps.search.prewarm import calls_left, hot_targets, run_prewarm, warm_hit_rate
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the searches most popular in SearchRequest history (route, days ahead, trip length) "
+        "ahead of demand, within PREWARM_CALLS_PER_HOUR provider calls, and report the warm-cache hit rate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=None, help="Number of targets to keep warm (PREWARM_TOP).")
+        parser.add_argument('--days', type=int, default=None, help="How far back to read history (PREWARM_HISTORY_DAYS).")
+        parser.add_argument('--calls-per-hour', type=int, default=None, help="Provider call budget (PREWARM_CALLS_PER_HOUR).")
+        parser.add_argument('--loop', action='store_true', help="Keep running, every PREWARM_INTERVAL_SECONDS.")
+        parser.add_argument('--dry-run', action='store_true', help="List the targets without warming them.")
+        parser.add_argument('--report', action='store_true', help="Only print the warm-cache hit rate.")
+
+    def handle(self, *args, **options):
+        top, days = options['top'], options['days']
+        if options['dry_run']:
+            for target, searches in hot_targets(
+                top if top is not None else int(getattr(settings, 'PREWARM_TOP', 50)),
+                days if days is not None else int(getattr(settings, 'PREWARM_HISTORY_DAYS', 14)),
+            ):
+                self.stdout.write(f"{target.label():<40} {searches:>6} searches  ~{target.call_cost()} calls")
+            self.stdout.write(f"{calls_left(options['calls_per_hour'])} calls left this hour.")
+            return
+        if not options['report']:
+            while True:
+                stats = run_prewarm(deals_payload, top=top, days=days, per_hour=options['calls_per_hour'])
+                self.stdout.write(self.style.SUCCESS(
+                    f"Warmed {stats['warmed']} of {stats['targets']} targets with {stats['calls']} provider calls "
+                    f"({stats['fresh']} still fresh, {stats['over_budget']} over budget, {stats['failed']} failed)."
+                ))
+                close_old_connections()
+                if not options['loop']:
+                    break
+                time.sleep(float(getattr(settings, 'PREWARM_INTERVAL_SECONDS', 900)))
+        self._report(warm_hit_rate(top=top, days=days))
+
+    def _report(self, rates):
+        self.stdout.write(f"Live searches in the last {rates['days']} days, served from the cache (HIT or STALE):")
+        for group, label in (('hot', f"top {rates['top']} targets"), ('other', "everything else")):
+            r = rates[group]
+            rate = '-' if r['hit_rate'] is None else f"{r['hit_rate']:.1%}"
+            self.stdout.write(
+                f"  {label:<16} {rate:>6} of {r['searches']} searches (hit {r['hit']}, stale {r['stale']}, miss {r['miss']})"
+            )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.pricing.buckets import rebuild_fare_buckets
+
+
+class Command(BaseCommand):
+    help = "Rebuild FareHistoryBucket aggregates from the full FlightDeal history."
+
+    def handle(self, *args, **options):
+        written = rebuild_fare_buckets()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} fare history buckets."))
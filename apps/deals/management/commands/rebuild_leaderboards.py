@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.deals.leaderboard import prune_leaderboards, rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Rebuild the /api/deals/top leaderboards from FlightDeal, or only drop departed deals with --prune."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true', help="Only remove entries whose departure has passed.")
+
+    def handle(self, *args, **options):
+        if options['prune']:
+            removed = prune_leaderboards()
+            self.stdout.write(self.style.SUCCESS(f"Removed {removed} departed leaderboard entries."))
+            return
+        kept = rebuild_leaderboards()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt leaderboards with {kept} entries."))
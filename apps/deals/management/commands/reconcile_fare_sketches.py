@@ -0,0 +1,67 @@
+from statistics import median
+
+from django.core.management.base import BaseCommand
+
+from apps.deals.models import FlightDeal, RouteFareSketch
+from apps.pricing.buckets import month_bounds
+from apps.pricing.sketch import QuantileSketch, rebuild_fare_sketches
+
+
+class Command(BaseCommand):
+    help = "Compare fare sketch medians against exact medians of FlightDeal rows and report the error."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--origin', help="Only check routes from this IATA code.")
+        parser.add_argument('--rebuild', action='store_true', help="Rebuild all sketches from FlightDeal first.")
+        parser.add_argument('--verbose-rows', action='store_true', help="Print one line per route-month.")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(f"Rebuilt {rebuild_fare_sketches()} sketches.")
+
+        rows = RouteFareSketch.objects.all().order_by('origin_iata', 'destination_iata', 'month_bucket')
+        if options['origin']:
+            rows = rows.filter(origin_iata=options['origin'].upper())
+
+        checked = 0
+        errors = []
+        bound = None
+        count_mismatches = 0
+        for row in rows.iterator():
+            sketch = QuantileSketch.from_bytes(row.sketch)
+            bound = sketch.alpha
+            start, end = month_bounds(row.month_bucket)
+            prices = [
+                float(price)
+                for price in FlightDeal.objects.filter(
+                    origin_iata=row.origin_iata, destination_iata=row.destination_iata,
+                    departure_datetime__gte=start, departure_datetime__lt=end,
+                ).values_list('price_total', flat=True)
+            ]
+            if not prices:
+                continue
+            exact = float(median(prices))
+            approx = sketch.median()
+            rel_error = abs(approx - exact) / exact if exact else 0.0
+            errors.append(rel_error)
+            checked += 1
+            if sketch.count != len(prices):
+                count_mismatches += 1
+            if options['verbose_rows']:
+                self.stdout.write(
+                    f"{row.origin_iata}-{row.destination_iata} {row.month_bucket}: exact={exact:.2f} "
+                    f"sketch={approx:.2f} rel_error={rel_error:.4%} samples={len(prices)}/{sketch.count}"
+                )
+
+        if not checked:
+            self.stdout.write("No sketches to reconcile.")
+            return
+        max_error = max(errors)
+        mean_error = sum(errors) / len(errors)
+        self.stdout.write(
+            f"Checked {checked} route-months: mean rel error {mean_error:.4%}, max {max_error:.4%}, "
+            f"guaranteed bound {bound:.2%}; "
+            f"{count_mismatches} with sample count drift."
+        )
+        if count_mismatches:
+            self.stdout.write(self.style.WARNING("Sample counts drifted from FlightDeal; run with --rebuild to resync."))
@@ -0,0 +1,52 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.deals.models import SearchRequest
+from apps.providers.amadeus_client import AmadeusApiError, AmadeusAuthError, get_amadeus_client
+from apps.providers.ratelimit import BACKGROUND, request_lane
+from apps.search.inspiration import get_flight_destinations
+
+
+class Command(BaseCommand):
+    help = "Pre-populate the inspiration cache for the origins most searched with 'Anywhere' in SearchRequest history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=50, help="Number of (origin, trip type) pairs to warm.")
+        parser.add_argument('--days', type=int, default=30, help="How far back to read SearchRequest history.")
+        parser.add_argument('--force', action='store_true', help="Re-fetch even when an entry is already cached.")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        demand: Counter = Counter()
+        for params in SearchRequest.objects.filter(created_at__gte=since).values_list('params_json', flat=True).iterator():
+            params = params or {}
+            origin = str(params.get('origin') or '').upper()
+            if len(origin) != 3 or params.get('destination'):
+                continue
+            # Requests logged before the trip type was recorded warm both variants
+            one_way = params.get('one_way')
+            for variant in ((bool(one_way),) if one_way is not None else (True, False)):
+                demand[(origin, variant)] += 1
+
+        client = get_amadeus_client()
+        warmed = empty = failed = 0
+        for (origin, one_way), searches in demand.most_common(options['top']):
+            try:
+                # Warming yields to live searches sharing the Amadeus quota
+                with request_lane(BACKGROUND):
+                    entry = get_flight_destinations(client, origin=origin, one_way=one_way, refresh=options['force'])
+            except (AmadeusAuthError, AmadeusApiError) as e:
+                failed += 1
+                self.stderr.write(f"{origin} one_way={one_way}: {e}")
+                continue
+            warmed += 1
+            if not entry.get('data'):
+                empty += 1
+            self.stdout.write(f"{origin} one_way={one_way}: {len(entry.get('data') or [])} destinations ({searches} searches)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {warmed} inspiration entries ({empty} without destinations, {failed} failed)."
+        ))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIScoreCacheEntry',
+            fields=[
+                ('fingerprint', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('score_int_0_100', models.IntegerField()),
+                ('reasons_json', models.JSONField(default=list)),
+                ('badges_json', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
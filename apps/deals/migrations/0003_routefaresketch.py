@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0002_aiscorecacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteFareSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin_iata', models.CharField(max_length=3)),
+                ('destination_iata', models.CharField(max_length=3)),
+                ('month_bucket', models.CharField(max_length=7)),
+                ('sketch', models.BinaryField()),
+                ('sample_size', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('origin_iata', 'destination_iata', 'month_bucket'), name='uniq_route_fare_sketch')],
+            },
+        ),
+    ]
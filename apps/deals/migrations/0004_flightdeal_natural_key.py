@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:35
+
+from django.db import migrations, models
+
+
+def drop_duplicate_deals(apps, schema_editor):
+    # Keep the newest row per natural key so the unique constraint can be added
+    FlightDeal = apps.get_model('deals', 'FlightDeal')
+    seen = set()
+    duplicates = []
+    rows = (
+        FlightDeal.objects.exclude(departure_datetime__isnull=True)
+        .order_by('-id')
+        .values_list('id', 'search_hash', 'origin_iata', 'destination_iata', 'departure_datetime')
+    )
+    for pk, *key in rows.iterator():
+        key = tuple(key)
+        if key in seen:
+            duplicates.append(pk)
+        else:
+            seen.add(key)
+    for start in range(0, len(duplicates), 500):
+        FlightDeal.objects.filter(pk__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0003_routefaresketch'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_deals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='flightdeal',
+            constraint=models.UniqueConstraint(fields=('search_hash', 'origin_iata', 'destination_iata', 'departure_datetime'), name='uniq_flight_deal_natural_key'),
+        ),
+    ]
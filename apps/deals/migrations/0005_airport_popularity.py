@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0004_flightdeal_natural_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='airport',
+            name='popularity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0005_airport_popularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(max_length=16)),
+                ('score_int_0_100', models.IntegerField()),
+                ('deal_created_at', models.DateTimeField()),
+                ('departure_datetime', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='flightdeal',
+            index=models.Index(fields=['-score_int_0_100', '-created_at', '-id'], name='deal_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flightdeal',
+            index=models.Index(fields=['origin_iata', '-score_int_0_100', '-created_at', '-id'], name='deal_top_origin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flightdeal',
+            index=models.Index(fields=['destination_iata', '-score_int_0_100', '-created_at', '-id'], name='deal_top_dest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flightdeal',
+            index=models.Index(fields=['origin_iata', 'destination_iata', '-score_int_0_100', '-created_at', '-id'], name='deal_top_route_idx'),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='deal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to='deals.flightdeal'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['board', '-score_int_0_100', '-deal_created_at', '-deal'], name='leaderboard_page_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardentry',
+            constraint=models.UniqueConstraint(fields=('board', 'deal'), name='uniq_leaderboard_board_deal'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0006_leaderboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='farehistorybucket',
+            name='price_sketch',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='farehistorybucket',
+            name='price_sum',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='farehistorybucket',
+            name='price_sum_sq',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
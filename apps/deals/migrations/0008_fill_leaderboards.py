@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def fill_leaderboards(apps, schema_editor):
+    # Deals stored before the boards existed would otherwise only show up once re-persisted
+    FlightDeal = apps.get_model('deals', 'FlightDeal')
+    if not FlightDeal.objects.filter(score_int_0_100__isnull=False).exists():
+        return
+    from apps.deals.leaderboard import rebuild_leaderboards
+    rebuild_leaderboards()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0007_farehistorybucket_running_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_leaderboards, migrations.RunPython.noop),
+    ]
@@ -10,6 +10,8 @@ class Airport(models.Model):
     country = models.CharField(max_length=64)
     lat = models.FloatField(null=True, blank=True)
     lon = models.FloatField(null=True, blank=True)
+    # Ranking weight for autocomplete (bigger = shown first)
+    popularity = models.PositiveIntegerField(default=0)
 
     def __str__(self) -> str:  # pragma: no cover
         return f"{self.iata} - {self.city}"
@@ -32,6 +34,10 @@ class FareHistoryBucket(models.Model):
     std_price = models.FloatField(null=True, blank=True)
     currency = models.CharField(max_length=8, default='USD')
     sample_size = models.IntegerField(default=0)
+    # Running aggregates persist_deals folds new fares into; null on buckets built before them
+    price_sum = models.FloatField(null=True, blank=True)
+    price_sum_sq = models.FloatField(null=True, blank=True)
+    price_sketch = models.BinaryField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -73,6 +79,43 @@ class FlightDeal(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=["origin_iata", "destination_iata", "departure_datetime", "price_total"]),
+            # Top-deals ordering (score, then newest, id as the keyset tie-break), globally and per origin/destination/route
+            models.Index(fields=["-score_int_0_100", "-created_at", "-id"], name="deal_top_idx"),
+            models.Index(fields=["origin_iata", "-score_int_0_100", "-created_at", "-id"], name="deal_top_origin_idx"),
+            models.Index(fields=["destination_iata", "-score_int_0_100", "-created_at", "-id"], name="deal_top_dest_idx"),
+            models.Index(
+                fields=["origin_iata", "destination_iata", "-score_int_0_100", "-created_at", "-id"],
+                name="deal_top_route_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["search_hash", "origin_iata", "destination_iata", "departure_datetime"],
+                name="uniq_flight_deal_natural_key",
+            ),
+        ]
+
+
+class LeaderboardEntry(models.Model):
+    """A deal's place on one top-deals board, kept up to date as deals are persisted.
+
+    Boards are global (empty key), per origin ('JFK'), per destination
+    ('>LHR') and per route ('JFK-LHR'); see apps.deals.leaderboard.
+    """
+
+    board = models.CharField(max_length=16)
+    deal = models.ForeignKey(FlightDeal, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    # Copies of the deal's ordering columns so a page is one index range scan
+    score_int_0_100 = models.IntegerField()
+    deal_created_at = models.DateTimeField()
+    departure_datetime = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["board", "-score_int_0_100", "-deal_created_at", "-deal"], name="leaderboard_page_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["board", "deal"], name="uniq_leaderboard_board_deal"),
         ]
 
 
@@ -83,3 +126,26 @@ class SearchRequest(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
 
+
+
+class AIScoreCacheEntry(models.Model):
+    fingerprint = models.CharField(primary_key=True, max_length=64)
+    score_int_0_100 = models.IntegerField()
+    reasons_json = models.JSONField(default=list)
+    badges_json = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+
+class RouteFareSketch(models.Model):
+    origin_iata = models.CharField(max_length=3)
+    destination_iata = models.CharField(max_length=3)
+    month_bucket = models.CharField(max_length=7)  # YYYY-MM of departure
+    sketch = models.BinaryField()
+    sample_size = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["origin_iata", "destination_iata", "month_bucket"], name="uniq_route_fare_sketch"),
+        ]
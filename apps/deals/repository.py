@@ -1,12 +1,19 @@
 from __future__ import annotations
 
 import hashlib
+import logging
 from datetime import datetime, timezone
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+from django.conf import settings
 from django.db import transaction
 
-from apps.deals.models import FlightDeal, SearchRequest
+from apps.deals.leaderboard import top_deals_page, update_leaderboards
+from apps.deals.models import Airport, FlightDeal, SearchRequest
+from apps.pricing.buckets import FareSample, fare_sample, fold_fare_buckets
+from apps.pricing.sketch import update_fare_sketches
+
+logger = logging.getLogger(__name__)
 
 
 def _parse_iso_dt(dt_str: Optional[str]) -> Optional[datetime]:
@@ -42,44 +49,183 @@ def record_search_request(params: Dict[str, Any], user_agent: Optional[str], ip_
     return SearchRequest.objects.create(params_json=params, user_agent=user_agent or '', ip_hash=ip_hash or '')
 
 
+_NATURAL_KEY = ['search_hash', 'origin_iata', 'destination_iata', 'departure_datetime']
+_UPSERT_FIELDS = [
+    'provider', 'deep_link', 'one_way_bool', 'return_datetime', 'num_stops', 'duration_minutes',
+    'layover_minutes_max', 'airline_codes', 'cabin_class', 'price_total', 'currency', 'num_travelers',
+    'score_int_0_100', 'score_factors_json', 'badges_json',
+]
+
+
+def _deal_defaults(d: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'provider': d.get('provider') or 'amadeus',
+        'deep_link': d.get('deep_link'),
+        'one_way_bool': bool(d.get('one_way_bool')),
+        'return_datetime': _parse_iso_dt(d.get('return_datetime')),
+        'num_stops': int(d.get('num_stops') or 0),
+        'duration_minutes': int(d.get('duration_minutes') or 0),
+        'layover_minutes_max': int(d.get('layover_minutes_max') or 0),
+        'airline_codes': list(d.get('airline_codes') or []),
+        'cabin_class': d.get('cabin_class'),
+        'price_total': float(d.get('price_total') or 0.0),
+        'currency': d.get('currency') or 'USD',
+        'num_travelers': int(d.get('num_travelers') or 1),
+        'score_int_0_100': d.get('score_int_0_100'),
+        'score_factors_json': d.get('score_factors_json'),
+        'badges_json': d.get('badges_json'),
+    }
+
+
 @transaction.atomic
-def persist_deals(normalized_deals: Iterable[Dict[str, Any]], search_params: Dict[str, Any], limit: int = 50) -> List[FlightDeal]:
+def persist_deals(
+    normalized_deals: Iterable[Dict[str, Any]],
+    search_params: Dict[str, Any],
+    limit: int = 50,
+    stats: Optional[Dict[str, int]] = None,
+) -> List[FlightDeal]:
+    """Upsert a search's deals on their natural key with one bulk statement per chunk.
+
+    When ``stats`` is given it receives the inserted/updated row counts.
+    Fare buckets, sketches and leaderboards are updated once the
+    surrounding transaction commits (see _after_persist).
+    """
     search_hash = _compute_search_hash(search_params)
-    saved: List[FlightDeal] = []
+    by_key: Dict[Tuple[Any, ...], FlightDeal] = {}
+    undated: List[Dict[str, Any]] = []
     for d in list(normalized_deals)[:limit]:
-        obj, _ = FlightDeal.objects.update_or_create(
+        departure = _parse_iso_dt(d.get('departure_datetime'))
+        if departure is None:
+            # NULLs never conflict on the unique constraint; upsert these one by one
+            undated.append(d)
+            continue
+        key = (d.get('origin_iata'), d.get('destination_iata'), departure)
+        # Later duplicates win, as they did with update_or_create
+        by_key[key] = FlightDeal(
+            search_hash=search_hash,
+            origin_iata=key[0],
+            destination_iata=key[1],
+            departure_datetime=departure,
+            **_deal_defaults(d),
+        )
+
+    # Rows about to be overwritten, as the fare buckets counted them
+    existing = {
+        (origin, destination, departure): fare_sample(origin, destination, one_way, departure, created, price, currency)
+        for origin, destination, departure, one_way, created, price, currency in (
+            FlightDeal.objects.filter(search_hash=search_hash, departure_datetime__isnull=False)
+            .values_list(
+                'origin_iata', 'destination_iata', 'departure_datetime', 'one_way_bool', 'created_at',
+                'price_total', 'currency',
+            )
+        )
+    }
+    saved: List[FlightDeal] = FlightDeal.objects.bulk_create(
+        list(by_key.values()),
+        batch_size=int(getattr(settings, 'PERSIST_BATCH_SIZE', 500)),
+        update_conflicts=True,
+        unique_fields=_NATURAL_KEY,
+        update_fields=_UPSERT_FIELDS,
+    )
+    created_rows = [obj for key, obj in by_key.items() if key not in existing]
+    added: List[FareSample] = []
+    removed: List[FareSample] = []
+    for key, obj in by_key.items():
+        old = existing.get(key)
+        new = fare_sample(
+            obj.origin_iata, obj.destination_iata, obj.one_way_bool, obj.departure_datetime, obj.created_at,
+            obj.price_total, obj.currency,
+        )
+        if old is not None and new is not None:
+            # An upsert keeps the row's created_at, and so its days-to-departure bucket
+            new = (new[0], old[1], new[2], new[3])
+        if old != new:
+            removed.extend([old] if old else [])
+            added.extend([new] if new else [])
+
+    for d in undated:
+        obj, created = FlightDeal.objects.update_or_create(
             search_hash=search_hash,
             origin_iata=d.get('origin_iata'),
             destination_iata=d.get('destination_iata'),
-            departure_datetime=_parse_iso_dt(d.get('departure_datetime')),
-            defaults={
-                'provider': d.get('provider') or 'amadeus',
-                'deep_link': d.get('deep_link'),
-                'one_way_bool': bool(d.get('one_way_bool')),
-                'return_datetime': _parse_iso_dt(d.get('return_datetime')),
-                'num_stops': int(d.get('num_stops') or 0),
-                'duration_minutes': int(d.get('duration_minutes') or 0),
-                'layover_minutes_max': int(d.get('layover_minutes_max') or 0),
-                'airline_codes': list(d.get('airline_codes') or []),
-                'cabin_class': d.get('cabin_class'),
-                'price_total': float(d.get('price_total') or 0.0),
-                'currency': d.get('currency') or 'USD',
-                'num_travelers': int(d.get('num_travelers') or 1),
-                'score_int_0_100': d.get('score_int_0_100'),
-                'score_factors_json': d.get('score_factors_json'),
-                'badges_json': d.get('badges_json'),
-            }
+            departure_datetime=None,
+            defaults=_deal_defaults(d),
         )
         saved.append(obj)
+        if created:
+            created_rows.append(obj)
+
+    inserted = len(created_rows)
+    updated = len(saved) - inserted
+    logger.info("persist_deals %s: %d inserted, %d updated", search_hash[:12], inserted, updated)
+    if stats is not None:
+        stats['inserted'] = inserted
+        stats['updated'] = updated
+
+    # Aggregates and leaderboards are brought up to date after the upsert commits, not under its write lock
+    deal_ids = [obj.pk for obj in saved]
+    transaction.on_commit(lambda: _after_persist(added, removed, deal_ids))
     return saved
 
 
-def fetch_top_deals(*, origin: Optional[str] = None, destination: Optional[str] = None, limit: int = 50) -> List[FlightDeal]:
-    qs = FlightDeal.objects.all().order_by('-score_int_0_100', '-created_at')
-    if origin:
-        qs = qs.filter(origin_iata=origin)
-    if destination:
-        qs = qs.filter(destination_iata=destination)
-    return list(qs[:limit])
+def _after_persist(added: List[FareSample], removed: List[FareSample], deal_ids: List[int]) -> None:
+    """Fold a committed persist into the fare aggregates and leaderboards, one short transaction each.
+
+    A step that fails is logged and skipped; its aggregate then lags
+    FlightDeal until rebuild_fare_buckets, reconcile_fare_sketches --rebuild
+    or rebuild_leaderboards is run.
+    """
+    steps = [
+        # The fares just written, minus the ones they repriced
+        ('fare buckets', lambda: fold_fare_buckets(added, removed)),
+        # Same changes; sketches don't split by trip type or days to departure
+        ('fare sketches', lambda: update_fare_sketches(
+            [(key[0], key[1], key[3], price) for key, _, price, _ in added],
+            [(key[0], key[1], key[3], price) for key, _, price, _ in removed],
+        )),
+    ]
+    if getattr(settings, 'LEADERBOARD_ENABLED', True):
+        steps.append(('leaderboards', lambda: update_leaderboards(deal_ids)))
+    for name, step in steps:
+        try:
+            with transaction.atomic():
+                step()
+        except Exception:
+            logger.exception("Updating %s after persist_deals failed", name)
+
+
+_AIRPORT_FIELDS = ['name', 'city', 'country', 'lat', 'lon', 'popularity']
 
 
+def upsert_airports(rows: Iterable[Dict[str, Any]], *, overwrite: bool = True, batch_size: int = 1000) -> int:
+    """Insert airports keyed on IATA code; existing rows are updated unless ``overwrite`` is False.
+
+    Rows are dicts with ``iata`` plus any of name, city, country, lat, lon and
+    popularity. Returns the number of rows sent to the database.
+    """
+    by_iata: Dict[str, Airport] = {}
+    for r in rows:
+        iata = str(r.get('iata') or '').strip().upper()
+        if len(iata) != 3:
+            continue
+        by_iata[iata] = Airport(
+            iata=iata,
+            name=str(r.get('name') or '')[:128],
+            city=str(r.get('city') or '')[:128],
+            country=str(r.get('country') or '')[:64],
+            lat=r.get('lat'),
+            lon=r.get('lon'),
+            popularity=int(r.get('popularity') or 0),
+        )
+    if overwrite:
+        Airport.objects.bulk_create(
+            list(by_iata.values()), batch_size=batch_size,
+            update_conflicts=True, unique_fields=['iata'], update_fields=_AIRPORT_FIELDS,
+        )
+    else:
+        Airport.objects.bulk_create(list(by_iata.values()), batch_size=batch_size, ignore_conflicts=True)
+    return len(by_iata)
+
+
+def fetch_top_deals(*, origin: Optional[str] = None, destination: Optional[str] = None, limit: int = 50) -> List[FlightDeal]:
+    return top_deals_page(origin=origin, destination=destination, limit=limit)[0]
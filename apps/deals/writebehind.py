@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, transaction
+
+from apps.common.locks import FileLock
+from apps.deals.models import SearchRequest
+from apps.deals.repository import persist_deals, record_search_request
+from apps.providers.records import DealRecord
+
+logger = logging.getLogger(__name__)
+
+JOB_SEARCH_REQUEST = 'search_request'
+JOB_DEALS = 'deals'
+
+
+class WriteBehindQueue:
+    """Batches SearchRequest and FlightDeal writes off the request path.
+
+    Jobs are appended to a per-process spool file before they are queued in
+    memory. Every worker adopts and replays the spools of dead workers when
+    it starts and then every ``orphan_scan_seconds``, so a batch that was
+    never flushed is written by a surviving worker. A background thread
+    flushes when ``max_batch`` jobs are queued or the oldest job is
+    ``flush_seconds`` old, whichever comes first. Spool segments are deleted
+    only after their jobs are committed.
+
+    A batch that fails on OperationalError (database locked or down) is
+    retried whole with backoff. Any other failure is retried one job at a
+    time, so one bad job can't hold back the rest. A job that fails
+    ``max_attempts`` times is moved to the dead-letter spool
+    (``dead/dead-letter.ndjson`` under the spool directory) and dropped.
+    """
+
+    def __init__(self, spool_dir: Optional[str] = None, max_batch: Optional[int] = None,
+                 flush_seconds: Optional[float] = None, max_attempts: Optional[int] = None,
+                 orphan_scan_seconds: Optional[float] = None):
+        self.spool_dir = Path(spool_dir or settings.WRITE_BEHIND_SPOOL_DIR)
+        self.max_batch = max_batch or int(getattr(settings, 'WRITE_BEHIND_MAX_BATCH', 50))
+        self.flush_seconds = flush_seconds or float(getattr(settings, 'WRITE_BEHIND_FLUSH_SECONDS', 2.0))
+        self.max_attempts = max_attempts or int(getattr(settings, 'WRITE_BEHIND_MAX_ATTEMPTS', 5))
+        self.orphan_scan_seconds = orphan_scan_seconds or float(getattr(settings, 'WRITE_BEHIND_ORPHAN_SCAN_SECONDS', 30.0))
+        self.dead_letter_path = self.spool_dir / 'dead' / 'dead-letter.ndjson'
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._jobs: Deque[Dict[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._owner_lock: Optional[FileLock] = None
+        self._segment_seq = 0
+        self._segment_fh = None
+        self._segment_path: Optional[Path] = None
+        # Spool files (ours or adopted) whose jobs are not committed yet
+        self._unacked: List[Path] = []
+        self._adopted_locks: List[FileLock] = []
+        self._counters = {
+            'enqueued': 0, 'flushed': 0, 'flushes': 0, 'failed_flushes': 0, 'replayed': 0,
+            'failed_jobs': 0, 'dead_lettered': 0,
+        }
+        self._last_flush_at: Optional[float] = None
+        self._consecutive_failures = 0
+        self._retry_at = 0.0
+        self._scan_at = 0.0
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            self._owner_lock = FileLock(self.spool_dir / f"{self.owner}.lock")
+            self._owner_lock.acquire()
+            self._replay_orphans()
+            self._open_segment()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _open_segment(self) -> None:
+        self._segment_seq += 1
+        self._segment_path = self.spool_dir / f"{self.owner}.{self._segment_seq:06d}.ndjson"
+        self._segment_fh = open(self._segment_path, 'a', encoding='utf-8')
+
+    def _rotate_segment(self) -> None:
+        # Caller holds self._cond; the closed segment now belongs to the batch in flight
+        if self._segment_fh is not None:
+            self._segment_fh.close()
+            self._unacked.append(self._segment_path)
+        self._open_segment()
+
+    def _replay_orphans(self) -> None:
+        # Caller holds self._cond
+        self._scan_at = time.time() + self.orphan_scan_seconds
+        owners = {p.name.split('.', 1)[0] for p in self.spool_dir.glob('*.ndjson')}
+        # Spools we adopted earlier and have not flushed yet are still locked by us
+        adopted = {lock.path.name[:-len('.lock')] for lock in self._adopted_locks}
+        replayed: List[Dict[str, Any]] = []
+        for owner in sorted(owners - adopted - {self.owner}):
+            lock = FileLock(self.spool_dir / f"{owner}.lock")
+            if not lock.acquire(timeout=0):
+                continue  # that worker is still alive and owns its spool
+            self._adopted_locks.append(lock)
+            for segment in sorted(self.spool_dir.glob(f"{owner}.*.ndjson")):
+                with open(segment, encoding='utf-8') as fh:
+                    for line in fh:
+                        try:
+                            replayed.append(json.loads(line))
+                        except ValueError:
+                            continue  # torn write from a crash
+                self._unacked.append(segment)
+        if replayed:
+            # Older than anything we queued ourselves, so they go first
+            self._jobs.extendleft(reversed(replayed))
+            self._counters['replayed'] += len(replayed)
+            logger.info("Write-behind replayed %d spooled jobs", len(replayed))
+
+    def _spool(self, job: Dict[str, Any]) -> None:
+        # Caller holds self._cond
+        self._segment_fh.write(json.dumps(job, ensure_ascii=False, default=str) + '\n')
+        self._segment_fh.flush()
+        if getattr(settings, 'WRITE_BEHIND_FSYNC', False):
+            os.fsync(self._segment_fh.fileno())
+
+    # ---------- producer API ----------
+    def enqueue(self, kind: str, payload: Dict[str, Any]) -> None:
+        self.start()
+        job = {'kind': kind, 'payload': payload, 'enqueued_at': time.time()}
+        with self._cond:
+            self._spool(job)
+            self._jobs.append(job)
+            self._counters['enqueued'] += 1
+            if len(self._jobs) >= self.max_batch:
+                self._cond.notify()
+
+    # ---------- consumer ----------
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=min(self._time_to_flush(), max(0.0, self._scan_at - time.time())))
+            if time.time() >= self._scan_at:
+                # Workers that died since we started; the flush lock keeps a flush off the adopted locks meanwhile
+                with self._flush_lock, self._cond:
+                    self._replay_orphans()
+            if self._due():
+                self.flush()
+
+    def _time_to_flush(self) -> float:
+        # Caller holds self._cond
+        if not self._jobs:
+            return self.flush_seconds
+        due_at = self._jobs[0]['enqueued_at'] + self.flush_seconds if len(self._jobs) < self.max_batch else 0.0
+        # During a retry backoff nothing is due before _retry_at
+        return max(0.05, max(due_at, self._retry_at) - time.time())
+
+    def _due(self) -> bool:
+        with self._cond:
+            if not self._jobs or time.time() < self._retry_at:
+                return False
+            return len(self._jobs) >= self.max_batch or time.time() - self._jobs[0]['enqueued_at'] >= self.flush_seconds
+
+    def flush(self) -> int:
+        """Commit every queued job now; returns the number of jobs written."""
+        with self._flush_lock:
+            with self._cond:
+                if not self._jobs:
+                    return 0
+                batch = list(self._jobs)
+                self._jobs.clear()
+                if self._segment_fh is not None:
+                    self._rotate_segment()
+                segments = list(self._unacked)
+            retry: List[Dict[str, Any]] = []
+            try:
+                self._write(batch)
+                written = len(batch)
+            except OperationalError:
+                # The database itself is unavailable; nothing to blame on any one job
+                logger.exception("Write-behind flush of %d jobs failed; will retry", len(batch))
+                with self._cond:
+                    self._jobs.extendleft(reversed(batch))
+                    self._counters['failed_flushes'] += 1
+                    self._backoff()
+                return 0
+            except Exception:
+                logger.exception("Write-behind flush of %d jobs failed; retrying jobs one by one", len(batch))
+                written, retry = self._write_each(batch)
+            finally:
+                close_old_connections()
+
+            with self._cond:
+                if retry:
+                    # Respool the survivors so the old segments can go; their committed jobs must not replay
+                    for job in retry:
+                        self._spool(job)
+                    self._jobs.extendleft(reversed(retry))
+                    self._counters['failed_flushes'] += 1
+                    self._backoff()
+                else:
+                    self._consecutive_failures = 0
+                    self._retry_at = 0.0
+                self._unacked = [p for p in self._unacked if p not in segments]
+                self._counters['flushed'] += written
+                self._counters['flushes'] += 1
+                self._last_flush_at = time.time()
+            for path in segments:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            self._release_adopted()
+            return written
+
+    def _backoff(self) -> None:
+        # Caller holds self._cond
+        self._consecutive_failures += 1
+        self._retry_at = time.time() + min(60.0, self.flush_seconds * 2 ** self._consecutive_failures)
+
+    def _write_each(self, batch: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+        """Write jobs one transaction each; returns (jobs written, jobs to retry)."""
+        written = 0
+        retry: List[Dict[str, Any]] = []
+        dead: List[Dict[str, Any]] = []
+        for job in batch:
+            try:
+                self._write([job])
+                written += 1
+            except OperationalError:
+                retry.append(job)
+            except Exception as e:
+                job['attempts'] = job.get('attempts', 0) + 1
+                job['error'] = repr(e)[:500]
+                if job['attempts'] >= self.max_attempts:
+                    dead.append(job)
+                else:
+                    retry.append(job)
+        with self._cond:
+            self._counters['failed_jobs'] += len(batch) - written
+        if dead:
+            self._dead_letter(dead)
+        return written, retry
+
+    def _dead_letter(self, jobs: List[Dict[str, Any]]) -> None:
+        self.dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as fh:
+            for job in jobs:
+                fh.write(json.dumps(job, ensure_ascii=False, default=str) + '\n')
+            fh.flush()
+            os.fsync(fh.fileno())
+        with self._cond:
+            self._counters['dead_lettered'] += len(jobs)
+        for job in jobs:
+            logger.error(
+                "Write-behind dropped a %s job after %d attempts (%s); kept in %s",
+                job['kind'], job['attempts'], job['error'], self.dead_letter_path,
+            )
+
+    def _release_adopted(self) -> None:
+        if self._unacked or not self._adopted_locks:
+            return
+        for lock in self._adopted_locks:
+            lock.release()
+            try:
+                lock.path.unlink()
+            except FileNotFoundError:
+                pass
+        self._adopted_locks = []
+
+    @transaction.atomic
+    def _write(self, batch: Iterable[Dict[str, Any]]) -> None:
+        requests: List[SearchRequest] = []
+        for job in batch:
+            payload = job['payload']
+            if job['kind'] == JOB_SEARCH_REQUEST:
+                requests.append(SearchRequest(
+                    params_json=payload['params'],
+                    user_agent=payload.get('user_agent') or '',
+                    ip_hash=payload.get('ip_hash') or '',
+                ))
+            elif job['kind'] == JOB_DEALS:
+                persist_deals(payload['deals'], search_params=payload['search_params'], limit=payload['limit'])
+        if requests:
+            SearchRequest.objects.bulk_create(requests)
+
+    # ---------- observability ----------
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = len(self._jobs)
+            oldest = self._jobs[0]['enqueued_at'] if self._jobs else None
+            counters = dict(self._counters)
+            last_flush_at = self._last_flush_at
+        now = time.time()
+        return {
+            **counters,
+            'depth': depth,
+            'lag_seconds': round(now - oldest, 3) if oldest else 0.0,
+            'seconds_since_flush': round(now - last_flush_at, 3) if last_flush_at else None,
+            'running': self._thread is not None,
+        }
+
+
+_queue: Optional[WriteBehindQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = WriteBehindQueue()
+        return _queue
+
+
+def _write_behind_enabled() -> bool:
+    return getattr(settings, 'PERSIST_MODE', 'write_behind') == 'write_behind'
+
+
+def submit_search_request(params: Dict[str, Any], user_agent: Optional[str], ip_hash: Optional[str]) -> None:
+    """Record a search request, deferred to the write-behind queue unless PERSIST_MODE is 'sync'."""
+    if not _write_behind_enabled():
+        record_search_request(params, user_agent=user_agent, ip_hash=ip_hash)
+        return
+    get_write_behind_queue().enqueue(JOB_SEARCH_REQUEST, {'params': params, 'user_agent': user_agent, 'ip_hash': ip_hash})
+
+
+def submit_deals(deals: Iterable[Dict[str, Any]], search_params: Dict[str, Any], limit: int = 50) -> None:
+    """Persist a search's deals, deferred to the write-behind queue unless PERSIST_MODE is 'sync'."""
+    if not _write_behind_enabled():
+        persist_deals(deals, search_params=search_params, limit=limit)
+        return
+    get_write_behind_queue().enqueue(JOB_DEALS, {
+        'deals': [d.to_dict() if isinstance(d, DealRecord) else dict(d) for d in list(deals)[:limit]],
+        'search_params': search_params,
+        'limit': limit,
+    })
+
+
+def write_behind_stats() -> Dict[str, Any]:
+    if not _write_behind_enabled():
+        return {'mode': 'sync'}
+    return {'mode': 'write_behind', **get_write_behind_queue().stats()}
@@ -1,12 +1,24 @@
 from __future__ import annotations
 
+import heapq
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 from datetime import datetime, timedelta
 from statistics import median
-from typing import Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
+from django.conf import settings
 from django.db.models import Q
+from django.utils import timezone
 
-from apps.deals.models import FlightDeal
+from apps.deals.models import FareHistoryBucket, FlightDeal
+from apps.pricing.buckets import ALL_DTD_BUCKET, days_to_departure_bucket, month_bucket
+from apps.pricing.sketch import load_sketches
+
+# Same caps as the per-deal queries so batch and per-deal baselines agree
+BASELINE_WINDOW_DAYS = 30
+BASELINE_FALLBACK_DAYS = 90
+BASELINE_MAX_SAMPLES = 500
 
 
 def _safe_date(dt_iso: Optional[str]) -> Optional[datetime]:
@@ -18,6 +30,12 @@ def _safe_date(dt_iso: Optional[str]) -> Optional[datetime]:
         return None
 
 
+def _deal_departure(deal: Any) -> Optional[datetime]:
+    # DealRecords carry the parsed time; plain deal dicts only the ISO string
+    dep_dt = getattr(deal, 'departure_dt', None)
+    return dep_dt if dep_dt is not None else _safe_date(deal.get('departure_datetime'))
+
+
 def compute_baseline_for_deal(
     *, origin: str, destination: str, departure_iso: Optional[str], currency_hint: Optional[str] = None
 ) -> Tuple[Optional[float], Optional[float]]:
@@ -28,16 +46,16 @@ def compute_baseline_for_deal(
     dep_dt = _safe_date(departure_iso)
     if not dep_dt:
         # Use last 90 days deals for route
-        window_start = datetime.utcnow() - timedelta(days=90)
+        window_start = datetime.utcnow() - timedelta(days=BASELINE_FALLBACK_DAYS)
         qs = (
             FlightDeal.objects.filter(origin_iata=origin, destination_iata=destination, created_at__gte=window_start)
             .order_by('-created_at')
-            .values_list('price_total', flat=True)[:500]
+            .values_list('price_total', flat=True)[:BASELINE_MAX_SAMPLES]
         )
     else:
         # Use deals within +/- 30 days around the departure date for the same route
-        start = dep_dt - timedelta(days=30)
-        end = dep_dt + timedelta(days=30)
+        start = dep_dt - timedelta(days=BASELINE_WINDOW_DAYS)
+        end = dep_dt + timedelta(days=BASELINE_WINDOW_DAYS)
         qs = (
             FlightDeal.objects.filter(
                 origin_iata=origin,
@@ -46,7 +64,7 @@ def compute_baseline_for_deal(
                 departure_datetime__lte=end,
             )
             .order_by('-created_at')
-            .values_list('price_total', flat=True)[:500]
+            .values_list('price_total', flat=True)[:BASELINE_MAX_SAMPLES]
         )
 
     prices = [float(p) for p in qs if p is not None]
@@ -56,6 +74,182 @@ def compute_baseline_for_deal(
     return base, None
 
 
+def _as_aware(dt: datetime) -> datetime:
+    # Mirror how the ORM treats naive datetimes in lookups (default time zone)
+    if timezone.is_naive(dt):
+        return timezone.make_aware(dt, timezone.get_default_timezone())
+    return dt
+
+
+def _median_of_newest(rows: List[Tuple[datetime, datetime, float]]) -> Optional[float]:
+    # rows are (departure, created_at, price); keep the newest samples like the ORM slice does
+    if len(rows) > BASELINE_MAX_SAMPLES:
+        rows = heapq.nlargest(BASELINE_MAX_SAMPLES, rows, key=lambda r: r[1])
+    prices = [float(r[2]) for r in rows if r[2] is not None]
+    if not prices:
+        return None
+    return float(median(prices))
+
+
+def _route_baselines(origin: str, destination: str, departures: List[Optional[datetime]]) -> List[Optional[float]]:
+    results: List[Optional[float]] = [None] * len(departures)
+    dated = [(i, _as_aware(dt)) for i, dt in enumerate(departures) if dt is not None]
+    undated = [i for i, dt in enumerate(departures) if dt is None]
+
+    if dated:
+        window = timedelta(days=BASELINE_WINDOW_DAYS)
+        lo = min(dt for _, dt in dated) - window
+        hi = max(dt for _, dt in dated) + window
+        rows = sorted(
+            FlightDeal.objects.filter(
+                origin_iata=origin,
+                destination_iata=destination,
+                departure_datetime__gte=lo,
+                departure_datetime__lte=hi,
+            ).values_list('departure_datetime', 'created_at', 'price_total'),
+            key=lambda r: r[0],
+        )
+        deps = [r[0] for r in rows]
+        for i, dt in dated:
+            left = bisect_left(deps, dt - window)
+            right = bisect_right(deps, dt + window)
+            results[i] = _median_of_newest(rows[left:right])
+
+    if undated:
+        baseline, _ = compute_baseline_for_deal(origin=origin, destination=destination, departure_iso=None)
+        for i in undated:
+            results[i] = baseline
+    return results
+
+
+def compute_baselines_for_deals(deals: List[Dict[str, Any]]) -> List[Optional[float]]:
+    """Baselines for a whole result set with one price-history query per route.
+
+    Matches compute_baseline_for_deal deal for deal: each deal's ±30-day
+    window is cut out of the route's history in memory with bisect.
+    """
+    by_route: Dict[Tuple[Any, Any], List[int]] = defaultdict(list)
+    for i, d in enumerate(deals):
+        by_route[(d.get('origin_iata'), d.get('destination_iata'))].append(i)
+
+    baselines: List[Optional[float]] = [None] * len(deals)
+    for (origin, destination), indexes in by_route.items():
+        departures = [_deal_departure(deals[i]) for i in indexes]
+        for i, baseline in zip(indexes, _route_baselines(origin, destination, departures)):
+            baselines[i] = baseline
+    return baselines
+
+
+def compute_baselines_from_buckets(deals: List[Dict[str, Any]]) -> List[Optional[float]]:
+    """Baselines read from FareHistoryBucket: one bucket row per deal.
+
+    Uses the deal's days-to-departure bucket when it has enough samples,
+    otherwise the month's aggregate bucket.
+    """
+    min_samples = int(getattr(settings, 'BASELINE_BUCKET_MIN_SAMPLES', 5))
+    now = timezone.now()
+    keys: List[Optional[Tuple[Any, Any, bool, str, str]]] = []
+    months_by_route: Dict[Tuple[Any, Any], set] = defaultdict(set)
+    for d in deals:
+        dep_dt = _deal_departure(d)
+        if dep_dt is None:
+            keys.append(None)
+            continue
+        month = month_bucket(dep_dt)
+        keys.append((
+            d.get('origin_iata'), d.get('destination_iata'), bool(d.get('one_way_bool')),
+            month, days_to_departure_bucket(now, dep_dt),
+        ))
+        months_by_route[(d.get('origin_iata'), d.get('destination_iata'))].add(month)
+
+    buckets: Dict[Tuple[Any, Any, bool, str, str], Tuple[Optional[float], int]] = {}
+    for (origin, destination), months in months_by_route.items():
+        for b in FareHistoryBucket.objects.filter(
+            origin_iata=origin, destination_iata=destination, month_bucket__in=months
+        ).only('one_way_bool', 'month_bucket', 'days_to_departure_bucket', 'median_price', 'sample_size'):
+            buckets[(origin, destination, b.one_way_bool, b.month_bucket, b.days_to_departure_bucket)] = (
+                b.median_price, b.sample_size,
+            )
+
+    baselines: List[Optional[float]] = []
+    for d, key in zip(deals, keys):
+        if key is None:
+            baselines.append(compute_baseline_for_deal(
+                origin=d.get('origin_iata'), destination=d.get('destination_iata'), departure_iso=None
+            )[0])
+            continue
+        median_price, sample_size = buckets.get(key, (None, 0))
+        if median_price is None or sample_size < min_samples:
+            median_price, _ = buckets.get(key[:4] + (ALL_DTD_BUCKET,), (None, 0))
+        baselines.append(median_price)
+    return baselines
+
+
+def compute_baselines_from_sketches(
+    deals: List[Dict[str, Any]], percentiles: Optional[List[Optional[float]]] = None,
+) -> List[Optional[float]]:
+    """Baselines read from the per route-month quantile sketches.
+
+    One sketch row per route and departure month, whatever the route's
+    history size. The quantile is BASELINE_SKETCH_QUANTILE (median by default).
+    When ``percentiles`` is given it receives, per deal, the share of the
+    route-month's stored fares at or below the deal's price (None when the
+    baseline is None).
+    """
+    q = float(getattr(settings, 'BASELINE_SKETCH_QUANTILE', 0.5))
+    min_samples = int(getattr(settings, 'BASELINE_BUCKET_MIN_SAMPLES', 5))
+    months: List[Optional[str]] = []
+    months_by_route: Dict[Tuple[Any, Any], set] = defaultdict(set)
+    for d in deals:
+        dep_dt = _deal_departure(d)
+        month = month_bucket(dep_dt) if dep_dt else None
+        months.append(month)
+        if month:
+            months_by_route[(d.get('origin_iata'), d.get('destination_iata'))].add(month)
+
+    sketches = {
+        route: load_sketches(route[0], route[1], route_months)
+        for route, route_months in months_by_route.items()
+    }
+    baselines: List[Optional[float]] = []
+    for d, month in zip(deals, months):
+        route = (d.get('origin_iata'), d.get('destination_iata'))
+        sketch = sketches.get(route, {}).get(month) if month else None
+        if percentiles is not None:
+            usable = sketch is not None and sketch.count >= min_samples
+            percentiles.append(round(sketch.rank(d.get('price_total') or 0.0), 4) if usable else None)
+        if month is None:
+            baselines.append(compute_baseline_for_deal(origin=route[0], destination=route[1], departure_iso=None)[0])
+            continue
+        if sketch is None or sketch.count < min_samples:
+            baselines.append(None)
+            continue
+        baselines.append(sketch.median() if q == 0.5 else sketch.quantile(q))
+    return baselines
+
+
+def compute_baselines(
+    deals: List[Dict[str, Any]], percentiles: Optional[List[Optional[float]]] = None,
+) -> List[Optional[float]]:
+    """Baselines for ``deals`` using the strategy selected by BASELINE_MODE.
+
+    ``percentiles`` is only filled in ``sketch`` mode; see compute_baselines_from_sketches.
+    """
+    mode = getattr(settings, 'BASELINE_MODE', 'batch')
+    if mode == 'per_deal':
+        return [
+            compute_baseline_for_deal(
+                origin=d.get('origin_iata'), destination=d.get('destination_iata'), departure_iso=d.get('departure_datetime')
+            )[0]
+            for d in deals
+        ]
+    if mode == 'buckets':
+        return compute_baselines_from_buckets(deals)
+    if mode == 'sketch':
+        return compute_baselines_from_sketches(deals, percentiles)
+    return compute_baselines_for_deals(deals)
+
+
 def pct_drop_from_baseline(current_price: float, baseline: Optional[float]) -> Optional[float]:
     if baseline is None or baseline <= 0:
         return None
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timezone as dt_timezone
+from statistics import mean, median, pstdev
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.deals.models import FareHistoryBucket, FlightDeal
+from apps.pricing.sketch import QuantileSketch
+
+# Days-to-departure buckets: (min_days, max_days or None, label)
+DTD_BUCKETS = [
+    (0, 7, '0-7'),
+    (8, 14, '8-14'),
+    (15, 30, '15-30'),
+    (31, 60, '31-60'),
+    (61, 120, '61-120'),
+    (121, None, '121+'),
+]
+# Aggregate over every days-to-departure bucket of the month
+ALL_DTD_BUCKET = 'all'
+
+# (origin, destination, one_way, YYYY-MM)
+BucketMonthKey = Tuple[str, str, bool, str]
+# One stored fare: (route-month, days-to-departure bucket, price, currency)
+FareSample = Tuple[BucketMonthKey, str, float, str]
+
+_STAT_FIELDS = [
+    'median_price', 'mean_price', 'std_price', 'sample_size', 'price_sum', 'price_sum_sq', 'price_sketch',
+]
+
+
+def _utc(dt: datetime) -> datetime:
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, timezone.get_default_timezone())
+    return dt.astimezone(dt_timezone.utc)
+
+
+def month_bucket(departure: datetime) -> str:
+    return _utc(departure).strftime('%Y-%m')
+
+
+def month_bounds(month: str) -> Tuple[datetime, datetime]:
+    """UTC [start, end) of a YYYY-MM bucket."""
+    year, mon = (int(x) for x in month.split('-'))
+    start = datetime(year, mon, 1, tzinfo=dt_timezone.utc)
+    end = datetime(year + (mon // 12), mon % 12 + 1, 1, tzinfo=dt_timezone.utc)
+    return start, end
+
+
+def days_to_departure_bucket(observed_at: datetime, departure: datetime) -> str:
+    days = max(0, (_utc(departure).date() - _utc(observed_at).date()).days)
+    for low, high, label in DTD_BUCKETS:
+        if days >= low and (high is None or days <= high):
+            return label
+    return DTD_BUCKETS[-1][2]
+
+
+def fare_sample(
+    origin: str, destination: str, one_way: bool, departure: Optional[datetime], observed_at: Optional[datetime],
+    price: Optional[float], currency: Optional[str],
+) -> Optional[FareSample]:
+    """The bucket sample a FlightDeal row contributes (None without a departure or price)."""
+    if departure is None or price is None:
+        return None
+    key = (origin, destination, bool(one_way), month_bucket(departure))
+    return key, days_to_departure_bucket(observed_at or departure, departure), float(price), currency or 'USD'
+
+
+def _new_sketch() -> QuantileSketch:
+    return QuantileSketch(float(getattr(settings, 'FARE_SKETCH_ALPHA', 0.01)))
+
+
+def _stats(prices: List[float]) -> Dict[str, Any]:
+    sketch = _new_sketch()
+    for price in prices:
+        sketch.add(price)
+    return {
+        'median_price': float(median(prices)),
+        'mean_price': float(mean(prices)),
+        'std_price': float(pstdev(prices)) if len(prices) > 1 else 0.0,
+        'sample_size': len(prices),
+        'price_sum': float(sum(prices)),
+        'price_sum_sq': float(sum(p * p for p in prices)),
+        'price_sketch': sketch.to_bytes(),
+    }
+
+
+def _running_stats(count: int, total: float, total_sq: float, sketch: QuantileSketch) -> Dict[str, Any]:
+    mean_price = total / count
+    return {
+        'median_price': sketch.median(),
+        'mean_price': mean_price,
+        'std_price': math.sqrt(max(0.0, total_sq / count - mean_price * mean_price)) if count > 1 else 0.0,
+        'sample_size': count,
+        'price_sum': total,
+        'price_sum_sq': total_sq,
+        'price_sketch': sketch.to_bytes(),
+    }
+
+
+def _month_buckets(key: BucketMonthKey) -> Dict[str, FareHistoryBucket]:
+    origin, destination, one_way, month = key
+    return {
+        b.days_to_departure_bucket: b
+        for b in FareHistoryBucket.objects.filter(
+            origin_iata=origin, destination_iata=destination, one_way_bool=one_way, month_bucket=month
+        )
+    }
+
+
+@transaction.atomic
+def fold_fare_buckets(added: Iterable[FareSample], removed: Iterable[FareSample] = ()) -> int:
+    """Fold newly stored fares into their buckets and take out the fares they replaced.
+
+    Buckets keep a count, sum and sum of squares (exact mean and std) and
+    a quantile sketch (median within FARE_SKETCH_ALPHA), so the cost
+    follows the fares written, not the route's history. A month holding a
+    bucket built before those aggregates existed is recomputed from
+    FlightDeal instead, once. Returns the number of bucket rows written.
+    """
+    deltas: Dict[Tuple[BucketMonthKey, str], Tuple[List[float], List[float]]] = defaultdict(lambda: ([], []))
+    currencies: Dict[BucketMonthKey, Counter] = defaultdict(Counter)
+    for side, samples in ((0, added), (1, removed)):
+        for key, label, price, currency in samples:
+            deltas[(key, label)][side].append(price)
+            deltas[(key, ALL_DTD_BUCKET)][side].append(price)
+            if side == 0:
+                currencies[key][currency] += 1
+
+    existing = {key: _month_buckets(key) for key in {key for key, _ in deltas}}
+    legacy = {
+        key for key, buckets in existing.items()
+        if any(b.price_sketch is None or b.price_sum is None for b in buckets.values())
+    }
+    to_create: List[FareHistoryBucket] = []
+    to_update: List[FareHistoryBucket] = []
+    to_delete: List[int] = []
+    for (key, label), (adds, removes) in deltas.items():
+        if key in legacy:
+            continue
+        bucket = existing[key].get(label)
+        if bucket is None:
+            if not adds:
+                continue
+            origin, destination, one_way, month = key
+            bucket = FareHistoryBucket(
+                origin_iata=origin, destination_iata=destination, one_way_bool=one_way, month_bucket=month,
+                days_to_departure_bucket=label, currency=currencies[key].most_common(1)[0][0],
+                sample_size=0, price_sum=0.0, price_sum_sq=0.0,
+            )
+            sketch = _new_sketch()
+        else:
+            sketch = QuantileSketch.from_bytes(bucket.price_sketch)
+        count, total, total_sq = bucket.sample_size, bucket.price_sum, bucket.price_sum_sq
+        for price in adds:
+            sketch.add(price)
+            count, total, total_sq = count + 1, total + price, total_sq + price * price
+        for price in removes:
+            sketch.remove(price)
+            count, total, total_sq = count - 1, total - price, total_sq - price * price
+        if count <= 0:
+            if bucket.pk is not None:
+                to_delete.append(bucket.pk)
+            continue
+        for name, value in _running_stats(count, total, total_sq, sketch).items():
+            setattr(bucket, name, value)
+        if bucket.pk is None:
+            to_create.append(bucket)
+        else:
+            bucket.updated_at = timezone.now()
+            to_update.append(bucket)
+    FareHistoryBucket.objects.bulk_create(to_create)
+    FareHistoryBucket.objects.bulk_update(to_update, _STAT_FIELDS + ['updated_at'])
+    if to_delete:
+        FareHistoryBucket.objects.filter(pk__in=to_delete).delete()
+    written = len(to_create) + len(to_update)
+    if legacy:
+        written += refresh_fare_buckets(legacy)
+    return written
+
+
+@transaction.atomic
+def refresh_fare_buckets(keys: Iterable[BucketMonthKey]) -> int:
+    """Recompute the buckets of the given route-months from FlightDeal rows.
+
+    Scans every row of each month; persists use fold_fare_buckets instead.
+    Returns the number of bucket rows written.
+    """
+    written = 0
+    for origin, destination, one_way, month in set(keys):
+        start, end = month_bounds(month)
+        rows = FlightDeal.objects.filter(
+            origin_iata=origin,
+            destination_iata=destination,
+            one_way_bool=one_way,
+            departure_datetime__gte=start,
+            departure_datetime__lt=end,
+        ).values_list('departure_datetime', 'created_at', 'price_total', 'currency')
+
+        prices: Dict[str, List[float]] = defaultdict(list)
+        currencies: Counter = Counter()
+        for departure, created_at, price, currency in rows:
+            if price is None:
+                continue
+            label = days_to_departure_bucket(created_at or departure, departure)
+            prices[label].append(float(price))
+            prices[ALL_DTD_BUCKET].append(float(price))
+            currencies[currency or 'USD'] += 1
+        currency = currencies.most_common(1)[0][0] if currencies else 'USD'
+
+        existing = _month_buckets((origin, destination, one_way, month))
+        to_create: List[FareHistoryBucket] = []
+        to_update: List[FareHistoryBucket] = []
+        for label, values in prices.items():
+            fields = {**_stats(values), 'currency': currency}
+            bucket = existing.pop(label, None)
+            if bucket is None:
+                to_create.append(FareHistoryBucket(
+                    origin_iata=origin,
+                    destination_iata=destination,
+                    one_way_bool=one_way,
+                    month_bucket=month,
+                    days_to_departure_bucket=label,
+                    **fields,
+                ))
+            else:
+                for name, value in fields.items():
+                    setattr(bucket, name, value)
+                bucket.updated_at = timezone.now()
+                to_update.append(bucket)
+        FareHistoryBucket.objects.bulk_create(to_create)
+        FareHistoryBucket.objects.bulk_update(to_update, _STAT_FIELDS + ['currency', 'updated_at'])
+        if existing:
+            # Buckets whose rows moved away or were deleted
+            FareHistoryBucket.objects.filter(pk__in=[b.pk for b in existing.values()]).delete()
+        written += len(to_create) + len(to_update)
+    return written
+
+
+def rebuild_fare_buckets() -> int:
+    """Drop every bucket and rebuild them from the full FlightDeal history."""
+    keys: Set[BucketMonthKey] = set()
+    for origin, destination, one_way, departure in (
+        FlightDeal.objects.exclude(departure_datetime__isnull=True)
+        .values_list('origin_iata', 'destination_iata', 'one_way_bool', 'departure_datetime')
+        .iterator()
+    ):
+        keys.add((origin, destination, bool(one_way), month_bucket(departure)))
+    FareHistoryBucket.objects.all().delete()
+    return refresh_fare_buckets(keys)
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import math
+import struct
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from apps.deals.models import FlightDeal, RouteFareSketch
+
+_HEADER = struct.Struct('<BdQQddI')  # version, alpha, count, zero_count, min, max, nbins
+_BIN = struct.Struct('<iI')  # bin index, count
+_VERSION = 1
+
+# (origin, destination, YYYY-MM)
+SketchKey = Tuple[str, str, str]
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative-error guarantees (DDSketch).
+
+    Values fall into logarithmic bins of ratio gamma = (1+alpha)/(1-alpha), so
+    any quantile is returned within ``alpha`` relative error of a true sample
+    value of that rank. Bins are plain counts, so samples can be taken out
+    again when a fare is repriced. Non-positive values are counted in a
+    separate zero bin.
+    """
+
+    __slots__ = ('alpha', 'gamma', '_log_gamma', 'bins', 'count', 'zero_count', 'min', 'max')
+
+    def __init__(self, alpha: float = 0.01):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.count = 0
+        self.zero_count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, weight: int = 1) -> None:
+        value = float(value)
+        if value <= 0:
+            self.zero_count += weight
+        else:
+            idx = int(math.ceil(math.log(value) / self._log_gamma))
+            self.bins[idx] = self.bins.get(idx, 0) + weight
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def remove(self, value: float, weight: int = 1) -> None:
+        """Take out samples added earlier, e.g. a fare that was repriced. min and max stay as they were."""
+        value = float(value)
+        if value <= 0:
+            weight = min(weight, self.zero_count)
+            self.zero_count -= weight
+        else:
+            idx = int(math.ceil(math.log(value) / self._log_gamma))
+            weight = min(weight, self.bins.get(idx, 0))
+            if self.bins.get(idx, 0) > weight:
+                self.bins[idx] -= weight
+            else:
+                self.bins.pop(idx, None)
+        self.count -= weight
+
+    def _bin_value(self, idx: int) -> float:
+        return 2 * self.gamma ** idx / (self.gamma + 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        return self._at(q * (self.count - 1))
+
+    def median(self) -> Optional[float]:
+        """The median, averaging the two middle samples of an even count like ``statistics.median``."""
+        if self.count == 0:
+            return None
+        mid = (self.count - 1) / 2
+        return (self._at(math.floor(mid)) + self._at(math.ceil(mid))) / 2
+
+    def _at(self, rank: float) -> float:
+        # Value of the sample at 0-based ``rank`` in sorted order
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for idx in sorted(self.bins):
+            seen += self.bins[idx]
+            if seen > rank:
+                return min(self.max, max(self.min, self._bin_value(idx)))
+        return self.max
+
+    def rank(self, value: float) -> Optional[float]:
+        """Approximate fraction of samples at or below ``value`` (percentile / 100)."""
+        if self.count == 0:
+            return None
+        if value <= 0:
+            return self.zero_count / self.count
+        limit = int(math.ceil(math.log(float(value)) / self._log_gamma))
+        below = self.zero_count + sum(cnt for idx, cnt in self.bins.items() if idx <= limit)
+        return below / self.count
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(_VERSION, self.alpha, self.count, self.zero_count, self.min, self.max, len(self.bins))]
+        parts.extend(_BIN.pack(idx, cnt) for idx, cnt in sorted(self.bins.items()))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> 'QuantileSketch':
+        blob = bytes(blob)
+        version, alpha, count, zero_count, vmin, vmax, nbins = _HEADER.unpack_from(blob, 0)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported sketch version {version}")
+        sketch = cls(alpha)
+        sketch.count, sketch.zero_count, sketch.min, sketch.max = count, zero_count, vmin, vmax
+        offset = _HEADER.size
+        for _ in range(nbins):
+            idx, cnt = _BIN.unpack_from(blob, offset)
+            sketch.bins[idx] = cnt
+            offset += _BIN.size
+        return sketch
+
+
+def _alpha() -> float:
+    return float(getattr(settings, 'FARE_SKETCH_ALPHA', 0.01))
+
+
+def load_sketches(origin: str, destination: str, months: Iterable[str]) -> Dict[str, QuantileSketch]:
+    return {
+        row.month_bucket: QuantileSketch.from_bytes(row.sketch)
+        for row in RouteFareSketch.objects.filter(
+            origin_iata=origin, destination_iata=destination, month_bucket__in=list(months)
+        )
+    }
+
+
+@transaction.atomic
+def update_fare_sketches(
+    observations: Iterable[Tuple[str, str, str, float]], removed: Iterable[Tuple[str, str, str, float]] = (),
+) -> int:
+    """Fold new (origin, destination, month, price) samples into the stored sketches.
+
+    ``removed`` takes out samples added earlier, e.g. the old price of a
+    repriced fare, so sketches follow upserts as well as inserts.
+    """
+    added: Dict[SketchKey, List[float]] = defaultdict(list)
+    taken: Dict[SketchKey, List[float]] = defaultdict(list)
+    for samples, grouped in ((observations, added), (removed, taken)):
+        for origin, destination, month, price in samples:
+            if price is not None:
+                grouped[(origin, destination, month)].append(float(price))
+    keys = set(added) | set(taken)
+    for origin, destination, month in keys:
+        row = (
+            RouteFareSketch.objects.select_for_update()
+            .filter(origin_iata=origin, destination_iata=destination, month_bucket=month)
+            .first()
+        )
+        sketch = QuantileSketch.from_bytes(row.sketch) if row else QuantileSketch(_alpha())
+        for price in added.get((origin, destination, month), ()):
+            sketch.add(price)
+        for price in taken.get((origin, destination, month), ()):
+            sketch.remove(price)
+        if row is None:
+            RouteFareSketch.objects.create(
+                origin_iata=origin, destination_iata=destination, month_bucket=month,
+                sketch=sketch.to_bytes(), sample_size=sketch.count,
+            )
+        else:
+            row.sketch = sketch.to_bytes()
+            row.sample_size = sketch.count
+            row.save(update_fields=['sketch', 'sample_size', 'updated_at'])
+    return len(keys)
+
+
+def rebuild_fare_sketches() -> int:
+    """Rebuild every sketch from the FlightDeal history."""
+    # Imported here: the fare buckets keep QuantileSketches of their own
+    from apps.pricing.buckets import month_bucket
+
+    observations = [
+        (origin, destination, month_bucket(departure), price)
+        for origin, destination, departure, price in (
+            FlightDeal.objects.exclude(departure_datetime__isnull=True)
+            .values_list('origin_iata', 'destination_iata', 'departure_datetime', 'price_total')
+            .iterator()
+        )
+    ]
+    with transaction.atomic():
+        RouteFareSketch.objects.all().delete()
+        return update_fare_sketches(observations)
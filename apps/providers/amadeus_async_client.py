@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from django.conf import settings
+
+from apps.providers.amadeus_client import (
+    AmadeusApiError,
+    AmadeusClient,
+    OAuthToken,
+    _after_failure,
+    get_amadeus_client,
+)
+from apps.providers.ratelimit import RETRY_STATUSES, TokenBucket, get_rate_limiter, max_wait_seconds
+
+
+class AsyncAmadeusClient:
+    """asyncio counterpart of AmadeusClient built on httpx.AsyncClient.
+
+    Shares the sync client's TokenStore, so both paths (and every worker) use
+    one OAuth token. Token refreshes are rare and run on a thread through the
+    sync client's coalesced refresh. Everything else is non-blocking.
+    """
+
+    def __init__(self, sync_client: Optional[AmadeusClient] = None):
+        self._sync = sync_client or get_amadeus_client()
+        self.base_url = self._sync.base_url
+        max_connections = int(getattr(settings, 'AMADEUS_ASYNC_MAX_CONNECTIONS', 64))
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        # Excess requests wait here rather than in httpcore's pool, whose
+        # bookkeeping grows with (queued requests x connections)
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def _get_token(self) -> OAuthToken:
+        token = self._sync._token_store.peek()
+        if token is not None:
+            return token
+        return await asyncio.to_thread(self._sync._get_token)
+
+    async def _take_slot(self, limiter: Optional[TokenBucket]) -> None:
+        if limiter is not None and await limiter.aacquire(timeout=max_wait_seconds()) is None:
+            raise AmadeusApiError(429, "No request slot within the client-side rate limit")
+
+    async def _send(self, method: str, url: str, limiter: Optional[TokenBucket], **kwargs: Any) -> httpx.Response:
+        token = await self._get_token()
+        headers = {**kwargs.pop('headers', {}), "Authorization": f"Bearer {token.access_token}", "Accept": "application/json"}
+        async with self._slots:
+            resp = await self._http.request(method, url, headers=headers, **kwargs)
+        if resp.status_code == 401:
+            self._sync._token_store.invalidate(token)
+            headers["Authorization"] = f"Bearer {(await self._get_token()).access_token}"
+            await self._take_slot(limiter)
+            async with self._slots:
+                resp = await self._http.request(method, url, headers=headers, **kwargs)
+        return resp
+
+    async def _request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        # Same rate limit, lanes and retry policy as AmadeusClient._request
+        limiter = get_rate_limiter(self.base_url, self._sync.api_key)
+        attempts = 1 + max(0, int(getattr(settings, 'AMADEUS_RETRY_ATTEMPTS', 3)))
+        for attempt in range(attempts):
+            await self._take_slot(limiter)
+            resp = await self._send(method, url, limiter, **kwargs)
+            if resp.status_code not in RETRY_STATUSES:
+                return resp
+            failure = (limiter, resp.status_code, resp.headers.get('Retry-After'), attempt, attempts)
+            if resp.status_code == 429 and limiter is not None and limiter.path is not None:
+                # Pausing a shared bucket writes its state file; keep that off the event loop
+                delay = await asyncio.to_thread(_after_failure, *failure)
+            else:
+                delay = _after_failure(*failure)
+            if delay is None:
+                return resp
+            await asyncio.sleep(delay)
+        return resp
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None, timeout: int = 20) -> Any:
+        resp = await self._request("GET", f"{self.base_url}{path}", params=params or {}, timeout=timeout)
+        if resp.status_code >= 400:
+            raise AmadeusApiError(resp.status_code, resp.text)
+        if resp.status_code == 204:
+            return None
+        return resp.json()
+
+    async def search_flight_offers(self, **kwargs: Any) -> Any:
+        params = {k: v for k, v in kwargs.items() if v is not None}
+        return await self.get("/v2/shopping/flight-offers", params=params)
+
+    async def flight_destinations(self, **kwargs: Any) -> Any:
+        params = {k: v for k, v in kwargs.items() if v is not None}
+        return await self.get("/v1/shopping/flight-destinations", params=params)
+
+    async def search_locations(self, *, keyword: str, subType: str = "AIRPORT", limit: int = 10) -> Any:
+        params = {"keyword": keyword, "subType": subType, "page[limit]": min(limit, 20)}
+        return await self.get("/v1/reference-data/locations", params=params)
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+# httpx connection pools are bound to the event loop that created them
+_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], AsyncAmadeusClient]]' = (
+    weakref.WeakKeyDictionary()
+)
+_clients_lock = threading.Lock()
+
+
+def get_async_amadeus_client() -> AsyncAmadeusClient:
+    """Client shared by every coroutine on the running event loop."""
+    loop = asyncio.get_running_loop()
+    key = (settings.AMADEUS_BASE_URL.rstrip('/'), settings.AMADEUS_API_KEY)
+    with _clients_lock:
+        loop_clients = _clients.setdefault(loop, {})
+        client = loop_clients.get(key)
+        if client is None:
+            client = loop_clients[key] = AsyncAmadeusClient()
+        return client
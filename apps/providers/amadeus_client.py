@@ -1,9 +1,27 @@
+import hashlib
+import json
+import os
+import threading
 import time
-from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
 
 import requests
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from apps.common.locks import FileLock
+from apps.providers.ratelimit import (
+    RETRY_STATUSES,
+    TokenBucket,
+    get_rate_limiter,
+    max_wait_seconds,
+    parse_retry_after,
+    record_give_up,
+    record_retry,
+    retry_delay,
+)
 
 
 class AmadeusAuthError(Exception):
@@ -29,18 +47,143 @@ class OAuthToken:
         return time.time() >= (self.expires_at_epoch - 60)
 
 
+class TokenStore:
+    """OAuth token cache shared by every client of one set of credentials.
+
+    Concurrent refreshes are coalesced: threads queue on a lock and workers
+    on a file lock, and whoever gets there first fetches the token. The rest
+    re-read it from memory or from the shared token file. ``path=None``
+    keeps the token in this process only.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._token: Optional[OAuthToken] = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def _read(self) -> Optional[OAuthToken]:
+        if self.path is None:
+            return None
+        try:
+            with open(self.path, encoding='utf-8') as fh:
+                return OAuthToken(**json.load(fh))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _write(self, token: OAuthToken) -> None:
+        if self.path is None:
+            return
+        tmp = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            json.dump(asdict(token), fh)
+        os.replace(tmp, self.path)
+
+    def peek(self) -> Optional[OAuthToken]:
+        """The in-memory token if it is still valid; never blocks or does I/O."""
+        token = self._token
+        return token if token is not None and not token.is_expired else None
+
+    def get(self, fetch: Callable[[], OAuthToken]) -> OAuthToken:
+        token = self._token
+        if token is not None and not token.is_expired:
+            return token
+        with self._lock:
+            token = self._token
+            if token is not None and not token.is_expired:
+                return token
+            token = self._read()
+            if token is None or token.is_expired:
+                token = self._refresh(fetch)
+            self._token = token
+            return token
+
+    def _refresh(self, fetch: Callable[[], OAuthToken]) -> OAuthToken:
+        if self.path is None:
+            self.refreshes += 1
+            return fetch()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with FileLock(self.path.with_suffix('.lock')):
+            # Another worker may have refreshed while we waited
+            token = self._read()
+            if token is not None and not token.is_expired:
+                return token
+            token = fetch()
+            self._write(token)
+            self.refreshes += 1
+            return token
+
+    def invalidate(self, token: OAuthToken) -> None:
+        """Forget ``token`` (e.g. after a 401) unless it was already replaced."""
+        with self._lock:
+            if self._token is not None and self._token.access_token == token.access_token:
+                self._token = None
+            stored = self._read()
+            if stored is not None and stored.access_token == token.access_token and self.path is not None:
+                try:
+                    self.path.unlink()
+                except FileNotFoundError:
+                    pass
+
+
+_token_stores: Dict[str, TokenStore] = {}
+_token_stores_lock = threading.Lock()
+
+
+def get_token_store(base_url: str, api_key: str) -> TokenStore:
+    key = hashlib.sha256(f"{base_url}|{api_key}".encode('utf-8')).hexdigest()[:16]
+    with _token_stores_lock:
+        store = _token_stores.get(key)
+        if store is None:
+            path = None
+            if getattr(settings, 'AMADEUS_TOKEN_STORE', 'file') == 'file':
+                path = Path(settings.AMADEUS_TOKEN_STORE_DIR) / f"amadeus-{key}.json"
+            store = _token_stores[key] = TokenStore(path)
+        return store
+
+
+def _take_slot(limiter: Optional[TokenBucket]) -> None:
+    if limiter is not None and limiter.acquire(timeout=max_wait_seconds()) is None:
+        raise AmadeusApiError(429, "No request slot within the client-side rate limit")
+
+
+def _after_failure(
+    limiter: Optional[TokenBucket], status_code: int, retry_after: Optional[str], attempt: int, attempts: int,
+) -> Optional[float]:
+    """Seconds to wait before retrying a throttled/5xx response, or None to return it as is."""
+    if status_code == 429 and limiter is not None:
+        # Throttling is shared: every thread and worker backs off, not just this caller
+        pause = parse_retry_after(retry_after)
+        limiter.pause(pause if pause is not None else float(getattr(settings, 'AMADEUS_RETRY_BASE_DELAY_SECONDS', 0.5)))
+    delay = retry_delay(attempt, retry_after) if attempt + 1 < attempts else None
+    if delay is None:
+        record_give_up(status_code)
+    else:
+        record_retry(status_code)
+    return delay
+
+
 class AmadeusClient:
-    """Lightweight Amadeus client with token caching in-memory.
+    """Lightweight Amadeus client with a pooled session and a shared token store.
 
-    For multi-process deployments, consider Redis-backed token caching.
+    Tokens live in a TokenStore shared by every client of the same
+    credentials and, by default, by every worker process through a token
+    file. Prefer get_amadeus_client() over constructing clients per request.
     """
 
     def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None, api_secret: Optional[str] = None):
         self.base_url = base_url or settings.AMADEUS_BASE_URL.rstrip('/')
         self.api_key = api_key or settings.AMADEUS_API_KEY
         self.api_secret = api_secret or settings.AMADEUS_API_SECRET
-        self._token: Optional[OAuthToken] = None
+        self._token_store = get_token_store(self.base_url, self.api_key)
         self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=int(getattr(settings, 'AMADEUS_POOL_CONNECTIONS', 4)),
+            pool_maxsize=int(getattr(settings, 'AMADEUS_POOL_MAXSIZE', 20)),
+        )
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
 
     # ---------- OAuth ----------
     def _fetch_token(self) -> OAuthToken:
@@ -51,6 +194,8 @@ class AmadeusClient:
             "client_id": self.api_key,
             "client_secret": self.api_secret,
         }
+        # Token calls count against the same quota as everything else
+        _take_slot(get_rate_limiter(self.base_url, self.api_key))
         resp = self._session.post(url, headers=headers, data=data, timeout=15)
         if resp.status_code != 200:
             raise AmadeusAuthError(f"Failed to obtain token: {resp.status_code} {resp.text}")
@@ -64,21 +209,43 @@ class AmadeusClient:
         return token
 
     def _get_token(self) -> OAuthToken:
-        if self._token is None or self._token.is_expired:
-            self._token = self._fetch_token()
-        return self._token
+        return self._token_store.get(self._fetch_token)
 
     # ---------- HTTP ----------
-    def _headers(self) -> Dict[str, str]:
+    def _send(self, method: str, url: str, limiter: Optional[TokenBucket], **kwargs: Any) -> requests.Response:
         token = self._get_token()
-        return {
-            "Authorization": f"Bearer {token.access_token}",
-            "Accept": "application/json",
-        }
+        headers = {**kwargs.pop('headers', {}), "Authorization": f"Bearer {token.access_token}", "Accept": "application/json"}
+        resp = self._session.request(method, url, headers=headers, **kwargs)
+        if resp.status_code == 401:
+            # Token revoked or expired early: drop it everywhere and retry once, as a request of its own
+            self._token_store.invalidate(token)
+            headers["Authorization"] = f"Bearer {self._get_token().access_token}"
+            _take_slot(limiter)
+            resp = self._session.request(method, url, headers=headers, **kwargs)
+        return resp
+
+    def _request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """_send under the shared rate limit, retrying throttled and transient failures.
+
+        The last response is returned whatever its status; a request that
+        finds no slot within AMADEUS_RATE_LIMIT_MAX_WAIT_SECONDS raises a 429.
+        """
+        limiter = get_rate_limiter(self.base_url, self.api_key)
+        attempts = 1 + max(0, int(getattr(settings, 'AMADEUS_RETRY_ATTEMPTS', 3)))
+        for attempt in range(attempts):
+            _take_slot(limiter)
+            resp = self._send(method, url, limiter, **kwargs)
+            if resp.status_code not in RETRY_STATUSES:
+                return resp
+            delay = _after_failure(limiter, resp.status_code, resp.headers.get('Retry-After'), attempt, attempts)
+            if delay is None:
+                return resp
+            time.sleep(delay)
+        return resp
 
     def get(self, path: str, params: Optional[Dict[str, Any]] = None, timeout: int = 20) -> Any:
         url = f"{self.base_url}{path}"
-        resp = self._session.get(url, headers=self._headers(), params=params or {}, timeout=timeout)
+        resp = self._request("GET", url, params=params or {}, timeout=timeout)
         if resp.status_code >= 400:
             raise AmadeusApiError(resp.status_code, resp.text)
         if resp.status_code == 204:
@@ -87,7 +254,7 @@ class AmadeusClient:
 
     def post(self, path: str, json: Optional[Dict[str, Any]] = None, timeout: int = 25) -> Any:
         url = f"{self.base_url}{path}"
-        resp = self._session.post(url, headers={**self._headers(), "Content-Type": "application/json"}, json=json or {}, timeout=timeout)
+        resp = self._request("POST", url, headers={"Content-Type": "application/json"}, json=json or {}, timeout=timeout)
         if resp.status_code >= 400:
             raise AmadeusApiError(resp.status_code, resp.text)
         if resp.status_code == 204:
@@ -129,3 +296,17 @@ class AmadeusClient:
         return self.get("/v1/reference-data/locations", params=params)
 
 
+
+
+_clients: Dict[Tuple[str, str], AmadeusClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_amadeus_client() -> AmadeusClient:
+    """Process-wide client for the configured credentials (one pooled session)."""
+    key = (settings.AMADEUS_BASE_URL.rstrip('/'), settings.AMADEUS_API_KEY)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = AmadeusClient()
+        return client
@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+import re
+import sys
 from datetime import datetime
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Tuple
 
+from apps.providers.records import DealRecord
+
 
 def _parse_iso8601_duration_to_minutes(duration_str: str) -> int:
     # Examples: PT2H10M, PT45M, PT14H
@@ -134,3 +139,132 @@ def normalize_flight_offers(amadeus_json: Dict[str, Any], num_travelers: int, ca
     return deals
 
 
+
+# ---------- single-pass normalizer for the search pipeline ----------
+# normalize_flight_offers above is the reference implementation (and the
+# public dict API); check_normalizer_parity compares the two.
+
+_EMPTY: Dict[str, Any] = {}
+_DURATION_RE = re.compile(r'PT(?:(\d+)H)?(?:(\d+)M)?')
+
+
+@lru_cache(maxsize=4096)
+def _duration_minutes(duration_str: str) -> int:
+    # A few hundred offers share a few dozen distinct durations
+    m = _DURATION_RE.fullmatch(duration_str)
+    if m is None:
+        return _parse_iso8601_duration_to_minutes(duration_str)
+    return int(m.group(1) or 0) * 60 + int(m.group(2) or 0)
+
+
+@lru_cache(maxsize=8192)
+def _parse_dt(s: str) -> Optional[datetime]:
+    # Segment times repeat across offers (same flights, different fares)
+    try:
+        return datetime.fromisoformat(s.replace("Z", "+00:00"))
+    except Exception:
+        return None
+
+
+def _walk_segments(
+    segments: List[Dict[str, Any]], airlines: List[str], codes: Dict[str, str],
+) -> int:
+    """Collect carriers into ``airlines`` and return the longest layover, in one pass."""
+    max_minutes = 0
+    prev_arrival: Optional[datetime] = None
+    for i, seg in enumerate(segments):
+        code = seg.get("carrierCode")
+        if code and code not in airlines:
+            airlines.append(codes.get(code) or sys.intern(code))
+        if i > 0 and prev_arrival is not None:
+            dep_at = seg.get("departure", _EMPTY).get("at")
+            dep_dt = _parse_dt(dep_at) if dep_at else None
+            if dep_dt is not None:
+                try:
+                    minutes = int((dep_dt - prev_arrival).total_seconds() // 60)
+                except TypeError:  # naive vs aware, skipped like the reference
+                    minutes = 0
+                if minutes > max_minutes:
+                    max_minutes = minutes
+        arr_at = seg.get("arrival", _EMPTY).get("at")
+        prev_arrival = _parse_dt(arr_at) if arr_at else None
+    return max_minutes
+
+
+def _code_table(amadeus_json: Dict[str, Any]) -> Dict[str, str]:
+    # The response's dictionaries already list every carrier and airport it
+    # mentions; interning those once gives each code a single shared string
+    dictionaries = amadeus_json.get("dictionaries") or {}
+    codes: Dict[str, str] = {}
+    for section in ("carriers", "locations"):
+        for code in dictionaries.get(section) or {}:
+            codes[code] = sys.intern(code)
+    return codes
+
+
+def normalize_flight_offer_records(
+    amadeus_json: Dict[str, Any], num_travelers: int, cabin_class: Optional[str]
+) -> List[DealRecord]:
+    """normalize_flight_offers producing DealRecords for the search pipeline.
+
+    Same values as the dict version, except that round-trip carriers keep
+    first-seen order instead of set order. Each itinerary's segments are
+    walked once, durations and timestamps are memoized across offers, and
+    departure/return times come pre-parsed. Carrier and airport codes are
+    interned, from the response's ``dictionaries`` when it has them.
+    """
+    deals: List[DealRecord] = []
+    codes = _code_table(amadeus_json)
+    data = amadeus_json.get("data") or []
+    for offer in data:
+        itineraries = offer.get("itineraries") or []
+        if not itineraries:
+            continue
+
+        out_itin = itineraries[0]
+        out_segments = out_itin.get("segments") or []
+        out_dep = out_segments[0]["departure"]["at"] if out_segments else None
+        origin = out_segments[0]["departure"].get("iataCode") if out_segments else None
+        destination = out_segments[-1]["arrival"].get("iataCode") if out_segments else None
+        origin = codes.get(origin, origin) if origin else origin
+        destination = codes.get(destination, destination) if destination else destination
+        airlines: List[str] = []
+        duration_min = _duration_minutes(out_itin.get("duration") or "")
+        layover_max = _walk_segments(out_segments, airlines, codes)
+        stops = max(0, len(out_segments) - 1)
+
+        ret_dep = None
+        if len(itineraries) > 1:
+            ret_itin = itineraries[1]
+            ret_segments = ret_itin.get("segments") or []
+            ret_dep = ret_segments[0]["departure"].get("at") if ret_segments else None
+            duration_min += _duration_minutes(ret_itin.get("duration") or "")
+            layover_max = max(layover_max, _walk_segments(ret_segments, airlines, codes))
+            stops += max(0, len(ret_segments) - 1)
+
+        price = offer.get("price", _EMPTY)
+        # Plain attribute stores; the keyword constructor costs more than the parsing
+        d = DealRecord()
+        d.provider = "amadeus"
+        d.one_way_bool = len(itineraries) == 1
+        d.origin_iata = origin
+        d.destination_iata = destination
+        d.departure_datetime = out_dep or None
+        d.return_datetime = ret_dep or None
+        d.departure_dt = _parse_dt(out_dep) if out_dep else None
+        d.return_dt = _parse_dt(ret_dep) if ret_dep else None
+        d.num_stops = stops
+        d.duration_minutes = duration_min
+        d.layover_minutes_max = layover_max
+        d.airline_codes = airlines
+        d.cabin_class = cabin_class
+        d.price_total = float(price.get("total") or 0.0)
+        d.currency = price.get("currency") or "USD"
+        d.num_travelers = num_travelers
+        d.deep_link = None
+        d.score_int_0_100 = None
+        d.score_factors_json = None
+        d.badges_json = None
+        deals.append(d)
+
+    return deals
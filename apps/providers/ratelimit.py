@@ -0,0 +1,319 @@
+"""Client-side scheduling of Amadeus calls: a shared token bucket, priority lanes and retries.
+
+The bucket is sized to the Amadeus quota (AMADEUS_RATE_LIMIT_PER_SECOND,
+bursts of AMADEUS_RATE_LIMIT_BURST). Every thread shares it, and with
+AMADEUS_RATE_LIMIT_STORE='file' so does every worker, through a small
+state file next to the OAuth token file.
+
+Calls run in a lane: ``interactive`` (the default, user searches) or
+``background`` (cache refreshes, warming). Background calls leave the last
+AMADEUS_RATE_LIMIT_BACKGROUND_RESERVE tokens to interactive ones and, in
+the same process, wait while an interactive call is queued.
+
+Throttled (429) and transient 5xx responses are retried with jittered
+exponential backoff, honoring ``Retry-After``. A 429 also pauses the whole
+bucket, so other threads and workers back off too.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+from apps.common.locks import FileLock
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+LANES = (INTERACTIVE, BACKGROUND)
+
+# Statuses worth another attempt; anything else >= 400 fails at once
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_lane: contextvars.ContextVar[str] = contextvars.ContextVar('amadeus_lane', default=INTERACTIVE)
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+@contextmanager
+def request_lane(lane: str) -> Iterator[None]:
+    """Run the Amadeus calls made inside the block (and in tasks started there) in ``lane``."""
+    if lane not in LANES:
+        raise ValueError(f"Unknown lane {lane!r}")
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date); None if absent or unreadable."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, retry_after: Optional[str] = None) -> Optional[float]:
+    """Seconds to sleep before retry number ``attempt`` (0-based), or None to give up.
+
+    Full-jitter exponential backoff, unless the server named a delay: then
+    that delay plus a little jitter. A named delay above
+    AMADEUS_RETRY_MAX_DELAY_SECONDS gives up rather than hold the caller.
+    """
+    base = float(getattr(settings, 'AMADEUS_RETRY_BASE_DELAY_SECONDS', 0.5))
+    cap = float(getattr(settings, 'AMADEUS_RETRY_MAX_DELAY_SECONDS', 8.0))
+    named = parse_retry_after(retry_after)
+    if named is not None:
+        return named + random.uniform(0, base) if named <= cap else None
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """Token bucket shared by threads and, with ``path``, by processes.
+
+    ``acquire`` blocks until a request may be sent in its lane, or gives up
+    after ``timeout``. Waiters sleep until the refill time of the token
+    they need, then try again. With a ``path``, state lives in that file
+    and every take happens under a file lock. The clock is wall time so
+    all workers agree on it.
+    """
+
+    def __init__(self, rate: float, burst: float, background_reserve: float = 0.0, path: Optional[Path] = None):
+        self.rate = max(float(rate), 1e-6)
+        self.burst = max(float(burst), 1.0)
+        self.background_reserve = min(max(float(background_reserve), 0.0), self.burst - 1)
+        self.path = path
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        # _lock guards the in-memory state and counters only; _io_lock
+        # queues this process's threads for the file, so nothing else waits on disk
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._paused_until = 0.0
+        self._waiting: Counter = Counter()
+        self._stats: Dict[str, Any] = {
+            'acquired': Counter(), 'timeouts': Counter(), 'wait_ms_total': Counter(), 'wait_ms_max': Counter(),
+            'pauses': 0,
+        }
+
+    # ---------- shared state ----------
+    def _load(self) -> List[float]:
+        try:
+            with open(self.path, encoding='utf-8') as fh:
+                state = json.load(fh)
+            return [float(state['tokens']), float(state['updated']), float(state['paused_until'])]
+        except (OSError, ValueError, TypeError, KeyError):
+            # First use, or a torn file: start full
+            return [self.burst, time.time(), 0.0]
+
+    def _save(self, state: List[float]) -> None:
+        tmp = self.path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(dict(zip(('tokens', 'updated', 'paused_until'), state)), fh)
+        os.replace(tmp, self.path)
+
+    @contextmanager
+    def _state(self) -> Iterator[List[float]]:
+        """``[tokens, updated, paused_until]`` to change in place; written back only if changed."""
+        if self.path is None:
+            with self._lock:
+                state = [self._tokens, self._updated, self._paused_until]
+                yield state
+                self._tokens, self._updated, self._paused_until = state
+            return
+        # Not the token file's lock: token fetches take a slot while holding that one
+        with self._io_lock, FileLock(self.path.with_name(self.path.name + '.lock')):
+            state = self._load()
+            loaded = list(state)
+            yield state
+            if state != loaded:
+                self._save(state)
+
+    # ---------- taking tokens ----------
+    def _try_take(self, lane: str) -> float:
+        """Take a token for ``lane`` if one is free; otherwise seconds until one may be."""
+        if lane == BACKGROUND and self._waiting[INTERACTIVE]:
+            # The queued interactive call gets the next token
+            return 1.0 / self.rate
+        with self._state() as state:
+            tokens, updated, paused_until = state
+            now = time.time()
+            if now < paused_until:
+                return paused_until - now
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            floor = self.background_reserve if lane == BACKGROUND else 0.0
+            if tokens >= floor + 1:
+                state[:2] = [tokens - 1, now]
+                return 0.0
+            # Nothing taken, nothing to write: the refill is recomputed from ``updated`` next time
+            return (floor + 1 - tokens) / self.rate
+
+    def _record(self, lane: str, waited: Optional[float]) -> None:
+        with self._lock:
+            if waited is None:
+                self._stats['timeouts'][lane] += 1
+                return
+            ms = int(waited * 1000)
+            self._stats['acquired'][lane] += 1
+            self._stats['wait_ms_total'][lane] += ms
+            self._stats['wait_ms_max'][lane] = max(self._stats['wait_ms_max'][lane], ms)
+
+    def _next_sleep(self, wait: float, deadline: Optional[float]) -> Optional[float]:
+        # None when no slot can come before the deadline (e.g. a long pause): fail now, not at the deadline
+        if deadline is not None and time.monotonic() + wait > deadline:
+            return None
+        return wait
+
+    def acquire(self, lane: Optional[str] = None, timeout: Optional[float] = None) -> Optional[float]:
+        """Wait for a request slot in ``lane``; returns seconds waited, or None on timeout."""
+        lane = lane or current_lane()
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._lock:
+            self._waiting[lane] += 1
+        try:
+            while True:
+                wait = self._try_take(lane)
+                if wait <= 0:
+                    waited = time.monotonic() - started
+                    break
+                sleep = self._next_sleep(wait, deadline)
+                if sleep is None:
+                    waited = None
+                    break
+                time.sleep(sleep)
+        finally:
+            with self._lock:
+                self._waiting[lane] -= 1
+        self._record(lane, waited)
+        return waited
+
+    async def aacquire(self, lane: Optional[str] = None, timeout: Optional[float] = None) -> Optional[float]:
+        """acquire for coroutines; the file-locked take runs on a thread."""
+        lane = lane or current_lane()
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._lock:
+            self._waiting[lane] += 1
+        try:
+            while True:
+                if self.path is None:
+                    wait = self._try_take(lane)
+                else:
+                    wait = await asyncio.to_thread(self._try_take, lane)
+                if wait <= 0:
+                    waited = time.monotonic() - started
+                    break
+                sleep = self._next_sleep(wait, deadline)
+                if sleep is None:
+                    waited = None
+                    break
+                await asyncio.sleep(sleep)
+        finally:
+            with self._lock:
+                self._waiting[lane] -= 1
+        self._record(lane, waited)
+        return waited
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens, in every lane and worker, for ``seconds``."""
+        with self._state() as state:
+            state[2] = max(state[2], time.time() + seconds)
+        with self._lock:
+            self._stats['pauses'] += 1
+
+    # ---------- metrics ----------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            acquired, total = self._stats['acquired'], self._stats['wait_ms_total']
+            return {
+                'rate_per_second': self.rate,
+                'burst': self.burst,
+                'shared': self.path is not None,
+                'lanes': {
+                    lane: {
+                        'acquired': acquired[lane],
+                        'waiting': self._waiting[lane],
+                        'timeouts': self._stats['timeouts'][lane],
+                        'wait_ms_avg': round(total[lane] / acquired[lane], 1) if acquired[lane] else 0.0,
+                        'wait_ms_max': self._stats['wait_ms_max'][lane],
+                    }
+                    for lane in LANES
+                },
+                'pauses': self._stats['pauses'],
+            }
+
+
+_buckets: Dict[Tuple[str, float, float, float, bool], TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(base_url: str, api_key: str) -> Optional[TokenBucket]:
+    """The bucket for one set of credentials, or None when AMADEUS_RATE_LIMIT_ENABLED is off."""
+    if not getattr(settings, 'AMADEUS_RATE_LIMIT_ENABLED', True):
+        return None
+    rate = float(getattr(settings, 'AMADEUS_RATE_LIMIT_PER_SECOND', 10.0))
+    burst = float(getattr(settings, 'AMADEUS_RATE_LIMIT_BURST', 10))
+    reserve = float(getattr(settings, 'AMADEUS_RATE_LIMIT_BACKGROUND_RESERVE', 3))
+    shared = getattr(settings, 'AMADEUS_RATE_LIMIT_STORE', 'file') == 'file'
+    key = hashlib.sha256(f"{base_url}|{api_key}".encode('utf-8')).hexdigest()[:16]
+    with _buckets_lock:
+        bucket = _buckets.get((key, rate, burst, reserve, shared))
+        if bucket is None:
+            path = Path(settings.AMADEUS_TOKEN_STORE_DIR) / f"amadeus-{key}.bucket" if shared else None
+            bucket = _buckets[(key, rate, burst, reserve, shared)] = TokenBucket(rate, burst, reserve, path)
+        return bucket
+
+
+def max_wait_seconds(lane: Optional[str] = None) -> float:
+    if (lane or current_lane()) == BACKGROUND:
+        return float(getattr(settings, 'AMADEUS_RATE_LIMIT_BACKGROUND_MAX_WAIT_SECONDS', 60.0))
+    return float(getattr(settings, 'AMADEUS_RATE_LIMIT_MAX_WAIT_SECONDS', 10.0))
+
+
+# Retries by status, and requests that still failed after their last attempt
+_retries: Counter = Counter()
+_gave_up: Counter = Counter()
+_retries_lock = threading.Lock()
+
+
+def record_retry(status_code: int) -> None:
+    with _retries_lock:
+        _retries[str(status_code)] += 1
+
+
+def record_give_up(status_code: int) -> None:
+    with _retries_lock:
+        _gave_up[str(status_code)] += 1
+
+
+def scheduler_stats() -> Dict[str, Any]:
+    with _buckets_lock:
+        buckets = list(_buckets.values())
+    with _retries_lock:
+        retries, gave_up = dict(_retries), dict(_gave_up)
+    return {'buckets': [bucket.stats() for bucket in buckets], 'retries': retries, 'gave_up': gave_up}
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+# API / persistence fields, in DealSerializer order
+DEAL_FIELDS = (
+    'provider',
+    'one_way_bool',
+    'origin_iata',
+    'destination_iata',
+    'departure_datetime',
+    'return_datetime',
+    'num_stops',
+    'duration_minutes',
+    'layover_minutes_max',
+    'airline_codes',
+    'cabin_class',
+    'price_total',
+    'currency',
+    'num_travelers',
+    'deep_link',
+    'price_baseline',
+    'price_pct_drop',
+    'price_percentile',
+    'score_int_0_100',
+    'score_factors_json',
+    'badges_json',
+)
+_FIELD_SET = frozenset(DEAL_FIELDS)
+
+
+class DealRecord:
+    """One normalized offer as it moves through the search pipeline.
+
+    Slots instead of a per-deal dict. Times are kept both as the provider's
+    ISO strings (what the API returns) and pre-parsed (``departure_dt`` /
+    ``return_dt``), minutes and stops are ints, prices floats and carrier
+    codes interned. It also answers ``get``/``[]``/``keys`` for the API
+    fields so code written against deal dicts keeps working; ``to_dict``
+    is the serializer boundary. Fields never set (e.g. ``price_baseline``
+    before baselines run) are absent, like missing dict keys.
+    """
+
+    __slots__ = DEAL_FIELDS + ('departure_dt', 'return_dt')
+
+    def __init__(self, *, departure_dt: Optional[datetime] = None, return_dt: Optional[datetime] = None,
+                 **fields: Any) -> None:
+        self.departure_dt = departure_dt
+        self.return_dt = return_dt
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    # ---------- mapping compatibility ----------
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in _FIELD_SET:
+            return default
+        return getattr(self, key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: object) -> bool:
+        return key in _FIELD_SET and hasattr(self, key)  # type: ignore[arg-type]
+
+    def keys(self) -> List[str]:
+        return [name for name in DEAL_FIELDS if hasattr(self, name)]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for name in DEAL_FIELDS:
+            try:
+                out[name] = getattr(self, name)
+            except AttributeError:
+                continue
+        return out
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"DealRecord({self.get('origin_iata')}->{self.get('destination_iata')} {self.get('price_total')})"
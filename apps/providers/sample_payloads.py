@@ -0,0 +1,70 @@
+"""Synthetic Amadeus Flight Offers payloads for benchmarks and parity checks."""
+from __future__ import annotations
+
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+_AIRPORTS = ['JFK', 'LAX', 'SFO', 'ORD', 'ATL', 'DFW', 'SEA', 'MIA', 'BOS', 'DEN', 'LHR', 'CDG', 'FRA', 'AMS', 'MAD']
+_CARRIERS = ['AA', 'DL', 'UA', 'B6', 'AS', 'BA', 'AF', 'LH', 'KL', 'IB', 'NK', 'F9']
+
+
+def _duration(minutes: int) -> str:
+    hours, mins = divmod(minutes, 60)
+    return f"PT{hours}H{mins}M" if mins else f"PT{hours}H"
+
+
+def _itinerary(rng: random.Random, origin: str, destination: str, start: datetime) -> Dict[str, Any]:
+    stops = rng.choice([0, 0, 1, 1, 2])
+    path = [origin] + rng.sample([a for a in _AIRPORTS if a not in (origin, destination)], stops) + [destination]
+    segments = []
+    at = start
+    for i in range(len(path) - 1):
+        flight = rng.randint(55, 480)
+        arrive = at + timedelta(minutes=flight)
+        segments.append({
+            'departure': {'iataCode': path[i], 'at': at.strftime('%Y-%m-%dT%H:%M:%S')},
+            'arrival': {'iataCode': path[i + 1], 'at': arrive.strftime('%Y-%m-%dT%H:%M:%S')},
+            'carrierCode': rng.choice(_CARRIERS),
+            'number': str(rng.randint(1, 9999)),
+            'duration': _duration(flight),
+        })
+        at = arrive + timedelta(minutes=rng.randint(40, 400))
+    total = int((datetime.fromisoformat(segments[-1]['arrival']['at']) - start).total_seconds() // 60)
+    return {'duration': _duration(total), 'segments': segments}
+
+
+def synthetic_flight_offers(
+    n: int = 250, *, origin: str = 'JFK', destination: str = 'LHR', round_trip: bool = True, seed: int = 0,
+    dictionaries: bool = True,
+) -> Dict[str, Any]:
+    """A deterministic flight-offers response with ``n`` offers (and ``dictionaries``, like Amadeus sends)."""
+    rng = random.Random(seed)
+    base = datetime(2030, 3, 1)
+    data: List[Dict[str, Any]] = []
+    for i in range(n):
+        depart = base + timedelta(days=rng.randint(0, 60), minutes=rng.randrange(0, 24 * 60, 5))
+        itineraries = [_itinerary(rng, origin, destination, depart)]
+        if round_trip:
+            back = depart + timedelta(days=rng.randint(2, 21), minutes=rng.randrange(0, 12 * 60, 5))
+            itineraries.append(_itinerary(rng, destination, origin, back))
+        data.append({
+            'type': 'flight-offer',
+            'id': str(i + 1),
+            'itineraries': itineraries,
+            'price': {'currency': 'USD', 'total': f"{rng.uniform(180, 1600):.2f}"},
+        })
+    if not dictionaries:
+        return {'data': data}
+    carriers = {seg['carrierCode'] for o in data for it in o['itineraries'] for seg in it['segments']}
+    airports = {
+        leg[side]['iataCode'] for o in data for it in o['itineraries'] for leg in it['segments']
+        for side in ('departure', 'arrival')
+    }
+    return {
+        'data': data,
+        'dictionaries': {
+            'carriers': {code: f'CARRIER {code}' for code in sorted(carriers)},
+            'locations': {code: {'cityCode': code, 'countryCode': 'XX'} for code in sorted(airports)},
+        },
+    }
@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from apps.providers.normalizer import normalize_flight_offer_records, normalize_flight_offers
+from apps.providers.sample_payloads import synthetic_flight_offers
+
+PAYLOAD_DIR = Path(__file__).resolve().parent / 'payloads'
+
+
+def _comparable(deal):
+    deal = dict(deal)
+    # The reference merges round-trip carriers through a set, so only membership is defined
+    deal['airline_codes'] = sorted(deal.get('airline_codes') or [])
+    return deal
+
+
+def _payloads():
+    for path in sorted(PAYLOAD_DIR.glob('*.json')):
+        with open(path, encoding='utf-8') as fh:
+            yield path.name, json.load(fh)
+    for seed in range(6):
+        yield f"synthetic seed={seed}", synthetic_flight_offers(
+            120, seed=seed, round_trip=seed % 2 == 0, dictionaries=seed % 3 != 2,
+        )
+
+
+class NormalizerParityTests(SimpleTestCase):
+    """normalize_flight_offer_records must stay field-for-field equal to normalize_flight_offers."""
+
+    def test_recorded_payloads_exist(self):
+        self.assertTrue(list(PAYLOAD_DIR.glob('*.json')))
+
+    def test_records_match_reference(self):
+        for name, raw in _payloads():
+            for travelers, cabin in ((1, None), (3, 'BUSINESS')):
+                with self.subTest(payload=name, travelers=travelers, cabin=cabin):
+                    expected = normalize_flight_offers(raw, num_travelers=travelers, cabin_class=cabin)
+                    actual = normalize_flight_offer_records(raw, num_travelers=travelers, cabin_class=cabin)
+                    self.assertTrue(expected)
+                    self.assertEqual([_comparable(d) for d in expected], [_comparable(d.to_dict()) for d in actual])
+
+    def test_empty_payload(self):
+        for raw in ({}, {'data': []}):
+            with self.subTest(raw=raw):
+                self.assertEqual(normalize_flight_offers(raw, 1, None), [])
+                self.assertEqual(normalize_flight_offer_records(raw, 1, None), [])
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from django.conf import settings
+
+from apps.scoring.ai_client import (
+    AICircuitOpenError,
+    AIScoringError,
+    ScoreResult,
+    _build_batch_prompt,
+    _build_prompt,
+    _chat_request,
+    _cut_short,
+    _healthy,
+    _message_content,
+    _parse_batch,
+    _parse_single,
+    _request_timeout,
+)
+from apps.scoring.breaker import ai_breaker
+
+# One keep-alive pool (and its request slots) per event loop; httpx pools cannot cross loops
+_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, asyncio.Semaphore]]' = (
+    weakref.WeakKeyDictionary()
+)
+_clients_lock = threading.Lock()
+
+
+def _http() -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        entry = _clients.get(loop)
+        if entry is None:
+            max_connections = int(getattr(settings, 'AI_ASYNC_MAX_CONNECTIONS', 32))
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            )
+            entry = _clients[loop] = (client, asyncio.Semaphore(max_connections))
+        return entry
+
+
+async def _achat_completion(prompt: str, timeout: Optional[float] = None) -> str:
+    url, headers, body = _chat_request(prompt)
+    if not ai_breaker.allow():
+        raise AICircuitOpenError("AI scoring circuit is open")
+    client, slots = _http()
+    started = time.monotonic()
+    # None: the call says nothing about the endpoint and is not recorded
+    ok: Optional[bool] = False
+    try:
+        async with slots:
+            resp = await client.post(url, headers=headers, json=body, timeout=_request_timeout(timeout))
+        if resp.status_code >= 400:
+            ok = _healthy(resp.status_code)
+            raise AIScoringError(f"AI scoring failed: {resp.status_code} {resp.text}")
+        # A 2xx without a completion in it counts against the endpoint too
+        content = _message_content(resp)
+        ok = True
+    except httpx.HTTPError as e:
+        if isinstance(e, httpx.TimeoutException) and _cut_short(timeout):
+            # The caller's budget ran out, not the endpoint's full timeout
+            ok = None
+        raise AIScoringError(f"AI scoring failed: {e}")
+    except asyncio.CancelledError:
+        # Cancelled at the end of a search's budget
+        ok = None
+        raise
+    finally:
+        if ok is None:
+            ai_breaker.release()
+        else:
+            ai_breaker.record(ok, time.monotonic() - started)
+    return content
+
+
+async def aai_score_deal(deal: Dict[str, Any], timeout: Optional[float] = None) -> ScoreResult:
+    return _parse_single(await _achat_completion(_build_prompt(deal), timeout))
+
+
+async def aai_score_deals(deals: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[Optional[ScoreResult]]:
+    """Async ai_score_deals: one chat-completion call for the whole batch."""
+    if not deals:
+        return []
+    return _parse_batch(await _achat_completion(_build_batch_prompt(deals), timeout), len(deals))
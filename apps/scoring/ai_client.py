@@ -1,26 +1,40 @@
 from __future__ import annotations
 
+import json
+import threading
+import time
 from typing import Any, Dict, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
 
+from apps.scoring.breaker import ai_breaker
+
 
 class AIScoringError(Exception):
     pass
 
 
+class AICircuitOpenError(AIScoringError):
+    """The circuit breaker is open: no AI call was made."""
+
+
+ALLOWED_BADGES = [
+    "⚠️ Bad airline",
+    "⏱️ Long layover",
+    "🌙 Red-eye",
+    "🔥 Amazing deal",
+    "🌅 Morning departure",
+    "🛌 Weekend-friendly",
+    "🍂 Shoulder season",
+    "⏱️ Tight connection",
+]
+
+ScoreResult = Tuple[int, List[str], List[str]]
+
+
 def _build_prompt(deal: Dict[str, Any]) -> str:
     # Instruction for consistent structured outputs
-    allowed_badges = [
-        "⚠️ Bad airline",
-        "⏱️ Long layover",
-        "🌙 Red-eye",
-        "🔥 Amazing deal",
-        "🌅 Morning departure",
-        "🛌 Weekend-friendly",
-        "🍂 Shoulder season",
-        "⏱️ Tight connection",
-    ]
     return (
         "You are Flight Scanner AI. Score a flight deal from 0-100. "
         "Optimize for value and traveler experience. Consider: stops, maximum layover, total duration (minutes), cabin, airline quality (if implied by codes), and price. "
@@ -28,14 +42,48 @@ def _build_prompt(deal: Dict[str, Any]) -> str:
         "Return STRICT JSON with keys: \n"
         "- score: integer 0-100 (no decimals)\n"
         "- reasons: array of up to 5 short strings (human-friendly)\n"
-        "- badges: array of up to 3 strings chosen from this set only: " + str(allowed_badges) + "\n\n"
+        "- badges: array of up to 3 strings chosen from this set only: " + str(ALLOWED_BADGES) + "\n\n"
         "Guidelines: Direct gets higher scores. Layovers over 180 minutes are bad. Red-eye departures (00:00-05:59 local) are bad.\n"
         "Award '🔥 Amazing deal' only if overall score >= 85 and the itinerary is direct.\n\n"
         f"deal: {deal}"
     )
 
 
-def ai_score_deal(deal: Dict[str, Any]) -> Tuple[int, List[str], List[str]]:
+def _compact_deal(deal: Dict[str, Any]) -> Dict[str, Any]:
+    # Only the signals the grader needs; keeps batched prompts small
+    return {
+        'stops': deal.get('num_stops'),
+        'layover_max_min': deal.get('layover_minutes_max'),
+        'duration_min': deal.get('duration_minutes'),
+        'cabin': deal.get('cabin_class'),
+        'airlines': list(deal.get('airline_codes') or []),
+        'price': deal.get('price_total'),
+        'currency': deal.get('currency'),
+        'baseline': deal.get('price_baseline'),
+        'pct_drop': deal.get('price_pct_drop'),
+        'departure': deal.get('departure_datetime'),
+        'return': deal.get('return_datetime'),
+    }
+
+
+def _build_batch_prompt(deals: List[Dict[str, Any]]) -> str:
+    lines = [json.dumps({'index': i, **_compact_deal(d)}, ensure_ascii=False) for i, d in enumerate(deals)]
+    return (
+        f"You are Flight Scanner AI. Score each of the {len(deals)} flight deals below from 0-100, independently. "
+        "Optimize for value and traveler experience. Consider: stops, maximum layover, total duration (minutes), cabin, airline quality (if implied by codes), and price. "
+        "If price baselines are absent, prioritize comfort (direct, shorter duration, reasonable layovers) and keep scores conservative.\n\n"
+        "Return STRICT JSON of the form {\"results\": [...]} with one entry per deal, each with keys: \n"
+        "- index: the deal's index as given below\n"
+        "- score: integer 0-100 (no decimals)\n"
+        "- reasons: array of up to 5 short strings (human-friendly)\n"
+        "- badges: array of up to 3 strings chosen from this set only: " + str(ALLOWED_BADGES) + "\n\n"
+        "Guidelines: Direct gets higher scores. Layovers over 180 minutes are bad. Red-eye departures (00:00-05:59 local) are bad.\n"
+        "Award '🔥 Amazing deal' only if overall score >= 85 and the itinerary is direct.\n\n"
+        "deals (one JSON object per line):\n" + "\n".join(lines)
+    )
+
+
+def _chat_request(prompt: str) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
     base_url = settings.AI_BASE_URL.rstrip('/')
     api_key = settings.AI_API_KEY
     model = getattr(settings, 'AI_MODEL', 'llama-3')
@@ -48,25 +96,137 @@ def ai_score_deal(deal: Dict[str, Any]) -> Tuple[int, List[str], List[str]]:
         'model': model,
         'messages': [
             { 'role': 'system', 'content': 'You are a precise flight deal grader that returns strict JSON only.' },
-            { 'role': 'user', 'content': _build_prompt(deal) },
+            { 'role': 'user', 'content': prompt },
         ],
         'temperature': 0.2,
         'response_format': { 'type': 'json_object' },
     }
-    resp = requests.post(f"{base_url}/chat/completions", headers=headers, json=body, timeout=30)
-    if resp.status_code >= 400:
-        raise AIScoringError(f"AI scoring failed: {resp.status_code} {resp.text}")
-    data = resp.json()
-    content = data.get('choices', [{}])[0].get('message', {}).get('content', '{}')
+    return f"{base_url}/chat/completions", headers, body
+
+
+def _message_content(resp: Any) -> str:
+    """The completion text of a 2xx chat response (requests or httpx); anything else is an AIScoringError."""
     try:
-        import json
-        obj = json.loads(content)
-        score = int(obj.get('score', 0))
-        reasons = [str(x) for x in obj.get('reasons', [])][:5]
-        badges = [str(x) for x in obj.get('badges', [])][:3]
-        score = max(0, min(100, score))
-        return score, reasons, badges
+        return resp.json().get('choices', [{}])[0].get('message', {}).get('content', '{}')
+    except (ValueError, IndexError, AttributeError, TypeError):
+        raise AIScoringError(f"Malformed AI response: {resp.text}")
+
+
+def _request_timeout(timeout: Optional[float]) -> float:
+    # The configured per-call timeout, shortened to what is left of a caller's budget
+    limit = float(getattr(settings, 'AI_REQUEST_TIMEOUT_SECONDS', 30))
+    return limit if timeout is None else max(0.0, min(limit, timeout))
+
+
+def _cut_short(timeout: Optional[float]) -> bool:
+    # Whether a caller's budget leaves this call less than the full per-call timeout
+    return _request_timeout(timeout) < float(getattr(settings, 'AI_REQUEST_TIMEOUT_SECONDS', 30))
+
+
+def _healthy(status_code: int) -> bool:
+    # What the breaker counts as a working endpoint; other 4xx are our requests' fault
+    return status_code < 500 and status_code != 429
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _http() -> requests.Session:
+    """One keep-alive connection pool shared by every thread of the process."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = int(getattr(settings, 'AI_POOL_MAXSIZE', 10))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def _chat_completion(prompt: str, timeout: Optional[float] = None) -> str:
+    url, headers, body = _chat_request(prompt)
+    if not ai_breaker.allow():
+        raise AICircuitOpenError("AI scoring circuit is open")
+    started = time.monotonic()
+    # None: the call says nothing about the endpoint and is not recorded
+    ok: Optional[bool] = False
+    try:
+        resp = _http().post(url, headers=headers, json=body, timeout=_request_timeout(timeout))
+        if resp.status_code >= 400:
+            ok = _healthy(resp.status_code)
+            raise AIScoringError(f"AI scoring failed: {resp.status_code} {resp.text}")
+        # A 2xx without a completion in it counts against the endpoint too
+        content = _message_content(resp)
+        ok = True
+    except requests.RequestException as e:
+        if isinstance(e, requests.Timeout) and _cut_short(timeout):
+            # The caller's budget ran out, not the endpoint's full timeout
+            ok = None
+        raise AIScoringError(f"AI scoring failed: {e}")
+    finally:
+        if ok is None:
+            ai_breaker.release()
+        else:
+            ai_breaker.record(ok, time.monotonic() - started)
+    return content
+
+
+def _parse_score(obj: Any) -> ScoreResult:
+    score = int(obj.get('score', 0))
+    reasons = [str(x) for x in obj.get('reasons', [])][:5]
+    badges = [str(x) for x in obj.get('badges', [])][:3]
+    score = max(0, min(100, score))
+    return score, reasons, badges
+
+
+def _parse_single(content: str) -> ScoreResult:
+    try:
+        return _parse_score(json.loads(content))
     except Exception as e:
         raise AIScoringError(f"Malformed AI response: {content}")
 
 
+def _parse_batch(content: str, size: int) -> List[Optional[ScoreResult]]:
+    try:
+        obj = json.loads(content)
+    except Exception:
+        raise AIScoringError(f"Malformed AI response: {content}")
+    entries = obj.get('results') if isinstance(obj, dict) else obj
+    if not isinstance(entries, list):
+        raise AIScoringError(f"Malformed AI response: {content}")
+
+    results: List[Optional[ScoreResult]] = [None] * size
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            idx = int(entry.get('index'))
+            if not 0 <= idx < size or results[idx] is not None or 'score' not in entry:
+                continue
+            if not isinstance(entry.get('reasons', []), list) or not isinstance(entry.get('badges', []), list):
+                continue
+            results[idx] = _parse_score(entry)
+        except Exception:
+            continue
+    return results
+
+
+def ai_score_deal(deal: Dict[str, Any], timeout: Optional[float] = None) -> ScoreResult:
+    return _parse_single(_chat_completion(_build_prompt(deal), timeout))
+
+
+def ai_score_deals(deals: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[Optional[ScoreResult]]:
+    """Score several deals with a single chat-completion call.
+
+    Returns one entry per input deal, in order. Entries the model left out or
+    returned malformed are None so callers can fall back per deal. Raises
+    AIScoringError when the call itself fails or the reply is not JSON, and
+    AICircuitOpenError without calling when the circuit breaker is open.
+    ``timeout`` caps the call below AI_REQUEST_TIMEOUT_SECONDS.
+    """
+    if not deals:
+        return []
+    return _parse_batch(_chat_completion(_build_batch_prompt(deals), timeout), len(deals))
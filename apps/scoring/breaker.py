@@ -0,0 +1,146 @@
+"""Circuit breaker for the AI scoring endpoint.
+
+Every chat-completion call records its outcome and latency in a rolling
+window (AI_BREAKER_WINDOW_SECONDS). Once the window holds at least
+AI_BREAKER_MIN_CALLS calls and either the error rate or the share of calls
+slower than AI_BREAKER_SLOW_CALL_SECONDS reaches its threshold, the breaker
+opens. Scoring is then heuristic-only, with no AI call and no wait, for
+AI_BREAKER_OPEN_SECONDS. After that the breaker is half-open: up to
+AI_BREAKER_HALF_OPEN_PROBES calls go through. A good probe closes it and a
+failed or slow one opens it again.
+
+Calls a search's AI budget cut short (timed out before the full
+AI_REQUEST_TIMEOUT_SECONDS, or cancelled) are released, not recorded:
+they say nothing about the endpoint.
+
+State is per process; each worker finds out about an outage from its own calls.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from django.conf import settings
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def _setting(name: str, default: float) -> float:
+    return float(getattr(settings, name, default))
+
+
+class CircuitBreaker:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        # (finished at, ok, latency seconds)
+        self._calls: Deque[Tuple[float, bool, float]] = deque()
+        self._counters = {'calls': 0, 'failures': 0, 'slow': 0, 'short_circuited': 0, 'opened': 0, 'cut_short': 0}
+
+    def _trim(self, now: float) -> None:
+        horizon = now - _setting('AI_BREAKER_WINDOW_SECONDS', 60)
+        while self._calls and self._calls[0][0] < horizon:
+            self._calls.popleft()
+
+    def _open(self, now: float) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self._probes = 0
+        self._counters['opened'] += 1
+
+    def allow(self) -> bool:
+        """Whether an AI call may go out now; callers that get False use the heuristic."""
+        if not getattr(settings, 'AI_BREAKER_ENABLED', True):
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= _setting('AI_BREAKER_OPEN_SECONDS', 30):
+                self._state = HALF_OPEN
+                self._probes = 0
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < int(_setting('AI_BREAKER_HALF_OPEN_PROBES', 1)):
+                self._probes += 1
+                return True
+            self._counters['short_circuited'] += 1
+            return False
+
+    def record(self, ok: bool, latency: float) -> None:
+        """Report one call that ``allow`` let through."""
+        slow = latency >= _setting('AI_BREAKER_SLOW_CALL_SECONDS', 8)
+        with self._lock:
+            now = time.monotonic()
+            self._counters['calls'] += 1
+            self._counters['failures'] += not ok
+            self._counters['slow'] += slow
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if ok and not slow:
+                    self._state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._open(now)
+                return
+            if self._state == OPEN:
+                # A call that started before the breaker opened
+                return
+            self._calls.append((now, ok, latency))
+            self._trim(now)
+            if len(self._calls) < int(_setting('AI_BREAKER_MIN_CALLS', 5)):
+                return
+            failures = sum(1 for _, good, _ in self._calls if not good)
+            slow_calls = sum(1 for _, _, seconds in self._calls if seconds >= _setting('AI_BREAKER_SLOW_CALL_SECONDS', 8))
+            if (
+                failures / len(self._calls) >= _setting('AI_BREAKER_ERROR_RATE', 0.5)
+                or slow_calls / len(self._calls) >= _setting('AI_BREAKER_SLOW_RATE', 0.5)
+            ):
+                self._open(now)
+
+    def release(self) -> None:
+        """Hand back a call that ``allow`` let through, without an outcome to record."""
+        with self._lock:
+            self._counters['cut_short'] += 1
+            if self._state == HALF_OPEN:
+                # Let another probe decide instead
+                self._probes = max(0, self._probes - 1)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= _setting('AI_BREAKER_OPEN_SECONDS', 30):
+                return HALF_OPEN
+            return self._state
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._probes = 0
+            self._calls.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            self._trim(time.monotonic())
+            latencies = sorted(seconds for _, _, seconds in self._calls)
+            window = len(latencies)
+
+            def quantile(q: float) -> Optional[int]:
+                return int(latencies[min(window - 1, int(q * window))] * 1000) if window else None
+
+            return {
+                'state': state,
+                'window_calls': window,
+                'window_error_rate': round(sum(1 for _, ok, _ in self._calls if not ok) / window, 3) if window else 0.0,
+                'window_latency_ms_p50': quantile(0.5),
+                'window_latency_ms_p95': quantile(0.95),
+                **self._counters,
+            }
+
+
+ai_breaker = CircuitBreaker()
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from apps.deals.models import AIScoreCacheEntry
+
+ScoreResult = Tuple[int, List[str], List[str]]
+
+# Expired shared-tier rows are swept after this many cache writes
+PURGE_EVERY_WRITES = 500
+
+
+def _bucket(value: Any, size: float) -> str:
+    if value is None:
+        return '-'
+    try:
+        return str(int(math.floor(float(value) / size)))
+    except Exception:
+        return '-'
+
+
+def _departure_hour(departure_iso: Optional[str]) -> str:
+    if not departure_iso:
+        return '-'
+    try:
+        return str(datetime.fromisoformat(str(departure_iso).replace('Z', '+00:00')).hour)
+    except Exception:
+        return '-'
+
+
+def deal_fingerprint(deal: Dict[str, Any]) -> str:
+    """Canonical key over the deal fields that actually drive the AI score.
+
+    Prices are bucketed (AI_SCORE_CACHE_PRICE_BUCKET currency units) so small
+    fare moves on the same itinerary shape reuse the cached grade.
+    """
+    size = float(getattr(settings, 'AI_SCORE_CACHE_PRICE_BUCKET', 10.0)) or 1.0
+    key_parts = [
+        str(int(deal.get('num_stops') or 0)),
+        str(int(deal.get('layover_minutes_max') or 0)),
+        str(int(deal.get('duration_minutes') or 0)),
+        ','.join(sorted(str(c) for c in (deal.get('airline_codes') or []))),
+        str(deal.get('cabin_class') or ''),
+        _departure_hour(deal.get('departure_datetime')),
+        str(deal.get('currency') or ''),
+        _bucket(deal.get('price_total'), size),
+        _bucket(deal.get('price_baseline'), size),
+    ]
+    return hashlib.sha256('|'.join(key_parts).encode('utf-8')).hexdigest()
+
+
+class ScoreCache:
+    """Two-tier cache of AI scores keyed by deal fingerprint.
+
+    An in-process LRU sits in front of the AIScoreCacheEntry table, which is
+    shared by every worker and survives restarts. Both tiers honour the TTL.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl_seconds: Optional[int] = None):
+        self.max_size = max_size if max_size is not None else int(getattr(settings, 'AI_SCORE_CACHE_MEMORY_SIZE', 5000))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(getattr(settings, 'AI_SCORE_CACHE_TTL_SECONDS', 3 * 24 * 3600))
+        self._lru: 'OrderedDict[str, Tuple[float, ScoreResult]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'shared_hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        self._writes_since_purge = 0
+
+    # ---------- memory tier ----------
+    def _memory_get(self, key: str, now: float) -> Optional[ScoreResult]:
+        item = self._lru.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= now:
+            del self._lru[key]
+            self._counters['evictions'] += 1
+            return None
+        self._lru.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: ScoreResult, expires_at: float) -> None:
+        self._lru[key] = (expires_at, value)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    # ---------- public API ----------
+    def get_many(self, keys: List[str]) -> Dict[str, ScoreResult]:
+        now_dt = datetime.now(timezone.utc)
+        now = now_dt.timestamp()
+        found: Dict[str, ScoreResult] = {}
+        with self._lock:
+            for key in keys:
+                value = self._memory_get(key, now)
+                if value is not None:
+                    found[key] = value
+                    self._counters['memory_hits'] += 1
+
+        missing = list({k for k in keys if k not in found})
+        if missing:
+            try:
+                rows = AIScoreCacheEntry.objects.filter(fingerprint__in=missing, expires_at__gt=now_dt)
+                shared = {
+                    r.fingerprint: (
+                        (r.score_int_0_100, list(r.reasons_json or []), list(r.badges_json or [])),
+                        r.expires_at.timestamp(),
+                    )
+                    for r in rows
+                }
+            except Exception:
+                shared = {}
+            with self._lock:
+                for key, (value, expires_at) in shared.items():
+                    self._memory_set(key, value, expires_at)
+                    found[key] = value
+                hits = sum(1 for k in keys if k in shared)
+                self._counters['shared_hits'] += hits
+                self._counters['misses'] += sum(1 for k in keys if k not in found)
+        return found
+
+    def set_many(self, items: Dict[str, ScoreResult]) -> None:
+        if not items:
+            return
+        now_dt = datetime.now(timezone.utc)
+        expires_dt = now_dt + timedelta(seconds=self.ttl_seconds)
+        with self._lock:
+            for key, value in items.items():
+                self._memory_set(key, value, expires_dt.timestamp())
+            self._counters['writes'] += len(items)
+            self._writes_since_purge += len(items)
+            purge_due = self._writes_since_purge >= PURGE_EVERY_WRITES
+            if purge_due:
+                self._writes_since_purge = 0
+        try:
+            AIScoreCacheEntry.objects.bulk_create(
+                [
+                    AIScoreCacheEntry(
+                        fingerprint=key,
+                        score_int_0_100=score,
+                        reasons_json=list(reasons),
+                        badges_json=list(badges),
+                        expires_at=expires_dt,
+                    )
+                    for key, (score, reasons, badges) in items.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['fingerprint'],
+                update_fields=['score_int_0_100', 'reasons_json', 'badges_json', 'expires_at'],
+            )
+        except Exception:
+            # The shared tier is best-effort; the memory tier still serves hits
+            return
+        if purge_due:
+            try:
+                self.purge_expired()
+            except Exception:
+                pass
+
+    def purge_expired(self) -> int:
+        """Drop expired rows from both tiers; returns rows deleted from the table."""
+        now_dt = datetime.now(timezone.utc)
+        now = now_dt.timestamp()
+        with self._lock:
+            for key in [k for k, (exp, _) in self._lru.items() if exp <= now]:
+                del self._lru[key]
+                self._counters['evictions'] += 1
+        deleted, _ = AIScoreCacheEntry.objects.filter(expires_at__lte=now_dt).delete()
+        return deleted
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            counters['memory_size'] = len(self._lru)
+        lookups = counters['memory_hits'] + counters['shared_hits'] + counters['misses']
+        counters['hit_rate'] = round((counters['memory_hits'] + counters['shared_hits']) / lookups, 4) if lookups else None
+        return counters
+
+
+score_cache = ScoreCache()
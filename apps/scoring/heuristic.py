@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from django.conf import settings
+
+from apps.deals.models import AirlineQuality
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional; the row-at-a-time path is used instead
+    np = None
+
+ScoreTuple = Tuple[int, List[str], List[str]]
+
+
+def _departure_dt(deal: Dict[str, Any]) -> Optional[datetime]:
+    # DealRecords carry the parsed time; plain deal dicts only the ISO string
+    dep_dt = getattr(deal, 'departure_dt', None)
+    if dep_dt is not None:
+        return dep_dt
+    departure_iso = deal.get('departure_datetime')
+    if not departure_iso:
+        return None
+    try:
+        return datetime.fromisoformat(str(departure_iso).replace('Z', '+00:00'))
+    except Exception:
+        return None
+
+
+def _low_quality_carriers(deals: Sequence[Dict[str, Any]]) -> Set[str]:
+    # One query for the whole result set instead of one per deal
+    codes = {code for d in deals for code in (d.get('airline_codes') or [])}
+    if not codes:
+        return set()
+    try:
+        return set(
+            AirlineQuality.objects.filter(carrier_code__in=codes, score_float_0_1__lt=0.4)
+            .values_list('carrier_code', flat=True)
+        )
+    except Exception:
+        # The per-deal scorer skips the penalty when the lookup fails
+        return set()
+
+
+def _outcome(stops: int, penalty: int, duration_class: int, bad_airline: bool, red_eye: bool,
+             amazing: bool) -> Tuple[List[str], List[str]]:
+    # Reasons and badges for one combination of rule outcomes, in the order
+    # compute_heuristic_score emits them; ``penalty`` is 0 without a long layover
+    reasons: List[str] = []
+    badges: List[str] = []
+    if stops == 0:
+        reasons.append('Direct flight bonus')
+    elif stops == 1:
+        reasons.append('One-stop acceptable')
+    else:
+        reasons.append('Multiple stops reduce comfort')
+    if penalty:
+        reasons.append(f'Layover penalty (-{penalty})')
+        badges.append('⏱️ Long layover')
+    if duration_class == 2:
+        reasons.append('Very long total duration')
+    elif duration_class == 1:
+        reasons.append('Long total duration')
+    if bad_airline:
+        reasons.append('Low-rated operating carrier')
+        badges.append('⚠️ Bad airline')
+    if red_eye:
+        reasons.append('Red-eye departure')
+        badges.append('🌙 Red-eye')
+    if amazing:
+        badges.append('🔥 Amazing deal')
+    return reasons, badges
+
+
+def _columns(deals: Sequence[Dict[str, Any]], low_quality: Set[str]) -> Tuple[List[int], ...]:
+    stops, layover, duration, hour, bad = [], [], [], [], []
+    for d in deals:
+        stops.append(int(d.get('num_stops') or 0))
+        layover.append(int(d.get('layover_minutes_max') or 0))
+        duration.append(int(d.get('duration_minutes') or 0))
+        dep_dt = _departure_dt(d)
+        hour.append(dep_dt.hour if dep_dt is not None else -1)
+        bad.append(bool(low_quality) and any(code in low_quality for code in (d.get('airline_codes') or [])))
+    return stops, layover, duration, hour, bad
+
+
+def _score_vectorized(stops, layover, duration, hour, bad) -> Tuple[List[int], List[int]]:
+    """Scores and outcome keys for column arrays; the float operations run in the per-deal scorer's order."""
+    stops = np.asarray(stops, dtype=np.int64)
+    layover = np.asarray(layover, dtype=np.int64)
+    duration = np.asarray(duration, dtype=np.int64)
+    hour = np.asarray(hour, dtype=np.int64)
+    bad = np.asarray(bad, dtype=bool)
+
+    score = np.full(len(stops), 50.0)
+    score += np.where(stops == 0, 20.0, np.where(stops == 1, 10.0, 0.0))
+    long_layover = layover >= 180
+    penalty = np.where(long_layover, np.minimum(10.0, (layover / 60.0) * 2.0), 0.0)
+    score -= penalty
+    duration_class = np.where(duration >= 1200, 2, np.where(duration >= 900, 1, 0))
+    score -= np.where(duration_class == 2, 10.0, np.where(duration_class == 1, 5.0, 0.0))
+    score -= np.where(bad, 8.0, 0.0)
+    red_eye = (hour >= 0) & (hour <= 5)
+    score -= np.where(red_eye, 4.0, 0.0)
+    # np.rint rounds half to even, like round()
+    final = np.clip(np.rint(score), 0, 100).astype(np.int64)
+    amazing = (final >= 85) & (stops == 0)
+
+    stop_class = np.where(stops == 0, 0, np.where(stops == 1, 1, 2))
+    key = (((((stop_class * 11 + penalty.astype(np.int64)) * 3 + duration_class) * 2 + bad) * 2 + red_eye) * 2
+           + amazing)
+    return final.tolist(), key.tolist()
+
+
+def _score_rows(stops, layover, duration, hour, bad) -> Tuple[List[int], List[int]]:
+    # Same as _score_vectorized, one deal at a time (numpy not installed)
+    finals, keys = [], []
+    for s, lay, dur, h, b in zip(stops, layover, duration, hour, bad):
+        score = 50.0 + (20.0 if s == 0 else 10.0 if s == 1 else 0.0)
+        penalty = min(10.0, (lay / 60.0) * 2.0) if lay >= 180 else 0.0
+        score -= penalty
+        duration_class = 2 if dur >= 1200 else 1 if dur >= 900 else 0
+        score -= (0.0, 5.0, 10.0)[duration_class]
+        score -= 8.0 if b else 0.0
+        red_eye = 0 <= h <= 5
+        score -= 4.0 if red_eye else 0.0
+        final = max(0, min(100, int(round(score))))
+        amazing = final >= 85 and s == 0
+        finals.append(final)
+        stop_class = 0 if s == 0 else 1 if s == 1 else 2
+        keys.append(((((stop_class * 11 + int(penalty)) * 3 + duration_class) * 2 + b) * 2 + red_eye) * 2 + amazing)
+    return finals, keys
+
+
+def _decode(key: int) -> Tuple[int, int, int, bool, bool, bool]:
+    key, amazing = divmod(key, 2)
+    key, red_eye = divmod(key, 2)
+    key, bad = divmod(key, 2)
+    key, duration_class = divmod(key, 3)
+    stop_class, penalty = divmod(key, 11)
+    return stop_class, penalty, duration_class, bool(bad), bool(red_eye), bool(amazing)
+
+
+def compute_heuristic_scores(deals: Sequence[Dict[str, Any]]) -> List[ScoreTuple]:
+    """compute_heuristic_score for a whole result set, with identical output.
+
+    The rule inputs are pulled into columns once and scored together (with
+    NumPy when it is installed and HEURISTIC_VECTORIZED is on). Carrier
+    quality is looked up in one query. Deals with the same rule outcomes
+    share one reasons/badges template, copied per deal.
+    """
+    if not deals:
+        return []
+    columns = _columns(deals, _low_quality_carriers(deals))
+    if np is not None and getattr(settings, 'HEURISTIC_VECTORIZED', True):
+        finals, keys = _score_vectorized(*columns)
+    else:
+        finals, keys = _score_rows(*columns)
+    templates: Dict[int, Tuple[List[str], List[str]]] = {}
+    scored: List[ScoreTuple] = []
+    for final, key in zip(finals, keys):
+        template = templates.get(key)
+        if template is None:
+            template = templates[key] = _outcome(*_decode(key))
+        scored.append((final, list(template[0]), list(template[1])))
+    return scored
@@ -1,41 +1,263 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Tuple
-from datetime import datetime
+import asyncio
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from apps.scoring.ai_client import ai_score_deal, AIScoringError
+from apps.scoring.ai_async_client import aai_score_deal, aai_score_deals
+from apps.scoring.ai_client import ai_score_deal, ai_score_deals, AICircuitOpenError, AIScoringError
+from apps.scoring.cache import deal_fingerprint, score_cache
+from apps.scoring.heuristic import ScoreTuple, _departure_dt, compute_heuristic_scores
 from apps.deals.models import AirlineQuality
 
 
+def _merge_safety_badges(deal: Dict[str, Any], ai_badges: List[str]) -> List[str]:
+    # Merge AI badges with heuristic-only safety badges without changing AI score
+    merged_badges: List[str] = list(ai_badges)
+    layover_max = int(deal.get('layover_minutes_max') or 0)
+    try:
+        if layover_max >= 180 and '⏱️ Long layover' not in merged_badges:
+            merged_badges.append('⏱️ Long layover')
+    except Exception:
+        pass
+    dep_dt = _departure_dt(deal)
+    if dep_dt is not None and 0 <= dep_dt.hour <= 5 and '🌙 Red-eye' not in merged_badges:
+        merged_badges.append('🌙 Red-eye')
+    return merged_badges[:3]
+
+
+def _with_safety_badges(deal: Dict[str, Any], ai_result: ScoreTuple) -> ScoreTuple:
+    ai_score, ai_reasons, ai_badges = ai_result
+    return ai_score, list(ai_reasons), _merge_safety_badges(deal, ai_badges)
+
+
 def compute_deal_score(deal: Dict[str, Any]) -> Tuple[int, List[str], List[str]]:
     """Compute AI-driven score [0,100] with fallback heuristics and badges."""
+    use_cache = getattr(settings, 'AI_SCORE_CACHE_ENABLED', True)
+    key = deal_fingerprint(deal) if use_cache else None
+    if key:
+        cached = score_cache.get_many([key]).get(key)
+        if cached is not None:
+            ai_score, ai_reasons, ai_badges = cached
+            return ai_score, list(ai_reasons), _merge_safety_badges(deal, ai_badges)
     # Try AI
     try:
         ai_score, ai_reasons, ai_badges = ai_score_deal(deal)
-        # Merge AI badges with heuristic-only safety badges without changing AI score
-        merged_badges: List[str] = list(ai_badges)
-        # Heuristic safety badges
-        stops = int(deal.get('num_stops') or 0)
-        layover_max = int(deal.get('layover_minutes_max') or 0)
-        departure_iso = deal.get('departure_datetime')
-        try:
-            if layover_max >= 180 and '⏱️ Long layover' not in merged_badges:
-                merged_badges.append('⏱️ Long layover')
-        except Exception:
-            pass
-        try:
-            if departure_iso:
-                from datetime import datetime
-                dep_dt = datetime.fromisoformat(str(departure_iso).replace('Z', '+00:00'))
-                if 0 <= dep_dt.hour <= 5 and '🌙 Red-eye' not in merged_badges:
-                    merged_badges.append('🌙 Red-eye')
-        except Exception:
-            pass
-        return ai_score, ai_reasons, merged_badges[:3]
+        if key:
+            score_cache.set_many({key: (ai_score, ai_reasons, ai_badges)})
+        return ai_score, ai_reasons, _merge_safety_badges(deal, ai_badges)
     except AIScoringError:
         pass
+    return compute_heuristic_score(deal)
+
+
+def _batch_size(batch_size: Optional[int]) -> int:
+    if batch_size is None:
+        batch_size = int(getattr(settings, 'AI_SCORING_BATCH_SIZE', 10))
+    return batch_size
+
+
+def _lookup_cached_scores(
+    deals: List[Dict[str, Any]]
+) -> Tuple[List[Optional[ScoreTuple]], List[int], List[Optional[str]]]:
+    # Returns (ai_results, indexes still to score, cache keys)
+    ai_results: List[Optional[ScoreTuple]] = [None] * len(deals)
+    pending = list(range(len(deals)))
+    keys: List[Optional[str]] = [None] * len(deals)
+    if getattr(settings, 'AI_SCORE_CACHE_ENABLED', True):
+        keys = [deal_fingerprint(d) for d in deals]
+        cached = score_cache.get_many([k for k in keys if k])
+        pending = []
+        for i, key in enumerate(keys):
+            if key in cached:
+                ai_results[i] = cached[key]
+            else:
+                pending.append(i)
+    return ai_results, pending, keys
+
+
+def _finish_scores(
+    deals: List[Dict[str, Any]], ai_results: List[Optional[ScoreTuple]], keys: List[Optional[str]],
+    fresh_indexes: List[int],
+) -> List[ScoreTuple]:
+    score_cache.set_many({
+        keys[i]: ai_results[i] for i in fresh_indexes if keys[i] and ai_results[i] is not None
+    })
+    # Everything the AI left unscored goes through the heuristic in one batch
+    fallback = [i for i, res in enumerate(ai_results) if res is None]
+    heuristic = dict(zip(fallback, compute_heuristic_scores([deals[i] for i in fallback])))
+    scored: List[ScoreTuple] = []
+    for i, (deal, res) in enumerate(zip(deals, ai_results)):
+        if res is None:
+            scored.append(heuristic[i])
+            continue
+        scored.append(_with_safety_badges(deal, res))
+    return scored
+
+
+class _Budget:
+    """AI_SEARCH_BUDGET_SECONDS of AI time for one search, and what cut its scoring short."""
+
+    def __init__(self) -> None:
+        seconds = float(getattr(settings, 'AI_SEARCH_BUDGET_SECONDS', 8.0))
+        self.deadline = time.monotonic() + seconds if seconds > 0 else None
+        self.exhausted = False
+        self.circuit_open = False
+
+    def remaining(self) -> Optional[float]:
+        """Timeout for the next AI call (None: unlimited), or 0.0 once the budget is spent."""
+        if self.deadline is None:
+            return None
+        left = self.deadline - time.monotonic()
+        if left <= 0:
+            self.exhausted = True
+            return 0.0
+        return left
+
+    def report(self, stats: Optional[Dict[str, Any]], *, ai: int, cached: int, heuristic: int) -> None:
+        if stats is None:
+            return
+        stats.update({
+            'ai': ai,
+            'cached': cached,
+            'heuristic': heuristic,
+            'budget_exhausted': self.exhausted,
+            'circuit_open': self.circuit_open,
+        })
+
 
-    # Fallback heuristic
+def _chunks(pending: List[int], batch_size: int) -> List[List[int]]:
+    return [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+
+
+def _score_chunk(
+    deals: List[Dict[str, Any]], chunk: List[int], batch_size: int, timeout: Optional[float]
+) -> List[Optional[ScoreTuple]]:
+    if batch_size == 1:
+        # Same single-deal prompt as compute_deal_score
+        return [ai_score_deal(deals[chunk[0]], timeout)]
+    return ai_score_deals([deals[i] for i in chunk], timeout)
+
+
+def compute_deal_scores(
+    deals: List[Dict[str, Any]], batch_size: Optional[int] = None, stats: Optional[Dict[str, Any]] = None,
+) -> List[ScoreTuple]:
+    """Score many deals, packing ``batch_size`` deals into each AI call.
+
+    Cached AI grades are reused first; only cache misses go to the AI. Deals
+    the AI leaves out or answers malformed, whole batches whose call fails,
+    and every batch left once the search's AI budget is spent or the circuit
+    breaker opens fall back to the heuristic (compute_heuristic_scores, one
+    pass over all of them). ``stats`` gets how many deals took each path.
+    """
+    batch_size = max(1, _batch_size(batch_size))
+    ai_results, pending, keys = _lookup_cached_scores(deals)
+    budget = _Budget()
+    for chunk in _chunks(pending, batch_size):
+        timeout = budget.remaining()
+        if timeout == 0.0:
+            break
+        try:
+            chunk_results = _score_chunk(deals, chunk, batch_size, timeout)
+        except AICircuitOpenError:
+            budget.circuit_open = True
+            break
+        except AIScoringError:
+            continue
+        for i, res in zip(chunk, chunk_results):
+            ai_results[i] = res
+    fresh = sum(1 for i in pending if ai_results[i] is not None)
+    budget.report(stats, ai=fresh, cached=len(deals) - len(pending), heuristic=len(pending) - fresh)
+    return _finish_scores(deals, ai_results, keys, pending)
+
+
+def iter_ai_scores(
+    deals: List[Dict[str, Any]], batch_size: Optional[int] = None, stats: Optional[Dict[str, Any]] = None,
+) -> Iterator[List[Tuple[int, ScoreTuple]]]:
+    """AI grades for ``deals`` as they become available, for streaming responses.
+
+    Yields ``(index, score)`` pairs: cached grades first, then one list per
+    AI call. Fresh grades are cached as in compute_deal_scores, under the
+    same budget and circuit breaker. Deals the AI doesn't grade are never
+    yielded; their heuristic score stands. ``stats`` is filled once the
+    generator is exhausted.
+    """
+    batch_size = max(1, _batch_size(batch_size))
+    ai_results, pending, keys = _lookup_cached_scores(deals)
+    cached = [(i, res) for i, res in enumerate(ai_results) if res is not None]
+    if cached:
+        yield [(i, _with_safety_badges(deals[i], res)) for i, res in cached]
+    budget = _Budget()
+    ai_scored = 0
+    for chunk in _chunks(pending, batch_size):
+        timeout = budget.remaining()
+        if timeout == 0.0:
+            break
+        try:
+            results = _score_chunk(deals, chunk, batch_size, timeout)
+        except AICircuitOpenError:
+            budget.circuit_open = True
+            break
+        except AIScoringError:
+            continue
+        fresh = [(i, res) for i, res in zip(chunk, results) if res is not None]
+        score_cache.set_many({keys[i]: res for i, res in fresh if keys[i]})
+        ai_scored += len(fresh)
+        if fresh:
+            yield [(i, _with_safety_badges(deals[i], res)) for i, res in fresh]
+    budget.report(stats, ai=ai_scored, cached=len(cached), heuristic=len(pending) - ai_scored)
+
+
+async def acompute_deal_scores(
+    deals: List[Dict[str, Any]], batch_size: Optional[int] = None, stats: Optional[Dict[str, Any]] = None,
+) -> List[ScoreTuple]:
+    """Async compute_deal_scores: every AI batch is in flight at once.
+
+    Batches still running when the search's AI budget runs out are
+    cancelled and fall back to the heuristic. Cache and heuristic work
+    touch the database and run on a worker thread.
+    """
+    batch_size = max(1, _batch_size(batch_size))
+    ai_results, pending, keys = await sync_to_async(_lookup_cached_scores)(deals)
+    chunks = _chunks(pending, batch_size)
+    budget = _Budget()
+    timeout = budget.remaining()
+
+    async def score_chunk(chunk: List[int]) -> List[Optional[ScoreTuple]]:
+        if batch_size == 1:
+            return [await aai_score_deal(deals[chunk[0]], timeout)]
+        return await aai_score_deals([deals[i] for i in chunk], timeout)
+
+    tasks = [asyncio.ensure_future(score_chunk(c)) for c in chunks]
+    if tasks:
+        _, late = await asyncio.wait(tasks, timeout=timeout)
+        if late:
+            budget.exhausted = True
+            for task in late:
+                task.cancel()
+            # Let cancelled calls unwind (and report to the breaker) before returning
+            await asyncio.gather(*late, return_exceptions=True)
+    for chunk, task in zip(chunks, tasks):
+        if task.cancelled():
+            continue
+        outcome = task.exception()
+        if isinstance(outcome, AICircuitOpenError):
+            budget.circuit_open = True
+            continue
+        if isinstance(outcome, AIScoringError):
+            continue
+        if outcome is not None:
+            raise outcome
+        for i, res in zip(chunk, task.result()):
+            ai_results[i] = res
+    fresh = sum(1 for i in pending if ai_results[i] is not None)
+    budget.report(stats, ai=fresh, cached=len(deals) - len(pending), heuristic=len(pending) - fresh)
+    return await sync_to_async(_finish_scores)(deals, ai_results, keys, pending)
+
+
+def compute_heuristic_score(deal: Dict[str, Any]) -> Tuple[int, List[str], List[str]]:
+    """Rule-based score used when the AI is unavailable or gives no answer."""
     score = 50.0
     reasons: List[str] = []
     badges: List[str] = []
@@ -43,7 +265,6 @@ def compute_deal_score(deal: Dict[str, Any]) -> Tuple[int, List[str], List[str]]
     stops = int(deal.get('num_stops') or 0)
     layover_max = int(deal.get('layover_minutes_max') or 0)
     duration_min = int(deal.get('duration_minutes') or 0)
-    departure_iso = deal.get('departure_datetime')
 
     if stops == 0:
         score += 20
@@ -80,20 +301,14 @@ def compute_deal_score(deal: Dict[str, Any]) -> Tuple[int, List[str], List[str]]
         pass
 
     # Time-of-day preferences: red-eye penalty
-    try:
-        if departure_iso:
-            dep_dt = datetime.fromisoformat(str(departure_iso).replace('Z', '+00:00'))
-            if 0 <= dep_dt.hour <= 5:
-                score -= 4
-                reasons.append('Red-eye departure')
-                badges.append('🌙 Red-eye')
-    except Exception:
-        pass
+    dep_dt = _departure_dt(deal)
+    if dep_dt is not None and 0 <= dep_dt.hour <= 5:
+        score -= 4
+        reasons.append('Red-eye departure')
+        badges.append('🌙 Red-eye')
 
     score = max(0, min(100, int(round(score))))
     if score >= 85 and stops == 0:
         badges.append('🔥 Amazing deal')
 
     return score, reasons, badges
-
-
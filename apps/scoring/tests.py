@@ -0,0 +1,78 @@
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+
+from apps.deals.models import AirlineQuality
+from apps.scoring import ai_client
+from apps.scoring.ai_client import AIScoringError
+from apps.scoring.breaker import CLOSED, OPEN, ai_breaker
+from apps.providers.normalizer import normalize_flight_offer_records
+from apps.providers.sample_payloads import synthetic_flight_offers
+from apps.scoring.heuristic import compute_heuristic_scores, np
+from apps.scoring.service import compute_heuristic_score
+
+
+class HeuristicParityTests(TestCase):
+    """compute_heuristic_scores must return compute_heuristic_score's output, deal for deal."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Rated below 0.4 so the "Bad airline" rule fires
+        for code, rating in {'NK': 0.2, 'F9': 0.3, 'BA': 0.9}.items():
+            AirlineQuality.objects.create(carrier_code=code, score_float_0_1=rating)
+
+    def _deals(self):
+        deals = []
+        for seed in range(4):
+            raw = synthetic_flight_offers(150, seed=seed, round_trip=seed % 2 == 0)
+            deals.extend(normalize_flight_offer_records(raw, 1, 'ECONOMY'))
+        # Plain dicts too, and the edge cases: no departure time, missing fields
+        deals.extend(d.to_dict() for d in deals[:50])
+        deals.append({'airline_codes': ['NK'], 'departure_datetime': None})
+        deals.append({'num_stops': 3, 'layover_minutes_max': 600, 'duration_minutes': 2000,
+                      'departure_datetime': '2030-03-01T01:15:00Z'})
+        return deals
+
+    def test_batch_matches_per_deal(self):
+        deals = self._deals()
+        expected = [compute_heuristic_score(d) for d in deals]
+        for vectorized in (False, True):
+            if vectorized and np is None:
+                continue
+            with self.subTest(vectorized=vectorized), override_settings(HEURISTIC_VECTORIZED=vectorized):
+                self.assertEqual(compute_heuristic_scores(deals), expected)
+
+    def test_templates_are_copied(self):
+        scores = compute_heuristic_scores(self._deals()[:20])
+        scores[0][1].append('mutated')
+        self.assertNotIn('mutated', scores[1][1])
+
+    def test_empty(self):
+        self.assertEqual(compute_heuristic_scores([]), [])
+
+
+@override_settings(AI_REQUEST_TIMEOUT_SECONDS=30, AI_BREAKER_ENABLED=True, AI_BREAKER_MIN_CALLS=5)
+class BreakerBudgetTests(SimpleTestCase):
+    """Timeouts only count against the AI endpoint when the call had the full per-call timeout."""
+
+    def setUp(self):
+        ai_breaker.reset()
+        self.addCleanup(ai_breaker.reset)
+
+    def _timeouts(self, n, timeout):
+        with mock.patch.object(ai_client, '_chat_request', return_value=('u', {}, {})), \
+                mock.patch.object(ai_client._http(), 'post', side_effect=requests.Timeout('timed out')):
+            for _ in range(n):
+                with self.assertRaises(AIScoringError):
+                    ai_client._chat_completion('prompt', timeout)
+
+    def test_budget_timeouts_are_not_failures(self):
+        self._timeouts(10, 0.2)
+        self.assertEqual(ai_breaker.state, CLOSED)
+        self.assertEqual(ai_breaker.stats()['window_calls'], 0)
+
+    def test_full_timeouts_open_the_breaker(self):
+        self._timeouts(5, None)
+        self.assertEqual(ai_breaker.state, OPEN)
@@ -0,0 +1,374 @@
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from bisect import insort
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+
+from apps.deals.models import Airport
+from apps.deals.repository import upsert_airports
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_VERSION_KEY = 'airports:index:version'
+# Set while written-back airports wait for the next version bump
+_PENDING_KEY = 'airports:index:pending'
+# Present for AIRPORT_INDEX_BUMP_SECONDS after a write-back bump
+_BUMP_GATE_KEY = 'airports:index:bumped'
+_MISS_KEY_PREFIX = 'airports:miss:'
+
+# Added to an airport's popularity for the field a query token matched
+_FIELD_BONUS = {'iata': 50, 'city': 20, 'name': 0}
+# Candidates kept per trie node; multi-word queries filter these
+_TOP_K = 32
+
+# (iata, name, city, country)
+AirportRecord = Tuple[str, str, str, str]
+
+
+def _fold(text: str) -> str:
+    # "São Paulo" -> "sao paulo"
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(_fold(text))
+
+
+class _Node:
+    __slots__ = ('children', 'top')
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _Node] = {}
+        # (-weight, iata, record index), best first
+        self.top: List[Tuple[int, str, int]] = []
+
+
+def _merge_top(top: List[Tuple[int, str, int]], entry: Tuple[int, str, int]) -> None:
+    if len(top) >= _TOP_K and entry >= top[-1]:
+        return
+    for i, existing in enumerate(top):
+        if existing[2] == entry[2]:
+            if entry >= existing:
+                return
+            del top[i]
+            break
+    insort(top, entry)
+    del top[_TOP_K:]
+
+
+class AirportIndex:
+    """In-memory prefix trie over IATA code, city and name tokens.
+
+    Every node keeps its best ``_TOP_K`` airports (popularity plus a bonus for
+    the field that matched), so a prefix lookup is one walk down the trie.
+    Multi-word queries filter the first word's candidates by the other words.
+    Queries with no prefix match retry with one typo (substitution,
+    insertion, deletion or transposition).
+    """
+
+    def __init__(self) -> None:
+        # IATA codes and city/name words live in separate tries so typo
+        # matching only runs over words
+        self._codes = _Node()
+        self._words = _Node()
+        self._records: List[AirportRecord] = []
+        self._tokens: List[Set[str]] = []
+        self._by_iata: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, iata: str, name: str, city: str, country: str, popularity: int = 0) -> None:
+        iata = (iata or '').upper()
+        if len(iata) != 3 or not name:
+            return
+        with self._lock:
+            if iata in self._by_iata:
+                return
+            idx = len(self._records)
+            self._records.append((iata, name, city or '', country or ''))
+            self._by_iata[iata] = idx
+            fields = (('iata', [iata.lower()]), ('city', _tokens(city)), ('name', _tokens(name)))
+            self._tokens.append({tok for _, toks in fields for tok in toks})
+            for field, toks in fields:
+                entry = (-(int(popularity or 0) + _FIELD_BONUS[field]), iata, idx)
+                for tok in toks:
+                    node = self._codes if field == 'iata' else self._words
+                    for ch in tok:
+                        node = node.children.setdefault(ch, _Node())
+                        _merge_top(node.top, entry)
+
+    @staticmethod
+    def _find(root: _Node, prefix: str) -> Optional[_Node]:
+        node = root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def _fuzzy_nodes(self, prefix: str) -> Iterator[_Node]:
+        # Word-trie nodes reachable by ``prefix`` with exactly one edit
+        def walk(node: _Node, i: int, edited: bool) -> Iterator[_Node]:
+            if i == len(prefix):
+                if edited:
+                    yield node
+                    return
+                for child in node.children.values():  # missing last character
+                    yield child
+                return
+            ch = prefix[i]
+            child = node.children.get(ch)
+            if child is not None:
+                yield from walk(child, i + 1, edited)
+            if edited:
+                return
+            yield from walk(node, i + 1, True)  # extra character
+            for other, sub in node.children.items():
+                if other != ch:
+                    yield from walk(sub, i + 1, True)  # wrong character
+                    yield from walk(sub, i, True)  # missing character
+            if i + 1 < len(prefix):
+                swapped = node.children.get(prefix[i + 1])
+                swapped = swapped.children.get(ch) if swapped is not None else None
+                if swapped is not None:
+                    yield from walk(swapped, i + 2, True)  # transposed characters
+
+        yield from walk(self._words, 0, False)
+
+    def _matches_rest(self, idx: int, rest: List[str]) -> bool:
+        tokens = self._tokens[idx]
+        return all(any(t.startswith(q) for t in tokens) for q in rest)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, str]]:
+        words = _tokens(query)
+        if not words:
+            return []
+        head, rest = words[0], words[1:]
+        ranked: List[Tuple[int, str, int]] = []
+        seen: Set[int] = set()
+
+        exact = self._by_iata.get(head.upper()) if len(head) == 3 and not rest else None
+        if exact is not None:
+            ranked.append((-10 ** 9, '', exact))
+            seen.add(exact)
+
+        prefixed: List[Tuple[int, str, int]] = []
+        for root in (self._codes, self._words):
+            node = self._find(root, head)
+            if node is None:
+                continue
+            for entry in node.top:
+                if entry[2] not in seen and self._matches_rest(entry[2], rest):
+                    prefixed.append(entry)
+                    seen.add(entry[2])
+        ranked.extend(sorted(prefixed))
+        if not ranked and len(head) >= 4:
+            fuzzy: List[Tuple[int, str, int]] = []
+            for fuzzy_node in self._fuzzy_nodes(head):
+                for entry in fuzzy_node.top:
+                    if entry[2] not in seen and self._matches_rest(entry[2], rest):
+                        fuzzy.append(entry)
+                        seen.add(entry[2])
+            ranked = sorted(fuzzy)
+
+        results = []
+        for _, _, idx in ranked[:limit]:
+            iata, name, city, country = self._records[idx]
+            results.append({'iata': iata, 'name': name, 'city': city, 'country': country})
+        return results
+
+    @classmethod
+    def from_database(cls) -> 'AirportIndex':
+        index = cls()
+        rows = Airport.objects.order_by('-popularity').values_list('iata', 'name', 'city', 'country', 'popularity')
+        for iata, name, city, country, popularity in rows.iterator(chunk_size=2000):
+            index.add(iata, name, city, country, popularity)
+        return index
+
+
+_index: Optional[AirportIndex] = None
+_index_version: Optional[str] = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+_rebuilding = threading.Event()
+
+
+def _build() -> AirportIndex:
+    global _index, _index_version, _index_checked_at
+    version = cache.get(_VERSION_KEY)
+    started = time.perf_counter()
+    index = AirportIndex.from_database()
+    _index, _index_version, _index_checked_at = index, version, time.monotonic()
+    logger.info("Airport index built: %d airports in %.0fms", len(index), (time.perf_counter() - started) * 1000)
+    return index
+
+
+def _rebuild_in_background() -> None:
+    if _rebuilding.is_set():
+        return
+    _rebuilding.set()
+
+    def run() -> None:
+        try:
+            with _index_lock:
+                _build()
+        except DatabaseError:
+            logger.exception("Airport index rebuild failed")
+        finally:
+            _rebuilding.clear()
+
+    threading.Thread(target=run, name='airport-index', daemon=True).start()
+
+
+def get_airport_index() -> AirportIndex:
+    """The process-wide index; built on first use and rebuilt when another process bumps its version."""
+    global _index_checked_at
+    index = _index
+    if index is None:
+        with _index_lock:
+            return _index if _index is not None else _build()
+    if time.monotonic() - _index_checked_at >= float(getattr(settings, 'AIRPORT_INDEX_CHECK_SECONDS', 60)):
+        _index_checked_at = time.monotonic()
+        _bump_if_due()
+        if cache.get(_VERSION_KEY) != _index_version:
+            _rebuild_in_background()
+    return index
+
+
+def airport_index_ready() -> bool:
+    return _index is not None
+
+
+def bump_airport_index_version() -> str:
+    """Tell every worker to rebuild its index (e.g. after a bulk load)."""
+    version = uuid.uuid4().hex
+    cache.set(_VERSION_KEY, version, timeout=None)
+    return version
+
+
+def _bump_if_due() -> Optional[str]:
+    """Bump the version for pending write-backs, at most once per AIRPORT_INDEX_BUMP_SECONDS fleet-wide."""
+    if not cache.get(_PENDING_KEY):
+        return None
+    if not cache.add(_BUMP_GATE_KEY, 1, timeout=int(getattr(settings, 'AIRPORT_INDEX_BUMP_SECONDS', 600))):
+        return None
+    # Cleared first, so rows written back from here on wait for the next bump
+    cache.delete(_PENDING_KEY)
+    return bump_airport_index_version()
+
+
+def warm_airport_index() -> None:
+    """Build the index on a background thread so the first keystroke doesn't pay for it."""
+    if getattr(settings, 'AIRPORT_INDEX_ENABLED', True):
+        _rebuild_in_background()
+
+
+def airport_rows_from_locations(res: Any) -> List[Dict[str, Any]]:
+    """Airport rows (with coordinates) from an Amadeus locations response."""
+    rows = []
+    for item in (res or {}).get('data', []):
+        code = item.get('iataCode')
+        name = item.get('name')
+        if not code or not name:
+            continue
+        geo = item.get('geoCode') or {}
+        rows.append({
+            'iata': code,
+            'name': name,
+            'city': (item.get('address') or {}).get('cityName'),
+            'country': (item.get('address') or {}).get('countryName'),
+            'lat': geo.get('latitude'),
+            'lon': geo.get('longitude'),
+        })
+    return rows
+
+
+def airports_payload(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{'iata': r['iata'], 'name': r['name'], 'city': r['city'], 'country': r['country']} for r in rows]
+
+
+def _miss_key(query: str) -> str:
+    return f"{_MISS_KEY_PREFIX}{' '.join(_tokens(query))}"
+
+
+def remember_airports(rows: List[Dict[str, Any]]) -> None:
+    """Write provider results back to the Airport table and the live index.
+
+    This worker adds the rows to its index in place. Other workers rebuild
+    theirs on a version bump, and write-backs only bump it in batches (see
+    _bump_if_due), so rare queries don't rebuild every index in the fleet.
+    """
+    if not rows:
+        return
+    upsert_airports(rows, overwrite=False)
+    if _index is not None:
+        for r in rows:
+            _index.add(r['iata'], r['name'], r.get('city') or '', r.get('country') or '')
+    cache.set(_PENDING_KEY, 1, timeout=None)
+    _bump_if_due()
+
+
+def _index_enabled() -> bool:
+    return getattr(settings, 'AIRPORT_INDEX_ENABLED', True)
+
+
+def lookup_airports(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """Autocomplete from the local index, falling back to Amadeus on a miss.
+
+    Provider results are written back so the next lookup is served locally;
+    queries the provider has nothing for are remembered for
+    AIRPORT_MISS_TTL_SECONDS.
+    """
+    from apps.providers.amadeus_client import get_amadeus_client
+
+    if _index_enabled():
+        results = get_airport_index().search(query, limit)
+        if results:
+            return results
+        if cache.get(_miss_key(query)):
+            return []
+    rows = airport_rows_from_locations(
+        get_amadeus_client().search_locations(keyword=query, subType='AIRPORT', limit=limit)
+    )
+    if _index_enabled():
+        if rows:
+            remember_airports(rows)
+        else:
+            cache.set(_miss_key(query), 1, timeout=int(getattr(settings, 'AIRPORT_MISS_TTL_SECONDS', 3600)))
+    return airports_payload(rows)
+
+
+async def alookup_airports(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """lookup_airports for async views; only the fallback and write-back leave the loop."""
+    from apps.providers.amadeus_async_client import get_async_amadeus_client
+
+    if _index_enabled():
+        index = get_airport_index() if airport_index_ready() else await sync_to_async(get_airport_index)()
+        results = index.search(query, limit)
+        if results:
+            return results
+        if await cache.aget(_miss_key(query)):
+            return []
+    rows = airport_rows_from_locations(
+        await get_async_amadeus_client().search_locations(keyword=query, subType='AIRPORT', limit=limit)
+    )
+    if _index_enabled():
+        if rows:
+            await sync_to_async(remember_airports)(rows)
+        else:
+            await cache.aset(_miss_key(query), 1, timeout=int(getattr(settings, 'AIRPORT_MISS_TTL_SECONDS', 3600)))
+    return airports_payload(rows)
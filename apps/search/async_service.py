@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from apps.providers.amadeus_async_client import AsyncAmadeusClient, get_async_amadeus_client
+from apps.providers.records import DealRecord
+from apps.scoring.service import acompute_deal_scores
+from apps.search.inspiration import aget_flight_destinations
+from apps.search.service import (
+    _add_deep_links,
+    _apply_baselines,
+    _apply_scores,
+    _inspiration_candidates,
+    _normalize_and_filter,
+    _offer_params,
+    _rank,
+    _shortlist,
+)
+
+
+async def _afan_out_destinations(
+    client: AsyncAmadeusClient, params: Dict[str, Any], candidates: List[str]
+) -> Tuple[List[Dict[str, Any]], List[str], List[str]]:
+    """asyncio version of _fan_out_destinations with the same deadline semantics."""
+    semaphore = asyncio.Semaphore(max(1, int(getattr(settings, 'SEARCH_ANYWHERE_CONCURRENCY', 5))))
+    deadline = time.monotonic() + float(getattr(settings, 'SEARCH_ANYWHERE_DEADLINE_SECONDS', 12.0))
+
+    async def fetch(dst: str) -> Any:
+        async with semaphore:
+            return await client.search_flight_offers(**{**params, 'destinationLocationCode': dst})
+
+    tasks = {asyncio.ensure_future(fetch(dst)): dst for dst in candidates}
+    done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.monotonic()))
+    for task in pending:
+        task.cancel()
+
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    failed: List[str] = []
+    for task in done:
+        dst = tasks[task]
+        if task.exception() is not None:
+            failed.append(dst)
+            continue
+        res = task.result()
+        if res and res.get('data'):
+            results[dst] = res.get('data')
+
+    # Report in candidate order like the threaded fan-out
+    late = {tasks[t] for t in pending}
+    dropped = [dst for dst in candidates if dst in late]
+    failed = [dst for dst in candidates if dst in set(failed)]
+    offers: List[Dict[str, Any]] = []
+    for dst in candidates:
+        offers.extend(results.get(dst) or [])
+    return offers, dropped, failed
+
+
+async def asearch_deals(
+    *,
+    one_way: bool,
+    origin: str,
+    destination: Optional[str],
+    departure_date: str,
+    return_date: Optional[str],
+    travelers: int,
+    cabin: Optional[str],
+    stops: str,
+    duration_range: Optional[Dict[str, int]],
+    limit: int = 50,
+    meta: Optional[Dict[str, Any]] = None,
+) -> List[DealRecord]:
+    """Async search_deals: provider and AI calls are awaited, never block a thread.
+
+    Normalizing and ranking are CPU-only and run inline; baselines read the
+    database and go through sync_to_async.
+    """
+    client = get_async_amadeus_client()
+    params = _offer_params(
+        one_way=one_way, origin=origin, destination=destination, departure_date=departure_date,
+        return_date=return_date, travelers=travelers, cabin=cabin, stops=stops, limit=limit,
+    )
+
+    if destination:
+        raw = await client.search_flight_offers(**params)
+    else:
+        candidates = _inspiration_candidates(
+            await aget_flight_destinations(client, origin=origin, one_way=one_way)
+        )
+        offers, dropped, failed = (
+            await _afan_out_destinations(client, params, candidates) if candidates else ([], [], [])
+        )
+        if meta is not None:
+            meta['anywhere'] = {
+                'candidates': candidates,
+                'dropped': dropped,
+                'failed': failed,
+            }
+        raw = { 'data': offers }
+    normalized = _normalize_and_filter(
+        raw, travelers=travelers, cabin=cabin, stops=stops, one_way=one_way, duration_range=duration_range,
+    )
+    await sync_to_async(_apply_baselines)(normalized)
+    shortlist = _shortlist(normalized, limit, meta)
+    _add_deep_links(shortlist)
+
+    scoring = meta.setdefault('scoring', {}) if meta is not None else None
+    _apply_scores(shortlist, await acompute_deal_scores(shortlist, stats=scoring))
+    return _rank(shortlist, limit)
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from apps.providers.ratelimit import BACKGROUND, request_lane
+from apps.search.singleflight import search_flight
+
+logger = logging.getLogger(__name__)
+
+CACHE_HIT = 'HIT'
+CACHE_STALE = 'STALE'
+CACHE_MISS = 'MISS'
+
+_KEY_PREFIX = 'search:result:'
+
+
+def result_cache_key(search_hash: str, *, limit: int, duration_range: Optional[Dict[str, int]]) -> str:
+    # The search hash covers the provider query; limit and trip length shape the response
+    duration_range = duration_range or {}
+    return f"{_KEY_PREFIX}{search_hash}:{limit}:{duration_range.get('min', '')}:{duration_range.get('max', '')}"
+
+
+def _fresh_seconds() -> int:
+    return int(getattr(settings, 'SEARCH_CACHE_FRESH_SECONDS', 300))
+
+
+def _stale_seconds() -> int:
+    return int(getattr(settings, 'SEARCH_CACHE_STALE_SECONDS', 1800))
+
+
+def store_result(key: str, payload: Dict[str, Any]) -> None:
+    entry = {'payload': payload, 'stored_at': time.time()}
+    cache.set(key, entry, timeout=_fresh_seconds() + _stale_seconds())
+
+
+def lookup_result(key: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Return (payload, state) where state is HIT, STALE or MISS."""
+    return _classify(cache.get(key))
+
+
+def _classify(entry: Optional[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], str]:
+    if not entry:
+        return None, CACHE_MISS
+    age = time.time() - float(entry.get('stored_at') or 0)
+    if age < _fresh_seconds():
+        return entry['payload'], CACHE_HIT
+    if age < _fresh_seconds() + _stale_seconds():
+        return entry['payload'], CACHE_STALE
+    return None, CACHE_MISS
+
+
+def _refresh(key: str, compute: Callable[[], Dict[str, Any]]) -> None:
+    try:
+        # Nobody is waiting on a refresh, so its provider calls yield to live searches
+        with request_lane(BACKGROUND):
+            store_result(key, search_flight.do(key, compute))
+    except Exception:
+        logger.exception("Background refresh failed for %s", key)
+    finally:
+        cache.delete(f"{key}:refreshing")
+        close_old_connections()
+
+
+def refresh_in_background(key: str, compute: Callable[[], Dict[str, Any]]) -> bool:
+    """Recompute ``key`` on a daemon thread unless a refresh is already running."""
+    # cache.add is our cross-worker "refresh in progress" marker
+    if not cache.add(f"{key}:refreshing", 1, timeout=max(60, _fresh_seconds())):
+        return False
+    threading.Thread(target=_refresh, args=(key, compute), name='search-cache-refresh', daemon=True).start()
+    return True
+
+
+def cached_search(key: str, compute: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], str]:
+    """Serve ``key`` stale-while-revalidate; ``compute`` runs the full pipeline.
+
+    Fresh entries are returned as-is, stale ones are returned immediately and
+    refreshed in the background. Misses run ``compute`` once per key however
+    many callers are waiting on it, and store the result.
+    """
+    if not getattr(settings, 'SEARCH_CACHE_ENABLED', True):
+        return search_flight.do(key, compute), CACHE_MISS
+    payload, state = lookup_result(key)
+    if state == CACHE_HIT:
+        return payload, state
+    if state == CACHE_STALE:
+        refresh_in_background(key, compute)
+        return payload, state
+
+    def compute_and_store() -> Dict[str, Any]:
+        result = compute()
+        store_result(key, result)
+        return result
+
+    def recheck() -> Optional[Dict[str, Any]]:
+        # Another worker may have finished this search while we waited on its lock
+        fresh, fresh_state = lookup_result(key)
+        return fresh if fresh_state == CACHE_HIT else None
+
+    return search_flight.do(key, compute_and_store, recheck=recheck), CACHE_MISS
+
+
+# Strong references to background refreshes so the loop can't drop them mid-flight
+_refresh_tasks: Set[asyncio.Task] = set()
+
+
+async def alookup_result(key: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    return _classify(await cache.aget(key))
+
+
+async def astore_result(key: str, payload: Dict[str, Any]) -> None:
+    entry = {'payload': payload, 'stored_at': time.time()}
+    await cache.aset(key, entry, timeout=_fresh_seconds() + _stale_seconds())
+
+
+async def _arefresh(key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> None:
+    try:
+        with request_lane(BACKGROUND):
+            await astore_result(key, await search_flight.ado(key, compute))
+    except Exception:
+        logger.exception("Background refresh failed for %s", key)
+    finally:
+        await cache.adelete(f"{key}:refreshing")
+
+
+async def arefresh_in_background(key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> bool:
+    """refresh_in_background for async pipelines: the refresh runs as a task on the current loop."""
+    if not await cache.aadd(f"{key}:refreshing", 1, timeout=max(60, _fresh_seconds())):
+        return False
+    task = asyncio.get_running_loop().create_task(_arefresh(key, compute))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+    return True
+
+
+async def acached_search(
+    key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Tuple[Dict[str, Any], str]:
+    """cached_search for async pipelines; shares entries with the sync path."""
+    if not getattr(settings, 'SEARCH_CACHE_ENABLED', True):
+        return await search_flight.ado(key, compute), CACHE_MISS
+    payload, state = await alookup_result(key)
+    if state == CACHE_HIT:
+        return payload, state
+    if state == CACHE_STALE:
+        await arefresh_in_background(key, compute)
+        return payload, state
+
+    async def compute_and_store() -> Dict[str, Any]:
+        result = await compute()
+        await astore_result(key, result)
+        return result
+
+    async def recheck() -> Optional[Dict[str, Any]]:
+        fresh, fresh_state = await alookup_result(key)
+        return fresh if fresh_state == CACHE_HIT else None
+
+    return await search_flight.ado(key, compute_and_store, recheck=recheck), CACHE_MISS
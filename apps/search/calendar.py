@@ -0,0 +1,209 @@
+"""Flexible-date calendar search: the cheapest fare and best score per departure day.
+
+A calendar is a grid of cells, one per (departure date, trip length), each
+a single Flight Offers Search call. Cells are cached separately under the
+same search hash a normal search would use, so overlapping windows and
+repeat visits only fetch the days they have not seen. Missing cells are
+fetched on a bounded worker pool. Every call still goes through the
+Amadeus client's token bucket, so a wide window queues behind the quota
+and does not burst past it.
+
+Scores are the heuristic's, because a month of days would otherwise cost a
+month of AI calls. A full search of the chosen day gets the AI grade.
+"""
+from __future__ import annotations
+
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.deals.repository import _compute_search_hash
+from apps.providers.amadeus_client import AmadeusClient, get_amadeus_client
+from apps.providers.records import DealRecord
+from apps.scoring.heuristic import compute_heuristic_scores
+from apps.search.service import _normalize_and_filter, _offer_params
+from apps.search.singleflight import search_flight
+
+_KEY_PREFIX = 'search:calendar:'
+
+# (departure date, trip length in days or None for one-way)
+Cell = Tuple[date, Optional[int]]
+
+
+def calendar_cells(start: date, end: date, trip_lengths: Optional[List[int]]) -> List[Cell]:
+    days = (end - start).days + 1
+    return [
+        (start + timedelta(days=offset), length)
+        for offset in range(days)
+        for length in (trip_lengths or [None])
+    ]
+
+
+def _cell_params(
+    cell: Cell, *, origin: str, destination: str, travelers: int, cabin: Optional[str], stops: str,
+) -> Dict[str, Any]:
+    departure, length = cell
+    return {
+        'origin': origin,
+        'destination': destination,
+        'departure_date': departure.isoformat(),
+        'return_date': (departure + timedelta(days=length)).isoformat() if length is not None else None,
+        'travelers': travelers,
+        'cabin': cabin,
+        'stops': stops,
+    }
+
+
+def _cell_key(params: Dict[str, Any]) -> str:
+    return f"{_KEY_PREFIX}{_compute_search_hash(params)}"
+
+
+def _summarize(deals: List[DealRecord]) -> Dict[str, Any]:
+    # The compact form a cell is cached in: its cheapest fare and best score
+    if not deals:
+        return {'price': None, 'currency': None, 'score': None, 'offers': 0}
+    cheapest = min(deals, key=lambda d: d.price_total or 0.0)
+    scores = compute_heuristic_scores(deals)
+    return {
+        'price': cheapest.price_total,
+        'currency': cheapest.currency,
+        'score': max(score for score, _, _ in scores),
+        'offers': len(deals),
+    }
+
+
+def _fetch_cell(client: AmadeusClient, params: Dict[str, Any]) -> List[DealRecord]:
+    one_way = params['return_date'] is None
+    raw = client.search_flight_offers(**_offer_params(
+        one_way=one_way, origin=params['origin'], destination=params['destination'],
+        departure_date=params['departure_date'], return_date=params['return_date'],
+        travelers=params['travelers'], cabin=params['cabin'], stops=params['stops'],
+        limit=int(getattr(settings, 'CALENDAR_OFFERS_PER_CELL', 50)),
+    ))
+    return _normalize_and_filter(
+        raw, travelers=params['travelers'], cabin=params['cabin'], stops=params['stops'], one_way=one_way,
+        duration_range=None,
+    )
+
+
+def _fetch_cells(
+    client: AmadeusClient, todo: Dict[str, Dict[str, Any]]
+) -> Tuple[Dict[str, Dict[str, Any]], List[str], List[Tuple[str, BaseException]]]:
+    """Fetch and cache cells by cache key on a bounded pool, like the "Anywhere" fan-out.
+
+    Returns (summaries, dropped keys, (key, error) pairs). Keys still
+    pending at CALENDAR_DEADLINE_SECONDS are dropped. Workers only call the
+    provider; scoring and caching happen on the calling thread.
+    """
+    concurrency = max(1, int(getattr(settings, 'CALENDAR_CONCURRENCY', 4)))
+    deadline = time.monotonic() + float(getattr(settings, 'CALENDAR_DEADLINE_SECONDS', 20.0))
+
+    def fetch(key: str) -> List[DealRecord]:
+        # Concurrent calendars over the same days share each cell's provider call
+        return search_flight.do(key, lambda: _fetch_cell(client, todo[key]))
+
+    results: Dict[str, Dict[str, Any]] = {}
+    failed: List[Tuple[str, BaseException]] = []
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, len(todo)) or 1)
+    try:
+        # Workers run in a copy of our context so calls keep the caller's rate-limit lane
+        pending = {executor.submit(contextvars.copy_context().run, fetch, key): key for key in todo}
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                key = pending.pop(fut)
+                try:
+                    results[key] = _summarize(fut.result())
+                except Exception as e:
+                    failed.append((key, e))
+        dropped = list(pending.values())
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    cache.set_many(results, timeout=int(getattr(settings, 'CALENDAR_CACHE_SECONDS', 900)))
+    return results, dropped, failed
+
+
+def calendar_search(
+    *,
+    origin: str,
+    destination: str,
+    start: date,
+    end: date,
+    trip_lengths: Optional[List[int]],
+    travelers: int,
+    cabin: Optional[str],
+    stops: str,
+) -> Dict[str, Any]:
+    """The price matrix for departures from ``start`` to ``end`` (inclusive).
+
+    ``prices`` and ``scores`` have one row per date and one column per trip
+    length (a single column for one-way). Cells with no offers are null, and
+    so are cells that failed or missed the deadline; meta lists those by
+    date. Provider errors are raised only when no cell could be filled.
+    """
+    cells = calendar_cells(start, end, trip_lengths)
+    params = {
+        cell: _cell_params(cell, origin=origin, destination=destination, travelers=travelers, cabin=cabin, stops=stops)
+        for cell in cells
+    }
+    keys = {cell: _cell_key(p) for cell, p in params.items()}
+    summaries: Dict[str, Dict[str, Any]] = cache.get_many(list(keys.values()))
+    cached = len(summaries)
+    todo = {keys[cell]: params[cell] for cell in cells if keys[cell] not in summaries}
+    dropped: List[str] = []
+    failed: List[Tuple[str, BaseException]] = []
+    if todo:
+        fetched, dropped, failed = _fetch_cells(get_amadeus_client(), todo)
+        summaries.update(fetched)
+        if failed and not summaries:
+            raise failed[0][1]
+
+    def label(key: str) -> str:
+        p = todo[key]
+        return f"{p['departure_date']}/{p['return_date']}" if p['return_date'] else p['departure_date']
+
+    dates = sorted({cell[0] for cell in cells})
+    lengths: List[Optional[int]] = list(trip_lengths or [None])
+    prices: List[List[Optional[float]]] = []
+    scores: List[List[Optional[int]]] = []
+    cheapest: Optional[Dict[str, Any]] = None
+    currency: Optional[str] = None
+    for day in dates:
+        price_row: List[Optional[float]] = []
+        score_row: List[Optional[int]] = []
+        for length in lengths:
+            summary = summaries.get(keys[(day, length)]) or {}
+            price, score = summary.get('price'), summary.get('score')
+            price_row.append(price)
+            score_row.append(score)
+            if price is not None and (cheapest is None or price < cheapest['price']):
+                cheapest = {'date': day.isoformat(), 'trip_length': length, 'price': price}
+                currency = summary.get('currency')
+        prices.append(price_row)
+        scores.append(score_row)
+
+    return {
+        'origin': origin,
+        'destination': destination,
+        'dates': [day.isoformat() for day in dates],
+        'trip_lengths': trip_lengths or None,
+        'currency': currency,
+        'prices': prices,
+        'scores': scores,
+        'cheapest': cheapest,
+        'meta': {
+            'cells': len(cells),
+            'cached': cached,
+            'fetched': len(todo) - len(dropped) - len(failed),
+            'dropped': sorted(label(key) for key in dropped),
+            'failed': sorted(label(key) for key, _ in failed),
+        },
+    }
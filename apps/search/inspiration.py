@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.providers.amadeus_client import AmadeusApiError
+
+_KEY_PREFIX = 'inspiration:'
+
+# Provider statuses that mean "no inspiration data for this origin" rather
+# than an outage, so they are cached like an empty result
+_NEGATIVE_STATUSES = {400, 404}
+
+_counters = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'negative_stored': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def inspiration_cache_key(origin: str, one_way: bool, month: Optional[str] = None) -> str:
+    # The inspiration list is not tied to a travel date; rolling the key monthly
+    # keeps entries from outliving the fares they were ranked on
+    month = month or datetime.now(timezone.utc).strftime('%Y-%m')
+    return f"{_KEY_PREFIX}{origin.upper()}:{'1' if one_way else '0'}:{month}"
+
+
+def _ttl() -> int:
+    return int(getattr(settings, 'INSPIRATION_CACHE_TTL_SECONDS', 24 * 3600))
+
+
+def _negative_ttl() -> int:
+    return int(getattr(settings, 'INSPIRATION_NEGATIVE_TTL_SECONDS', 6 * 3600))
+
+
+def _from_cache(entry: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if entry is None:
+        _count('misses')
+        return None
+    _count('negative_hits' if not entry.get('data') else 'hits')
+    return entry
+
+
+def _to_cache(res: Any) -> Tuple[Dict[str, Any], int]:
+    data = (res or {}).get('data') or []
+    if not data:
+        _count('negative_stored')
+        return {'data': []}, _negative_ttl()
+    return {'data': data}, _ttl()
+
+
+def _enabled() -> bool:
+    return getattr(settings, 'INSPIRATION_CACHE_ENABLED', True)
+
+
+def get_flight_destinations(client: Any, *, origin: str, one_way: bool, refresh: bool = False) -> Dict[str, Any]:
+    """Cached ``client.flight_destinations`` for an origin.
+
+    Results are kept for INSPIRATION_CACHE_TTL_SECONDS. Origins with no data
+    (an empty list or a 400/404 from the provider) are cached as an empty
+    list for INSPIRATION_NEGATIVE_TTL_SECONDS. ``refresh`` skips the lookup
+    and re-fetches.
+    """
+    if not _enabled():
+        return client.flight_destinations(origin=origin, oneWay=str(one_way).lower())
+    key = inspiration_cache_key(origin, one_way)
+    if not refresh:
+        cached = _from_cache(cache.get(key))
+        if cached is not None:
+            return cached
+    try:
+        res = client.flight_destinations(origin=origin, oneWay=str(one_way).lower())
+    except AmadeusApiError as e:
+        if e.status_code not in _NEGATIVE_STATUSES:
+            raise
+        res = None
+    entry, ttl = _to_cache(res)
+    cache.set(key, entry, timeout=ttl)
+    return entry
+
+
+async def aget_flight_destinations(client: Any, *, origin: str, one_way: bool) -> Dict[str, Any]:
+    """get_flight_destinations for the asyncio client."""
+    if not _enabled():
+        return await client.flight_destinations(origin=origin, oneWay=str(one_way).lower())
+    key = inspiration_cache_key(origin, one_way)
+    cached = _from_cache(await cache.aget(key))
+    if cached is not None:
+        return cached
+    try:
+        res = await client.flight_destinations(origin=origin, oneWay=str(one_way).lower())
+    except AmadeusApiError as e:
+        if e.status_code not in _NEGATIVE_STATUSES:
+            raise
+        res = None
+    entry, ttl = _to_cache(res)
+    await cache.aset(key, entry, timeout=ttl)
+    return entry
+
+
+def inspiration_cache_stats() -> Dict[str, Any]:
+    with _counters_lock:
+        counters = dict(_counters)
+    lookups = counters['hits'] + counters['negative_hits'] + counters['misses']
+    counters['hit_rate'] = round((counters['hits'] + counters['negative_hits']) / lookups, 4) if lookups else None
+    return counters
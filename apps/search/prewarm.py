@@ -0,0 +1,295 @@
+"""Pre-warming of popular searches, mined from SearchRequest history.
+
+Every search is logged with its route, dates, and the cache state it was
+served from. A warm target is a popular search pattern, with dates made
+relative to the day it was searched: "JFK-LHR, 14 days out, 7-day trip,
+1 traveler". Each run re-runs the most popular targets for today's dates
+through search_deals and persist_deals. That refreshes offers, baselines,
+scores, stored deals and the leaderboards. The payload is stored under
+the exact result-cache key the live view would use, so the next live
+search for that pattern is a cache hit. The API layer's payload builder
+is passed in by the caller (wsgi/asgi, the management command), so this
+module stays independent of the serializers.
+
+Runs are low priority in two ways. Their Amadeus calls use the
+``background`` lane, and they spend at most PREWARM_CALLS_PER_HOUR
+provider calls per clock hour. Every warmer, whether the management
+command or the in-process loop of any worker, counts against that one
+budget, kept in the shared cache.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from apps.common.locks import FileLock
+from apps.deals.models import SearchRequest
+from apps.deals.repository import _compute_search_hash, persist_deals
+from apps.providers.amadeus_client import AmadeusApiError, AmadeusAuthError
+from apps.providers.records import DealRecord
+from apps.providers.ratelimit import BACKGROUND, request_lane
+from apps.search.cache import CACHE_HIT, CACHE_MISS, CACHE_STALE, lookup_result, result_cache_key, store_result
+from apps.search.service import search_deals
+from apps.search.singleflight import search_flight
+
+logger = logging.getLogger(__name__)
+
+# Amadeus only sells about a year ahead
+_MAX_OFFSET_DAYS = 330
+
+_BUDGET_KEY_PREFIX = 'prewarm:calls:'
+
+# (deals, meta) -> the response body the live view caches for a search
+PayloadBuilder = Callable[[List[DealRecord], Dict[str, Any]], Dict[str, Any]]
+
+
+@dataclass(frozen=True)
+class WarmTarget:
+    """A popular search, with dates relative to the day it is run."""
+
+    one_way: bool
+    origin: str
+    destination: Optional[str]
+    offset_days: int
+    trip_days: Optional[int]
+    travelers: int
+    cabin: Optional[str]
+    stops: str
+    limit: int
+    # (min, max) trip-length filter, as the search asked for it
+    duration_range: Optional[Tuple[Optional[int], Optional[int]]]
+
+    def search_params(self, today: date) -> Dict[str, Any]:
+        # Same shape as the view's search params, so the search hash matches
+        departure = today + timedelta(days=self.offset_days)
+        return {
+            'origin': self.origin,
+            'destination': self.destination or '',
+            'departure_date': departure.isoformat(),
+            'return_date': None if self.trip_days is None else (departure + timedelta(days=self.trip_days)).isoformat(),
+            'travelers': self.travelers,
+            'cabin': self.cabin,
+            'stops': self.stops,
+        }
+
+    def duration_range_dict(self) -> Optional[Dict[str, int]]:
+        if self.duration_range is None:
+            return None
+        return {k: v for k, v in zip(('min', 'max'), self.duration_range) if v is not None}
+
+    def cache_key(self, today: date) -> str:
+        return result_cache_key(
+            _compute_search_hash(self.search_params(today)), limit=self.limit, duration_range=self.duration_range_dict(),
+        )
+
+    def call_cost(self) -> int:
+        # Provider calls one warm costs at most: "Anywhere" is inspiration plus the fan-out
+        if self.destination:
+            return 1
+        return 1 + int(getattr(settings, 'SEARCH_ANYWHERE_CANDIDATES', 10))
+
+    def label(self) -> str:
+        trip = 'one-way' if self.trip_days is None else f'{self.trip_days}d trip'
+        return f"{self.origin}-{self.destination or 'ANY'} +{self.offset_days}d {trip}"
+
+
+def _iso_date(value: Any) -> Optional[date]:
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def target_from_params(params: Dict[str, Any], searched_on: date) -> Optional[WarmTarget]:
+    """The WarmTarget a logged search belongs to, or None if it can't be replayed."""
+    origin = str(params.get('origin') or '').upper()
+    departure = _iso_date(params.get('departure_date'))
+    if len(origin) != 3 or departure is None:
+        return None
+    offset = (departure - searched_on).days
+    if not 0 <= offset <= _MAX_OFFSET_DAYS:
+        return None
+    returning = _iso_date(params['return_date']) if params.get('return_date') else None
+    one_way = params.get('one_way')
+    if one_way is None:
+        # Logged before the trip type was recorded
+        one_way = returning is None
+    if not one_way and (returning is None or returning < departure):
+        return None
+    duration_range = params.get('duration_range') or None
+    return WarmTarget(
+        one_way=bool(one_way),
+        origin=origin,
+        destination=str(params.get('destination') or '').upper() or None,
+        offset_days=offset,
+        trip_days=None if one_way else (returning - departure).days,
+        travelers=int(params.get('travelers') or 1),
+        cabin=params.get('cabin') or None,
+        stops=params.get('stops') or 'any',
+        limit=int(params.get('limit') or 50),
+        duration_range=None if not duration_range else (duration_range.get('min'), duration_range.get('max')),
+    )
+
+
+def _history(days: int) -> List[Tuple[WarmTarget, Dict[str, Any]]]:
+    since = timezone.now() - timedelta(days=days)
+    rows = SearchRequest.objects.filter(created_at__gte=since).values_list('params_json', 'created_at').iterator()
+    history = []
+    for params, created_at in rows:
+        target = target_from_params(params or {}, timezone.localdate(created_at))
+        if target is not None:
+            history.append((target, params))
+    return history
+
+
+def hot_targets(top: int, days: int) -> List[Tuple[WarmTarget, int]]:
+    """The ``top`` most searched targets of the last ``days`` days, with their search counts."""
+    return Counter(target for target, _ in _history(days)).most_common(top)
+
+
+# ---------- budget ----------
+def _budget_key(now: float) -> str:
+    return f"{_BUDGET_KEY_PREFIX}{int(now // 3600)}"
+
+
+def calls_left(per_hour: Optional[int] = None) -> int:
+    """Provider calls still allowed for warming in this clock hour, across all warmers."""
+    if per_hour is None:
+        per_hour = int(getattr(settings, 'PREWARM_CALLS_PER_HOUR', 120))
+    return max(0, per_hour - int(cache.get(_budget_key(time.time())) or 0))
+
+
+def _spend(calls: int) -> None:
+    key = _budget_key(time.time())
+    cache.add(key, 0, timeout=2 * 3600)
+    try:
+        cache.incr(key, calls)
+    except ValueError:
+        # Expired between add and incr
+        cache.set(key, calls, timeout=2 * 3600)
+
+
+# ---------- warming ----------
+def warm_target(target: WarmTarget, build_payload: PayloadBuilder, today: Optional[date] = None) -> str:
+    """Refresh one target unless its cached result is still fresh. Returns the cache state found."""
+    today = today or timezone.localdate()
+    params = target.search_params(today)
+    key = target.cache_key(today)
+    _, state = lookup_result(key)
+    if state == CACHE_HIT:
+        return state
+
+    def compute() -> Dict[str, Any]:
+        meta: Dict[str, Any] = {}
+        deals = search_deals(
+            one_way=target.one_way, origin=target.origin, destination=target.destination,
+            departure_date=params['departure_date'], return_date=params['return_date'],
+            travelers=target.travelers, cabin=target.cabin, stops=target.stops,
+            duration_range=target.duration_range_dict(), limit=target.limit, meta=meta,
+        )
+        persist_deals(deals, search_params=params, limit=target.limit)
+        return build_payload(deals, meta)
+
+    with request_lane(BACKGROUND):
+        # Shares the run with a live search or refresh of the same key already in flight
+        store_result(key, search_flight.do(key, compute))
+    return state
+
+
+def run_prewarm(
+    build_payload: PayloadBuilder, top: Optional[int] = None, days: Optional[int] = None, per_hour: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Warm the hottest targets, most popular first, until this hour's call budget is spent."""
+    top = int(getattr(settings, 'PREWARM_TOP', 50)) if top is None else top
+    days = int(getattr(settings, 'PREWARM_HISTORY_DAYS', 14)) if days is None else days
+    stats: Dict[str, Any] = {'targets': 0, 'warmed': 0, 'fresh': 0, 'failed': 0, 'over_budget': 0, 'calls': 0}
+    today = timezone.localdate()
+    for target, _ in hot_targets(top, days):
+        stats['targets'] += 1
+        cost = target.call_cost()
+        if lookup_result(target.cache_key(today))[1] == CACHE_HIT:
+            stats['fresh'] += 1
+            continue
+        if calls_left(per_hour) < cost:
+            stats['over_budget'] += 1
+            continue
+        _spend(cost)
+        stats['calls'] += cost
+        try:
+            warm_target(target, build_payload, today)
+        except (AmadeusAuthError, AmadeusApiError) as e:
+            stats['failed'] += 1
+            logger.warning("Pre-warming %s failed: %s", target.label(), e)
+            continue
+        stats['warmed'] += 1
+    return stats
+
+
+def warm_hit_rate(top: Optional[int] = None, days: Optional[int] = None) -> Dict[str, Any]:
+    """How live searches were served over the last ``days`` days, hot targets vs the rest.
+
+    Only searches logged with their cache state count. HIT and STALE are
+    both answered from the cache; MISS ran the pipeline.
+    """
+    top = int(getattr(settings, 'PREWARM_TOP', 50)) if top is None else top
+    days = int(getattr(settings, 'PREWARM_HISTORY_DAYS', 14)) if days is None else days
+    history = _history(days)
+    hot = {target for target, _ in Counter(target for target, _ in history).most_common(top)}
+    counts = {group: Counter() for group in ('hot', 'other')}
+    for target, params in history:
+        state = params.get('cache_state')
+        if state in (CACHE_HIT, CACHE_STALE, CACHE_MISS):
+            counts['hot' if target in hot else 'other'][state] += 1
+
+    def summary(counter: Counter) -> Dict[str, Any]:
+        total = sum(counter.values())
+        served = counter[CACHE_HIT] + counter[CACHE_STALE]
+        return {
+            'searches': total,
+            'hit': counter[CACHE_HIT],
+            'stale': counter[CACHE_STALE],
+            'miss': counter[CACHE_MISS],
+            'hit_rate': round(served / total, 3) if total else None,
+        }
+
+    return {'days': days, 'top': top, 'hot': summary(counts['hot']), 'other': summary(counts['other'])}
+
+
+# ---------- in-process loop ----------
+_loop_started = threading.Event()
+
+
+def _loop(build_payload: PayloadBuilder) -> None:
+    # One worker warms at a time; the others keep trying the lock so one takes over if it exits
+    lock = FileLock(Path(settings.SEARCH_SINGLEFLIGHT_LOCK_DIR) / 'prewarm.lock')
+    interval = float(getattr(settings, 'PREWARM_INTERVAL_SECONDS', 900))
+    while True:
+        if lock.locked or lock.acquire(timeout=0):
+            try:
+                stats = run_prewarm(build_payload)
+                logger.info("Pre-warm run: %s", stats)
+            except Exception:
+                logger.exception("Pre-warm run failed")
+            finally:
+                close_old_connections()
+        time.sleep(interval)
+
+
+def start_prewarm_loop(build_payload: PayloadBuilder) -> bool:
+    """Start the warming loop on a daemon thread when PREWARM_IN_PROCESS is on (once per process)."""
+    if not getattr(settings, 'PREWARM_IN_PROCESS', False) or _loop_started.is_set():
+        return False
+    _loop_started.set()
+    threading.Thread(target=_loop, args=(build_payload,), name='search-prewarm', daemon=True).start()
+    return True
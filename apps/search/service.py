@@ -1,73 +1,107 @@
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import contextvars
+import heapq
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
 
-from apps.providers.amadeus_client import AmadeusClient
-from apps.providers.normalizer import normalize_flight_offers
-from apps.scoring.service import compute_deal_score
-from apps.pricing.baseline import compute_baseline_for_deal, pct_drop_from_baseline
+from django.conf import settings
+
+from apps.providers.amadeus_client import AmadeusClient, get_amadeus_client
+from apps.providers.normalizer import normalize_flight_offer_records
+from apps.providers.records import DealRecord
+from apps.scoring.service import compute_deal_scores
+from apps.pricing.baseline import compute_baselines, pct_drop_from_baseline
+from apps.search.inspiration import get_flight_destinations
 from apps.search.utils import google_flights_deeplink
 
 
-def _filter_by_stops(deals: List[Dict[str, Any]], stops: str, one_way: bool) -> List[Dict[str, Any]]:
+def _filter_by_stops(deals: List[DealRecord], stops: str, one_way: bool) -> List[DealRecord]:
     if stops == 'any':
         return deals
-    filtered: List[Dict[str, Any]] = []
-    for d in deals:
-        total_stops = int(d.get('num_stops') or 0)
-        if stops == 'direct':
-            if total_stops == 0:
-                filtered.append(d)
-        elif stops == 'max1':
-            # Approximation: each leg up to 1 stop ⇒ round trip total ≤ 2
-            limit = 1 if one_way else 2
-            if total_stops <= limit:
-                filtered.append(d)
-    return filtered
+    if stops == 'direct':
+        return [d for d in deals if not d.num_stops]
+    if stops == 'max1':
+        # Approximation: each leg up to 1 stop ⇒ round trip total ≤ 2
+        limit = 1 if one_way else 2
+        return [d for d in deals if (d.num_stops or 0) <= limit]
+    return []
 
 
-def _filter_by_duration_range(deals: List[Dict[str, Any]], duration_range: Optional[Dict[str, int]]) -> List[Dict[str, Any]]:
+def _filter_by_duration_range(deals: List[DealRecord], duration_range: Optional[Dict[str, int]]) -> List[DealRecord]:
     if not duration_range:
         return deals
     min_days = duration_range.get('min')
     max_days = duration_range.get('max')
     if min_days is None and max_days is None:
         return deals
-    filtered: List[Dict[str, Any]] = []
+    filtered: List[DealRecord] = []
     for d in deals:
-        dep = d.get('departure_datetime')
-        ret = d.get('return_datetime')
-        if not dep or not ret:
-            # Only filter trip-length for round trips
-            filtered.append(d)
-            continue
-        try:
-            dep_dt = datetime.fromisoformat(str(dep).replace('Z', '+00:00'))
-            ret_dt = datetime.fromisoformat(str(ret).replace('Z', '+00:00'))
-            trip_days = (ret_dt.date() - dep_dt.date()).days
-        except Exception:
+        dep_dt = d.departure_dt
+        ret_dt = d.return_dt
+        if dep_dt is None or ret_dt is None:
+            # Only filter trip-length for round trips (or unparseable times)
             filtered.append(d)
             continue
+        trip_days = (ret_dt.date() - dep_dt.date()).days
         if (min_days is None or trip_days >= min_days) and (max_days is None or trip_days <= max_days):
             filtered.append(d)
     return filtered
 
 
-def search_deals(
-    *,
-    one_way: bool,
-    origin: str,
-    destination: Optional[str],
-    departure_date: str,
-    return_date: Optional[str],
-    travelers: int,
-    cabin: Optional[str],
-    stops: str,
-    duration_range: Optional[Dict[str, int]],
-    limit: int = 50,
-) -> List[Dict[str, Any]]:
-    client = AmadeusClient()
+def _fan_out_destinations(
+    client: AmadeusClient, params: Dict[str, Any], candidates: List[str]
+) -> Tuple[List[Dict[str, Any]], List[str], List[str]]:
+    """Fetch offers for each candidate destination on a bounded worker pool.
+
+    Returns (offers, dropped, failed): destinations that did not answer before
+    the deadline are dropped, destinations whose call raised are failed.
+    """
+    concurrency = max(1, int(getattr(settings, 'SEARCH_ANYWHERE_CONCURRENCY', 5)))
+    deadline = time.monotonic() + float(getattr(settings, 'SEARCH_ANYWHERE_DEADLINE_SECONDS', 12.0))
+
+    def fetch(dst: str) -> Any:
+        p = dict(params)
+        p['destinationLocationCode'] = dst
+        return client.search_flight_offers(**p)
+
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    failed: List[str] = []
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, len(candidates)) or 1)
+    try:
+        # Each worker thread runs in a copy of our context, so calls keep the caller's rate-limit lane
+        pending = {executor.submit(contextvars.copy_context().run, fetch, dst): dst for dst in candidates}
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                dst = pending.pop(fut)
+                try:
+                    res = fut.result()
+                except Exception:
+                    failed.append(dst)
+                    continue
+                if res and res.get('data'):
+                    results[dst] = res.get('data')
+        dropped = list(pending.values())
+    finally:
+        # Never block the response on stragglers past the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # Keep the inspiration ranking order regardless of completion order
+    offers: List[Dict[str, Any]] = []
+    for dst in candidates:
+        offers.extend(results.get(dst) or [])
+    return offers, dropped, failed
+
+
+def _offer_params(
+    *, one_way: bool, origin: str, destination: Optional[str], departure_date: str,
+    return_date: Optional[str], travelers: int, cabin: Optional[str], stops: str, limit: int,
+) -> Dict[str, Any]:
     params: Dict[str, Any] = {
         'originLocationCode': origin,
         'departureDate': departure_date,
@@ -82,62 +116,179 @@ def search_deals(
         params['returnDate'] = return_date
     if stops == 'direct':
         params['nonStop'] = 'true'
+    return params
 
-    # If destination is provided → search offers directly
-    if destination:
-        raw = client.search_flight_offers(**params)
-    else:
-        # Anywhere: use inspiration to get top destinations then fetch offers for each
-        insp = client.flight_destinations(origin=origin, oneWay=str(one_way).lower())
-        candidates = [d.get('destination') for d in (insp.get('data') or []) if d.get('destination')]
-        offers = []
-        for dst in candidates[:10]:
-            p = dict(params)
-            p['destinationLocationCode'] = dst
-            try:
-                res = client.search_flight_offers(**p)
-                if res and res.get('data'):
-                    offers.extend(res.get('data'))
-            except Exception:
-                continue
-        raw = { 'data': offers }
-    normalized = normalize_flight_offers(raw, num_travelers=travelers, cabin_class=cabin)
+
+def _inspiration_candidates(insp: Any) -> List[str]:
+    candidates = [d.get('destination') for d in ((insp or {}).get('data') or []) if d.get('destination')]
+    return candidates[:max(0, int(getattr(settings, 'SEARCH_ANYWHERE_CANDIDATES', 10)))]
+
+
+def _normalize_and_filter(
+    raw: Dict[str, Any], *, travelers: int, cabin: Optional[str], stops: str, one_way: bool,
+    duration_range: Optional[Dict[str, int]],
+) -> List[DealRecord]:
+    normalized = normalize_flight_offer_records(raw, num_travelers=travelers, cabin_class=cabin)
 
     # Post-filters
     normalized = _filter_by_stops(normalized, stops=stops, one_way=one_way)
-    normalized = _filter_by_duration_range(normalized, duration_range=duration_range)
+    return _filter_by_duration_range(normalized, duration_range=duration_range)
 
-    # Scoring (basic for now)
+
+def _apply_baselines(normalized: List[DealRecord]) -> None:
+    percentiles: List[Optional[float]] = []
+    for d, baseline in zip(normalized, compute_baselines(normalized, percentiles)):
+        d.price_baseline = baseline
+        d.price_pct_drop = pct_drop_from_baseline(d.price_total or 0.0, baseline)
+    # Only sketch baselines come with a percentile
+    for d, percentile in zip(normalized, percentiles):
+        d.price_percentile = percentile
+
+
+def _add_deep_links(normalized: List[DealRecord]) -> None:
+    # bookUrl fallback
     for d in normalized:
-        # Baseline & pct drop
-        baseline, _ = compute_baseline_for_deal(
-            origin=d.get('origin_iata'), destination=d.get('destination_iata'), departure_iso=d.get('departure_datetime')
-        )
-        d['price_baseline'] = baseline
-        d['price_pct_drop'] = pct_drop_from_baseline(float(d.get('price_total') or 0.0), baseline)
-        # bookUrl fallback
         try:
-            dep_date = str(d.get('departure_datetime'))[:10]
-            ret_date = str(d.get('return_datetime'))[:10] if d.get('return_datetime') else None
-            d['deep_link'] = d.get('deep_link') or google_flights_deeplink(
-                origin=str(d.get('origin_iata') or ''),
-                destination=str(d.get('destination_iata') or ''),
+            dep_date = str(d.departure_datetime)[:10]
+            ret_date = str(d.return_datetime)[:10] if d.return_datetime else None
+            d.deep_link = d.deep_link or google_flights_deeplink(
+                origin=str(d.origin_iata or ''),
+                destination=str(d.destination_iata or ''),
                 departure_date=dep_date,
                 return_date=ret_date,
             )
         except Exception:
             pass
-        score, reasons, badges = compute_deal_score(d)
-        d['score_int_0_100'] = score
-        d['score_factors_json'] = reasons
-        d['badges_json'] = badges
 
+
+def _prerank_key(d: DealRecord) -> Tuple[float, float]:
+    # The part of _rank's key known before scoring
+    return -(d.price_pct_drop or 0.0), d.price_total or 0.0
+
+
+def _shortlist(normalized: List[DealRecord], limit: int, meta: Optional[Dict[str, Any]] = None) -> List[DealRecord]:
+    """Deals worth scoring, for SEARCH_RANKING_MODE=two_stage.
+
+    The score only breaks ties in the final order (% drop, then price), so
+    a deal outside the best ``max(limit, SEARCH_RANKING_TOP_K)`` by % drop
+    and price can't reach the results; only ties with the last of them are
+    added back. Stops and duration order the pre-rank within equal keys.
+    The shortlist keeps the input order so tied results rank exactly as in
+    ``full`` mode.
+    """
+    shortlist = normalized
+    mode = getattr(settings, 'SEARCH_RANKING_MODE', 'two_stage')
+    top_k = max(limit, int(getattr(settings, 'SEARCH_RANKING_TOP_K', 50)))
+    if mode == 'two_stage' and len(normalized) > top_k:
+        best = heapq.nsmallest(
+            top_k, enumerate(normalized),
+            key=lambda item: (*_prerank_key(item[1]), item[1].num_stops or 0, item[1].duration_minutes or 0),
+        )
+        cutoff = _prerank_key(best[-1][1])
+        picked = {i for i, _ in best}
+        picked.update(i for i, d in enumerate(normalized) if i not in picked and _prerank_key(d) == cutoff)
+        shortlist = [d for i, d in enumerate(normalized) if i in picked]
+    if meta is not None:
+        meta['ranking'] = {
+            'mode': mode,
+            'candidates': len(normalized),
+            'scored': len(shortlist),
+            'skipped': len(normalized) - len(shortlist),
+        }
+    return shortlist
+
+
+def _apply_scores(normalized: List[DealRecord], scores: List[Tuple[int, List[str], List[str]]]) -> None:
+    for d, (score, reasons, badges) in zip(normalized, scores):
+        d.score_int_0_100 = score
+        d.score_factors_json = reasons
+        d.badges_json = badges
+
+
+def _rank(normalized: List[DealRecord], limit: int) -> List[DealRecord]:
     # Order by price asc, then score desc
     normalized.sort(key=lambda x: (
-        -float(x.get('price_pct_drop') or 0.0),
-        float(x.get('price_total') or 0.0),
-        -int(x.get('score_int_0_100') or 0),
+        -(x.price_pct_drop or 0.0),
+        x.price_total or 0.0,
+        -(x.score_int_0_100 or 0),
     ))
     return normalized[:limit]
 
 
+def fetch_candidate_deals(
+    *,
+    one_way: bool,
+    origin: str,
+    destination: Optional[str],
+    departure_date: str,
+    return_date: Optional[str],
+    travelers: int,
+    cabin: Optional[str],
+    stops: str,
+    duration_range: Optional[Dict[str, int]],
+    limit: int = 50,
+    meta: Optional[Dict[str, Any]] = None,
+) -> List[DealRecord]:
+    """The provider → normalize → baseline stages of search_deals.
+
+    Returns the unscored, unranked shortlist (see _shortlist) with deep
+    links filled in. Provider errors propagate.
+    """
+    client = get_amadeus_client()
+    params = _offer_params(
+        one_way=one_way, origin=origin, destination=destination, departure_date=departure_date,
+        return_date=return_date, travelers=travelers, cabin=cabin, stops=stops, limit=limit,
+    )
+
+    # If destination is provided → search offers directly
+    if destination:
+        raw = client.search_flight_offers(**params)
+    else:
+        # Anywhere: use inspiration to get top destinations then fetch offers for each
+        candidates = _inspiration_candidates(get_flight_destinations(client, origin=origin, one_way=one_way))
+        offers, dropped, failed = _fan_out_destinations(client, params, candidates) if candidates else ([], [], [])
+        if meta is not None:
+            meta['anywhere'] = {
+                'candidates': candidates,
+                'dropped': dropped,
+                'failed': failed,
+            }
+        raw = { 'data': offers }
+    normalized = _normalize_and_filter(
+        raw, travelers=travelers, cabin=cabin, stops=stops, one_way=one_way, duration_range=duration_range,
+    )
+    _apply_baselines(normalized)
+    shortlist = _shortlist(normalized, limit, meta)
+    _add_deep_links(shortlist)
+    return shortlist
+
+
+def search_deals(
+    *,
+    one_way: bool,
+    origin: str,
+    destination: Optional[str],
+    departure_date: str,
+    return_date: Optional[str],
+    travelers: int,
+    cabin: Optional[str],
+    stops: str,
+    duration_range: Optional[Dict[str, int]],
+    limit: int = 50,
+    meta: Optional[Dict[str, Any]] = None,
+) -> List[DealRecord]:
+    """Run the provider → normalize → baseline → score pipeline for one search.
+
+    When ``meta`` is given it is filled with pipeline details worth surfacing
+    to the client (e.g. "Anywhere" destinations dropped at the deadline).
+    """
+    shortlist = fetch_candidate_deals(
+        one_way=one_way, origin=origin, destination=destination, departure_date=departure_date,
+        return_date=return_date, travelers=travelers, cabin=cabin, stops=stops, duration_range=duration_range,
+        limit=limit, meta=meta,
+    )
+
+    # AI scoring in batches, within the search's AI budget (heuristic fallback in one pass)
+    scoring = meta.setdefault('scoring', {}) if meta is not None else None
+    _apply_scores(shortlist, compute_deal_scores(shortlist, stats=scoring))
+    return _rank(shortlist, limit)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from apps.common.locks import FileLock, striped_lock_path
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    Threads of one process wait on the leader's result. In ``process`` mode
+    the leader also takes a file lock per key, so leaders in other workers
+    queue behind it and can pick up its result through ``recheck`` instead of
+    running the pipeline again. ``ado`` does the same for coroutines sharing
+    an event loop.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
+        self._counters = {'leaders': 0, 'coalesced': 0, 'cross_process_reuse': 0}
+
+    def do(self, key: str, fn: Callable[[], Any], recheck: Optional[Callable[[], Any]] = None) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._counters['coalesced'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._counters['leaders'] += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_leader(key, fn, recheck)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+    def _run_leader(self, key: str, fn: Callable[[], Any], recheck: Optional[Callable[[], Any]]) -> Any:
+        if getattr(settings, 'SEARCH_SINGLEFLIGHT_MODE', 'thread') != 'process':
+            return fn()
+        lock = FileLock(striped_lock_path(settings.SEARCH_SINGLEFLIGHT_LOCK_DIR, key))
+        # On timeout we run anyway: a duplicate call beats a failed search
+        acquired = lock.acquire(timeout=float(getattr(settings, 'SEARCH_SINGLEFLIGHT_WAIT_SECONDS', 60)))
+        try:
+            if recheck is not None:
+                reused = recheck()
+                if reused is not None:
+                    with self._lock:
+                        self._counters['cross_process_reuse'] += 1
+                    return reused
+            return fn()
+        finally:
+            if acquired:
+                lock.release()
+
+    async def ado(
+        self, key: str, fn: Callable[[], Awaitable[Any]], recheck: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            fut = self._async_calls.get((loop, key))
+            if fut is not None:
+                self._counters['coalesced'] += 1
+                leader = False
+            else:
+                fut = self._async_calls[(loop, key)] = loop.create_future()
+                self._counters['leaders'] += 1
+                leader = True
+
+        if not leader:
+            # shield: a follower's cancellation must not cancel the leader's result
+            return await asyncio.shield(fut)
+
+        try:
+            result = await self._arun_leader(key, fn, recheck)
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # followers re-raise it; don't log it as unretrieved
+            raise
+        else:
+            fut.set_result(result)
+        finally:
+            with self._lock:
+                self._async_calls.pop((loop, key), None)
+        return result
+
+    async def _arun_leader(
+        self, key: str, fn: Callable[[], Awaitable[Any]], recheck: Optional[Callable[[], Awaitable[Any]]]
+    ) -> Any:
+        if getattr(settings, 'SEARCH_SINGLEFLIGHT_MODE', 'thread') != 'process':
+            return await fn()
+        lock = FileLock(striped_lock_path(settings.SEARCH_SINGLEFLIGHT_LOCK_DIR, key))
+        acquired = await asyncio.to_thread(
+            lock.acquire, float(getattr(settings, 'SEARCH_SINGLEFLIGHT_WAIT_SECONDS', 60))
+        )
+        try:
+            if recheck is not None:
+                reused = await recheck()
+                if reused is not None:
+                    with self._lock:
+                        self._counters['cross_process_reuse'] += 1
+                    return reused
+            return await fn()
+        finally:
+            if acquired:
+                lock.release()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._async_calls)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            counters['in_flight'] = len(self._calls) + len(self._async_calls)
+        return counters
+
+
+search_flight = SingleFlight()
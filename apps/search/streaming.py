@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from apps.providers.records import DealRecord
+from apps.scoring.heuristic import compute_heuristic_scores
+from apps.scoring.service import iter_ai_scores
+from apps.search.service import _apply_scores, _rank, fetch_candidate_deals
+
+# (event name, data)
+SearchEvent = Tuple[str, Dict[str, Any]]
+
+
+def stream_search(
+    *, limit: int = 50, on_complete: Optional[Callable[[List[DealRecord], Dict[str, Any]], None]] = None,
+    **search: Any,
+) -> Iterator[SearchEvent]:
+    """search_deals as a stream of events, for the streaming response modes.
+
+    The provider call runs before this returns, so provider errors raise
+    here rather than mid-stream. The iterator then yields:
+
+    - ``deal`` ``{index, deal}`` (a DealRecord) for each of the top ``limit``
+      deals, ranked and scored by the heuristic, as soon as the provider
+      has answered;
+    - ``score`` ``{index, score_int_0_100, score_factors_json, badges_json}``
+      as AI grades arrive for deals already sent;
+    - ``deal`` again for any deal the AI grades move into the results;
+    - ``summary`` ``{order, count, ai_scored, elapsed_ms, meta}``, where
+      ``order`` lists the final ranking by index.
+
+    ``on_complete(final_deals, meta)`` runs before the summary with what
+    search_deals would have returned.
+    """
+    started = time.monotonic()
+    meta: Dict[str, Any] = {}
+    shortlist = fetch_candidate_deals(limit=limit, meta=meta, **search)
+
+    def events() -> Iterator[SearchEvent]:
+        _apply_scores(shortlist, compute_heuristic_scores(shortlist))
+        # Indexes are positions in the order deals are first sent
+        sent: Dict[int, int] = {}
+        for deal in _rank(list(shortlist), limit):
+            sent[id(deal)] = len(sent)
+            yield 'deal', {'index': sent[id(deal)], 'deal': deal}
+
+        ai_scored = 0
+        for updates in iter_ai_scores(shortlist, stats=meta.setdefault('scoring', {})):
+            for position, (score, reasons, badges) in updates:
+                deal = shortlist[position]
+                deal.score_int_0_100, deal.score_factors_json, deal.badges_json = score, reasons, badges
+                ai_scored += 1
+                if id(deal) in sent:
+                    yield 'score', {
+                        'index': sent[id(deal)],
+                        'score_int_0_100': score,
+                        'score_factors_json': reasons,
+                        'badges_json': badges,
+                    }
+
+        final = _rank(shortlist, limit)
+        for deal in final:
+            if id(deal) not in sent:
+                sent[id(deal)] = len(sent)
+                yield 'deal', {'index': sent[id(deal)], 'deal': deal}
+        if on_complete is not None:
+            on_complete(final, meta)
+        yield 'summary', {
+            'order': [sent[id(d)] for d in final],
+            'count': len(final),
+            'ai_scored': ai_scored,
+            'elapsed_ms': int((time.monotonic() - started) * 1000),
+            'meta': meta,
+        }
+
+    return events()
+
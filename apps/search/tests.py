@@ -0,0 +1,43 @@
+import random
+
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from apps.providers.normalizer import normalize_flight_offer_records
+from apps.providers.sample_payloads import synthetic_flight_offers
+from apps.search.service import _rank, _shortlist
+
+
+def _priced_deals(n, seed):
+    # Few distinct drops and prices, so ties at the shortlist cutoff are common
+    rng = random.Random(seed)
+    deals = normalize_flight_offer_records(synthetic_flight_offers(n, seed=seed), 1, None)
+    for d in deals:
+        d.price_total = rng.choice([199.0, 249.0, 299.0, 349.0])
+        d.price_pct_drop = rng.choice([None, 0.0, 0.05, 0.1, 0.2])
+        d.score_int_0_100 = rng.choice([None, 35, 60, 60, 90])
+    return deals
+
+
+class ShortlistParityTests(SimpleTestCase):
+    """Ranking the two-stage shortlist must give the same results as ranking every deal."""
+
+    def test_shortlist_ranks_like_full(self):
+        for seed in range(8):
+            deals = _priced_deals(120, seed)
+            for top_k, limit in ((10, 5), (10, 10), (25, 10), (50, 50)):
+                with self.subTest(seed=seed, top_k=top_k, limit=limit):
+                    with override_settings(SEARCH_RANKING_MODE='full'):
+                        expected = _rank(_shortlist(list(deals), limit), limit)
+                    with override_settings(SEARCH_RANKING_MODE='two_stage', SEARCH_RANKING_TOP_K=top_k):
+                        shortlist = _shortlist(list(deals), limit)
+                        self.assertLess(len(shortlist), len(deals))
+                        self.assertEqual(_rank(shortlist, limit), expected)
+
+    def test_meta(self):
+        meta = {}
+        with override_settings(SEARCH_RANKING_MODE='two_stage', SEARCH_RANKING_TOP_K=10):
+            shortlist = _shortlist(_priced_deals(40, 0), 5, meta)
+        self.assertEqual(meta['ranking']['candidates'], 40)
+        self.assertEqual(meta['ranking']['scored'], len(shortlist))
+        self.assertEqual(meta['ranking']['scored'] + meta['ranking']['skipped'], 40)
@@ -14,3 +14,14 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# Build the airport autocomplete index in the background as the worker starts
+from apps.search.airports import warm_airport_index  # noqa: E402
+
+warm_airport_index()
+
+# Keep popular searches warm from this worker when PREWARM_IN_PROCESS is on
+from apps.api.serializers import deals_payload  # noqa: E402
+from apps.search.prewarm import start_prewarm_loop  # noqa: E402
+
+start_prewarm_loop(deals_payload)
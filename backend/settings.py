@@ -92,6 +92,15 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# File-based by default so every worker shares it; point CACHE_URL at Redis in production.
+
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default=f"filecache://{BASE_DIR / '.cache' / 'django'}"),
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -137,6 +146,29 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AMADEUS_BASE_URL = env('AMADEUS_BASE_URL', default='https://test.api.amadeus.com')
 AMADEUS_API_KEY = env('AMADEUS_API_KEY', default='')
 AMADEUS_API_SECRET = env('AMADEUS_API_SECRET', default='')
+# OAuth tokens are shared by all workers through a token file ('file') or kept per process ('memory')
+AMADEUS_TOKEN_STORE = env('AMADEUS_TOKEN_STORE', default='file')
+AMADEUS_TOKEN_STORE_DIR = env('AMADEUS_TOKEN_STORE_DIR', default=str(BASE_DIR / '.cache' / 'tokens'))
+AMADEUS_POOL_CONNECTIONS = env.int('AMADEUS_POOL_CONNECTIONS', default=4)
+AMADEUS_POOL_MAXSIZE = env.int('AMADEUS_POOL_MAXSIZE', default=20)
+# Concurrent requests (and pooled connections) of the asyncio client, per event loop
+AMADEUS_ASYNC_MAX_CONNECTIONS = env.int('AMADEUS_ASYNC_MAX_CONNECTIONS', default=64)
+# Client-side token bucket sized to the Amadeus quota (test: 10 TPS, production: 40 TPS),
+# shared by all workers through a state file ('file') or kept per process ('memory').
+# Background calls (cache refreshes, warming) leave the last RESERVE tokens to live searches.
+AMADEUS_RATE_LIMIT_ENABLED = env.bool('AMADEUS_RATE_LIMIT_ENABLED', default=True)
+AMADEUS_RATE_LIMIT_PER_SECOND = env.float('AMADEUS_RATE_LIMIT_PER_SECOND', default=10.0)
+AMADEUS_RATE_LIMIT_BURST = env.int('AMADEUS_RATE_LIMIT_BURST', default=10)
+AMADEUS_RATE_LIMIT_BACKGROUND_RESERVE = env.int('AMADEUS_RATE_LIMIT_BACKGROUND_RESERVE', default=3)
+AMADEUS_RATE_LIMIT_STORE = env('AMADEUS_RATE_LIMIT_STORE', default='file')
+# Longest a call queues for a slot before failing with a 429, per lane
+AMADEUS_RATE_LIMIT_MAX_WAIT_SECONDS = env.float('AMADEUS_RATE_LIMIT_MAX_WAIT_SECONDS', default=10.0)
+AMADEUS_RATE_LIMIT_BACKGROUND_MAX_WAIT_SECONDS = env.float('AMADEUS_RATE_LIMIT_BACKGROUND_MAX_WAIT_SECONDS', default=60.0)
+# Retries of 429/5xx responses: full-jitter exponential backoff, or Retry-After when given
+# (a Retry-After above the max delay is not waited out)
+AMADEUS_RETRY_ATTEMPTS = env.int('AMADEUS_RETRY_ATTEMPTS', default=3)
+AMADEUS_RETRY_BASE_DELAY_SECONDS = env.float('AMADEUS_RETRY_BASE_DELAY_SECONDS', default=0.5)
+AMADEUS_RETRY_MAX_DELAY_SECONDS = env.float('AMADEUS_RETRY_MAX_DELAY_SECONDS', default=8.0)
 
 # DRF settings
 REST_FRAMEWORK = {
@@ -149,11 +181,129 @@ REST_FRAMEWORK = {
         'anon': '30/min',
     }
 }
+# /api/metrics is staff-only; true also serves it to anonymous callers (e.g. an internal scraper)
+METRICS_PUBLIC = env.bool('METRICS_PUBLIC', default=False)
 
 # AI Scoring (OpenAI-compatible)
 AI_BASE_URL = env('AI_BASE_URL', default='https://digillm.digiboxx.com/v1')
 AI_API_KEY = env('AI_API_KEY', default='')
 AI_MODEL = env('AI_MODEL', default='llama-3')
+# Deals packed into one chat-completion call; 1 scores each deal separately
+AI_SCORING_BATCH_SIZE = env.int('AI_SCORING_BATCH_SIZE', default=10)
+# Concurrent chat-completion calls of the asyncio AI client, per event loop
+AI_ASYNC_MAX_CONNECTIONS = env.int('AI_ASYNC_MAX_CONNECTIONS', default=32)
+# Keep-alive connections of the threaded AI client's pooled session
+AI_POOL_MAXSIZE = env.int('AI_POOL_MAXSIZE', default=10)
+# Cap on one chat-completion call
+AI_REQUEST_TIMEOUT_SECONDS = env.float('AI_REQUEST_TIMEOUT_SECONDS', default=30.0)
+# AI time one search may spend; deals still unscored then get heuristic scores (0 = no budget)
+AI_SEARCH_BUDGET_SECONDS = env.float('AI_SEARCH_BUDGET_SECONDS', default=8.0)
+# Circuit breaker: over a rolling window of at least MIN_CALLS calls, open when the
+# error rate or the share of calls slower than SLOW_CALL_SECONDS reaches its threshold.
+# While open, scoring is heuristic-only; after OPEN_SECONDS, HALF_OPEN_PROBES calls test the endpoint.
+AI_BREAKER_ENABLED = env.bool('AI_BREAKER_ENABLED', default=True)
+AI_BREAKER_WINDOW_SECONDS = env.float('AI_BREAKER_WINDOW_SECONDS', default=60.0)
+AI_BREAKER_MIN_CALLS = env.int('AI_BREAKER_MIN_CALLS', default=5)
+AI_BREAKER_ERROR_RATE = env.float('AI_BREAKER_ERROR_RATE', default=0.5)
+AI_BREAKER_SLOW_CALL_SECONDS = env.float('AI_BREAKER_SLOW_CALL_SECONDS', default=8.0)
+AI_BREAKER_SLOW_RATE = env.float('AI_BREAKER_SLOW_RATE', default=0.5)
+AI_BREAKER_OPEN_SECONDS = env.float('AI_BREAKER_OPEN_SECONDS', default=30.0)
+AI_BREAKER_HALF_OPEN_PROBES = env.int('AI_BREAKER_HALF_OPEN_PROBES', default=1)
+# AI score cache (in-process LRU in front of the shared AIScoreCacheEntry table)
+AI_SCORE_CACHE_ENABLED = env.bool('AI_SCORE_CACHE_ENABLED', default=True)
+AI_SCORE_CACHE_TTL_SECONDS = env.int('AI_SCORE_CACHE_TTL_SECONDS', default=3 * 24 * 3600)
+AI_SCORE_CACHE_MEMORY_SIZE = env.int('AI_SCORE_CACHE_MEMORY_SIZE', default=5000)
+AI_SCORE_CACHE_PRICE_BUCKET = env.float('AI_SCORE_CACHE_PRICE_BUCKET', default=10.0)
+# Score heuristic fallbacks as NumPy columns (pure Python when off or numpy is missing)
+HEURISTIC_VECTORIZED = env.bool('HEURISTIC_VECTORIZED', default=True)
+
+# Rows per bulk upsert statement when persisting deals
+PERSIST_BATCH_SIZE = env.int('PERSIST_BATCH_SIZE', default=500)
+# 'write_behind' batches search writes on a background thread (spooled to disk
+# until committed); 'sync' writes them inside the request
+PERSIST_MODE = env('PERSIST_MODE', default='write_behind')
+WRITE_BEHIND_SPOOL_DIR = env('WRITE_BEHIND_SPOOL_DIR', default=str(BASE_DIR / '.cache' / 'spool'))
+WRITE_BEHIND_MAX_BATCH = env.int('WRITE_BEHIND_MAX_BATCH', default=50)
+WRITE_BEHIND_FLUSH_SECONDS = env.float('WRITE_BEHIND_FLUSH_SECONDS', default=2.0)
+WRITE_BEHIND_FSYNC = env.bool('WRITE_BEHIND_FSYNC', default=False)
+# Failures before a job is moved to the dead-letter spool (database outages don't count)
+WRITE_BEHIND_MAX_ATTEMPTS = env.int('WRITE_BEHIND_MAX_ATTEMPTS', default=5)
+# How often each worker looks for spools left by dead workers and replays them
+WRITE_BEHIND_ORPHAN_SCAN_SECONDS = env.float('WRITE_BEHIND_ORPHAN_SCAN_SECONDS', default=30.0)
+
+# Price baselines: 'batch' (one history query per route), 'per_deal',
+# 'buckets' (read the maintained FareHistoryBucket aggregates) or
+# 'sketch' (quantile of the route-month RouteFareSketch)
+BASELINE_MODE = env('BASELINE_MODE', default='batch')
+BASELINE_BUCKET_MIN_SAMPLES = env.int('BASELINE_BUCKET_MIN_SAMPLES', default=5)
+BASELINE_SKETCH_QUANTILE = env.float('BASELINE_SKETCH_QUANTILE', default=0.5)
+# Relative accuracy of the fare quantile sketches (0.01 = within 1%)
+FARE_SKETCH_ALPHA = env.float('FARE_SKETCH_ALPHA', default=0.01)
+
+# Search ("Anywhere" fan-out)
+SEARCH_ANYWHERE_CANDIDATES = env.int('SEARCH_ANYWHERE_CANDIDATES', default=10)
+SEARCH_ANYWHERE_CONCURRENCY = env.int('SEARCH_ANYWHERE_CONCURRENCY', default=5)
+SEARCH_ANYWHERE_DEADLINE_SECONDS = env.float('SEARCH_ANYWHERE_DEADLINE_SECONDS', default=12.0)
+
+# Calendar search: one provider call per (departure date, trip length) cell,
+# each cached on its own; at most MAX_CELLS per request, CONCURRENCY at a time
+CALENDAR_MAX_CELLS = env.int('CALENDAR_MAX_CELLS', default=62)
+CALENDAR_CONCURRENCY = env.int('CALENDAR_CONCURRENCY', default=4)
+CALENDAR_DEADLINE_SECONDS = env.float('CALENDAR_DEADLINE_SECONDS', default=20.0)
+CALENDAR_CACHE_SECONDS = env.int('CALENDAR_CACHE_SECONDS', default=900)
+CALENDAR_OFFERS_PER_CELL = env.int('CALENDAR_OFFERS_PER_CELL', default=50)
+
+# 'two_stage' scores only the deals that can still make the results (the best
+# max(limit, SEARCH_RANKING_TOP_K) by % drop and price, plus ties); 'full' scores all
+SEARCH_RANKING_MODE = env('SEARCH_RANKING_MODE', default='two_stage')
+SEARCH_RANKING_TOP_K = env.int('SEARCH_RANKING_TOP_K', default=50)
+
+# "Anywhere" inspiration lists cached per origin, trip type and month;
+# origins without data are cached (empty) for the shorter negative TTL
+INSPIRATION_CACHE_ENABLED = env.bool('INSPIRATION_CACHE_ENABLED', default=True)
+INSPIRATION_CACHE_TTL_SECONDS = env.int('INSPIRATION_CACHE_TTL_SECONDS', default=24 * 3600)
+INSPIRATION_NEGATIVE_TTL_SECONDS = env.int('INSPIRATION_NEGATIVE_TTL_SECONDS', default=6 * 3600)
+
+# /api/deals/top reads per-board leaderboards (global, origin, destination,
+# route) kept up to date on persist, each holding the best LEADERBOARD_SIZE deals
+LEADERBOARD_ENABLED = env.bool('LEADERBOARD_ENABLED', default=True)
+LEADERBOARD_SIZE = env.int('LEADERBOARD_SIZE', default=500)
+
+# Search result cache (stale-while-revalidate)
+SEARCH_CACHE_ENABLED = env.bool('SEARCH_CACHE_ENABLED', default=True)
+SEARCH_CACHE_FRESH_SECONDS = env.int('SEARCH_CACHE_FRESH_SECONDS', default=300)
+SEARCH_CACHE_STALE_SECONDS = env.int('SEARCH_CACHE_STALE_SECONDS', default=1800)
+
+# Identical in-flight searches share one pipeline run: 'thread' coalesces within
+# a process, 'process' also serialises workers on a per-key file lock.
+SEARCH_SINGLEFLIGHT_MODE = env('SEARCH_SINGLEFLIGHT_MODE', default='thread')
+SEARCH_SINGLEFLIGHT_LOCK_DIR = env('SEARCH_SINGLEFLIGHT_LOCK_DIR', default=str(BASE_DIR / '.cache' / 'locks'))
+SEARCH_SINGLEFLIGHT_WAIT_SECONDS = env.float('SEARCH_SINGLEFLIGHT_WAIT_SECONDS', default=60.0)
+
+# Pre-warming (`manage.py prewarm_routes`): refresh the PREWARM_TOP searches most
+# popular over PREWARM_HISTORY_DAYS, spending at most PREWARM_CALLS_PER_HOUR
+# provider calls per hour across all warmers. PREWARM_IN_PROCESS runs it in one
+# web worker every PREWARM_INTERVAL_SECONDS instead of from cron.
+PREWARM_TOP = env.int('PREWARM_TOP', default=50)
+PREWARM_HISTORY_DAYS = env.int('PREWARM_HISTORY_DAYS', default=14)
+PREWARM_CALLS_PER_HOUR = env.int('PREWARM_CALLS_PER_HOUR', default=120)
+PREWARM_INTERVAL_SECONDS = env.float('PREWARM_INTERVAL_SECONDS', default=900.0)
+PREWARM_IN_PROCESS = env.bool('PREWARM_IN_PROCESS', default=False)
+
+# Airport autocomplete: in-memory index over the Airport table (load it with
+# `manage.py load_airports`); Amadeus is only asked on a miss
+AIRPORT_INDEX_ENABLED = env.bool('AIRPORT_INDEX_ENABLED', default=True)
+AIRPORT_INDEX_CHECK_SECONDS = env.float('AIRPORT_INDEX_CHECK_SECONDS', default=60.0)
+AIRPORT_MISS_TTL_SECONDS = env.int('AIRPORT_MISS_TTL_SECONDS', default=3600)
+# Provider answers written back reach other workers' indexes at most this often
+AIRPORT_INDEX_BUMP_SECONDS = env.int('AIRPORT_INDEX_BUMP_SECONDS', default=600)
+
+# Serve /api/deals/search and /api/metadata/airports with the asyncio views
+# (run under ASGI, e.g. `uvicorn backend.asgi:application`)
+API_ASYNC_VIEWS = env.bool('API_ASYNC_VIEWS', default=False)
+# Threads per worker for streamed async searches, which run the sync pipeline
+API_ASYNC_PIPELINE_THREADS = env.int('API_ASYNC_PIPELINE_THREADS', default=32)
 
 # CORS
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_EXPOSE_HEADERS = ['X-Search-Cache']